@@ -18,7 +18,7 @@ Användning:
 Eller använd de förberedda demo-frågorna nedan.
 """
 
-from scripts.query_grants import query_grants, display_results
+from scripts.query_grants import query_grants, query_grants_batch, display_results
 
 def run_demo():
     print("\n" + "="*80)
@@ -64,15 +64,16 @@ def run_demo():
         print("KÖRT DEMO MED FÖRBEREDDA SCENARION")
         print("="*80)
         
-        for i, demo in enumerate(demo_queries, 1):
+        # Sök alla scenarier i en gemensam batch
+        all_results = query_grants_batch([demo['query'] for demo in demo_queries], k=3)
+        
+        for i, (demo, results) in enumerate(zip(demo_queries, all_results), 1):
             print(f"\n{'═'*80}")
             print(f"SCENARIO {i}: {demo['scenario']}")
             print(f"{'═'*80}")
             print(f"🎯 Situation: {demo['description']}")
             print(f"❓ Fråga: '{demo['query']}'")
             
-            results = query_grants(demo['query'], k=3, verbose=False)
-            
             if results:
                 print(f"\n✅ Top 3 matchningar:\n")
                 for j, grant in enumerate(results, 1):
@@ -15,7 +15,16 @@ Teknisk stack:
 """
 
 import os
-from scripts.query_grants import query_grants
+import atexit
+import contextvars
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from scripts import metrics
+from scripts.query_grants import query_grants, get_searcher
+from scripts.response_cache import SemanticResponseCache, RESPONSE_CACHE_SIZE
+from scripts.conversation import SYSTEM_PROMPT, compact_history, rewrite_request, answer_request
 import json
 
 # Kräver OpenAI API-nyckel
@@ -30,76 +39,179 @@ except Exception as e:
     print(f"   Sätt med: export OPENAI_API_KEY='din-api-nyckel'")
     exit(1)
 
-# GPT-systemmeddelande (definierar assistentens roll)
-SYSTEM_PROMPT = """Du är en hjälpsam assistent för svenska kommuner som söker statsbidrag.
+# Spekulativ sökning: sök på råa meddelandet och börja svara medan
+# omskrivningen pågår (GPT_SPECULATIVE=1)
+SPECULATIVE_SEARCH = os.getenv("GPT_SPECULATIVE", "0") == "1"
+# Andel gemensamma träffar som krävs för att behålla det spekulativa svaret
+SPECULATIVE_MIN_OVERLAP = 0.6
 
-Din uppgift:
-1. Hjälpa användaren formulera vad de söker
-2. Analysera sökresultat och förklara vilka som passar bäst
-3. Ställa uppföljningsfrågor för att förstå behoven bättre
-4. Ge konkreta rekommendationer
+# Semantisk svarscache: nästan likadana första frågor besvaras utan OpenAI-anrop
+_response_cache = None
+_response_cache_lock = threading.Lock()
 
-Du har tillgång till en sökmotor som hittar relevanta bidrag baserat på semantisk matchning.
+def get_response_cache():
+    """
+    Returnerar svarscachen (skapas vid första frågan, så att sökmotorn inte
+    skapas redan vid import), eller None om den är avstängd
+    """
+    global _response_cache
+    if RESPONSE_CACHE_SIZE <= 0:
+        return None
+    with _response_cache_lock:
+        if _response_cache is None:
+            _response_cache = SemanticResponseCache(
+                lambda texts: get_searcher().create_query_embeddings(texts),
+                get_searcher().encoder.cache_id,
+            )
+            atexit.register(_response_cache.save)
+        return _response_cache
 
-Kommunicera på svenska och var professionell men tillgänglig.
-"""
+def chat_completion(stage, **kwargs):
+    """
+    Ett anrop till OpenAI, med tidtagning per steg
+    """
+    with metrics.stage(stage):
+        return client.chat.completions.create(**kwargs)
+
+class AnswerStream:
+    """
+    Strömmar svaret från andra GPT-anropet i en bakgrundstråd
+
+    Bitarna buffras i en kö tills drain() läser dem, så att ett spekulativt
+    svar kan startas innan det är bekräftat och avbrytas om det inte behövs.
+    """
+    
+    def __init__(self, messages, results):
+        self._queue = queue.Queue()
+        self._cancelled = threading.Event()
+        context = contextvars.copy_context()
+        self._thread = threading.Thread(target=context.run, args=(self._run, messages, results), daemon=True)
+        self._thread.start()
+    
+    def _run(self, messages, results):
+        try:
+            with metrics.stage("openai_answer"):
+                stream = client.chat.completions.create(stream=True, **answer_request(messages, results))
+                try:
+                    for chunk in stream:
+                        if self._cancelled.is_set():
+                            break
+                        if chunk.choices and chunk.choices[0].delta.content:
+                            self._queue.put(chunk.choices[0].delta.content)
+                finally:
+                    stream.close()
+        except Exception as e:
+            self._queue.put(e)
+        self._queue.put(None)
+    
+    def cancel(self):
+        self._cancelled.set()
+    
+    def drain(self, on_token=None):
+        """
+        Läser svaret till slut; on_token anropas för varje bit. Returnerar hela texten.
+        """
+        parts = []
+        while True:
+            part = self._queue.get()
+            if part is None:
+                break
+            if isinstance(part, Exception):
+                raise part
+            parts.append(part)
+            if on_token:
+                on_token(part)
+        return "".join(parts)
+
+def results_overlap(first, second):
+    """
+    Andel gemensamma bidrag mellan två träfflistor (relativt den kortare)
+    """
+    first_ids = {grant['id'] for grant in first}
+    second_ids = {grant['id'] for grant in second}
+    if not first_ids or not second_ids:
+        return 0.0
+    return len(first_ids & second_ids) / min(len(first_ids), len(second_ids))
 
-def search_with_gpt(user_message, conversation_history=None):
+def search_with_gpt(user_message, conversation_history=None, on_token=None, speculative=None):
     """
     Använder GPT för att förstå användarens behov och ge intelligenta svar
+    
+    Args:
+        user_message: Användarens meddelande
+        conversation_history: Tidigare meddelanden (uppdateras)
+        on_token: Valfri funktion som får svaret bit för bit medan det strömmas
+        speculative: Sök och börja svara parallellt med omskrivningen
+                     (None = GPT_SPECULATIVE, se SPECULATIVE_SEARCH)
     """
+    if speculative is None:
+        speculative = SPECULATIVE_SEARCH
+    if on_token is not None and metrics.is_enabled():
+        on_token = _time_first_token(on_token)
+    with metrics.request("chat", speculative=speculative, streamed=on_token is not None):
+        return _search_with_gpt(user_message, conversation_history, on_token, speculative)
+
+def _time_first_token(on_token):
+    # Tid till första token är det användaren upplever som svarstid
+    start = time.perf_counter()
+    def timed(text):
+        if timed.first:
+            timed.first = False
+            elapsed = time.perf_counter() - start
+            metrics.observe("grants_stage_seconds", elapsed, stage="first_token")
+            metrics.annotate(first_token_ms=round(elapsed * 1000, 3))
+        on_token(text)
+    timed.first = True
+    return timed
+
+def _search_with_gpt(user_message, conversation_history, on_token, speculative):
     if conversation_history is None:
         conversation_history = []
     
+    # Svarscachen gäller bara första meddelandet; följdfrågor beror på historiken
+    response_cache = None if conversation_history else get_response_cache()
+    use_cache = response_cache is not None
+    if use_cache:
+        index_version = get_searcher().index_version
+        with metrics.stage("response_cache"):
+            cached = response_cache.get(user_message, index_version)
+        metrics.inc("grants_events_total", event="response_cache_hit" if cached else "response_cache_miss")
+        if cached:
+            print(f"\n⚡ Svar från cache (likhet {cached['similarity']:.2f} med '{cached['message']}')")
+            conversation_history += [
+                {"role": "user", "content": user_message},
+                {"role": "assistant", "content": f"[INTERN SÖKNING: '{cached['search_query']}']"},
+                {"role": "assistant", "content": cached['answer']},
+            ]
+            if on_token:
+                on_token(cached['answer'])
+            return cached['answer'], cached['results'], conversation_history
+    
     # Lägg till användarmeddelande
     conversation_history.append({
         "role": "user",
         "content": user_message
     })
     
-    # GPT analyserar frågan först
+    # GPT analyserar frågan först; historiken hålls inom en tokenbudget
     messages = [
         {"role": "system", "content": SYSTEM_PROMPT},
-    ] + conversation_history
+    ] + compact_history(conversation_history)
     
     print("\n🤖 Tänker...")
     
-    # Första GPT-anrop: Förstå vad användaren vill ha
-    response = client.chat.completions.create(
-        model="gpt-4o-mini",  # Snabb och kostnadseffektiv
-        messages=messages + [{
-            "role": "system",
-            "content": """Baserat på användarens meddelande, formulera EN KORT sökfråga på engelska 
-            som kan användas för att söka i bidragsdatabasen. Svara ENDAST med sökfrågan, inget annat.
-            
-            Exempel:
-            Användare: "Vi behöver pengar för att bygga cykelvägar"
-            Du: "infrastructure cycling transportation community development"
-            
-            Användare: "Har ni något för integration?"
-            Du: "integration immigrant settlement social services"
-            """
-        }],
-        temperature=0.3,
-        max_tokens=100
-    )
-    
-    search_query = response.choices[0].message.content.strip()
-    print(f"🔍 Söker efter: '{search_query}'")
-    
-    # Sök i databasen
-    results = query_grants(search_query, k=5, verbose=False)
-    
-    # Formatera resultat för GPT
-    results_text = "\n\n".join([
-        f"Bidrag {i+1}:\n"
-        f"Titel: {r['title']}\n"
-        f"Myndighet: {r['agency']}\n"
-        f"Deadline: {r['deadline']}\n"
-        f"Kategori: {r['category']}\n"
-        f"Beskrivning: {r['description'][:200]}..."
-        for i, r in enumerate(results)
-    ])
+    if speculative:
+        search_query, results, answer_stream = _speculative_search(user_message, messages)
+    else:
+        # Första GPT-anrop: Förstå vad användaren vill ha
+        response = chat_completion("openai_query", **rewrite_request(messages))
+        search_query = response.choices[0].message.content.strip()
+        print(f"🔍 Söker efter: '{search_query}'")
+        
+        # Sök i databasen
+        results = query_grants(search_query, k=5, verbose=False)
+        answer_stream = None
+    metrics.annotate(search_query=search_query, hits=len(results))
     
     # GPT analyserar resultaten och svarar användaren
     conversation_history.append({
@@ -107,38 +219,69 @@ def search_with_gpt(user_message, conversation_history=None):
         "content": f"[INTERN SÖKNING: '{search_query}']"
     })
     
-    final_response = client.chat.completions.create(
-        model="gpt-4o-mini",
-        messages=messages + [
-            {
-                "role": "system",
-                "content": f"""Här är sökresultaten från bidragsdatabasen:
-
-{results_text}
-
-Analysera dessa resultat och:
-1. Sammanfatta kort vilka bidrag som hittades
-2. Rekommendera de 1-3 mest relevanta
-3. Förklara VARFÖR de passar användarens behov
-4. Fråga om användaren vill veta mer eller söka annorlunda
-
-Var KONKRET och använd bidragstitlar när du refererar till dem.
-Svara på SVENSKA.
-"""
-            }
-        ],
-        temperature=0.7,
-        max_tokens=800
-    )
-    
-    assistant_message = final_response.choices[0].message.content
+    if answer_stream is None and on_token is None:
+        final_response = chat_completion("openai_answer", **answer_request(messages, results))
+        assistant_message = final_response.choices[0].message.content
+    else:
+        answer_stream = answer_stream or AnswerStream(messages, results)
+        assistant_message = answer_stream.drain(on_token)
     conversation_history.append({
         "role": "assistant",
         "content": assistant_message
     })
     
+    if use_cache:
+        response_cache.put(user_message, index_version, search_query, assistant_message, results)
+    
     return assistant_message, results, conversation_history
 
+def _speculative_search(user_message, messages):
+    """
+    Söker på användarens råa meddelande och börjar svara på de träffarna
+    medan omskrivningen pågår. Svaret används om omskrivningens träffar
+    överlappar tillräckligt, annars startas ett nytt svar.
+    
+    Returns:
+        (search_query, results, answer_stream)
+    """
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        rewrite = pool.submit(contextvars.copy_context().run,
+                              chat_completion, "openai_query", **rewrite_request(messages))
+        
+        with metrics.stage("speculative_search"):
+            speculative_results = query_grants(user_message, k=5, verbose=False)
+        speculative_stream = AnswerStream(messages, speculative_results)
+        
+        try:
+            response = rewrite.result()
+        except Exception:
+            speculative_stream.cancel()
+            raise
+    
+    search_query = response.choices[0].message.content.strip()
+    print(f"🔍 Söker efter: '{search_query}'")
+    results = query_grants(search_query, k=5, verbose=False)
+    
+    if results_overlap(speculative_results, results) >= SPECULATIVE_MIN_OVERLAP:
+        metrics.inc("grants_events_total", event="speculative_hit")
+        return search_query, speculative_results, speculative_stream
+    
+    metrics.inc("grants_events_total", event="speculative_miss")
+    speculative_stream.cancel()
+    return search_query, results, AnswerStream(messages, results)
+
+def print_stream(header):
+    """
+    Skapar en on_token-funktion som skriver ut svaret medan det strömmas
+    """
+    started = []
+    def on_token(text):
+        if not started:
+            print(header)
+            started.append(True)
+        print(text, end="", flush=True)
+    return on_token
+
 def interactive_chat():
     """
     Interaktiv chatt med GPT-assistent
@@ -166,14 +309,13 @@ def interactive_chat():
                 print("Lycka till med er ansökan!")
                 break
             
-            # Sök med GPT
+            # Sök med GPT och visa svaret medan det strömmas
             response, results, conversation_history = search_with_gpt(
                 user_input, 
-                conversation_history
+                conversation_history,
+                on_token=print_stream("\n🤖 Assistent:")
             )
-            
-            # Visa svar
-            print(f"\n🤖 Assistent:\n{response}")
+            print()
             
             # Visa länkar (diskret)
             if results:
@@ -219,9 +361,8 @@ def demo_scenarios():
         print(f"{'═'*80}")
         print(f"\n💬 Kommun: \"{scenario['message']}\"")
         
-        response, results, _ = search_with_gpt(scenario['message'])
-        
-        print(f"\n🤖 GPT-assistent:\n{response}")
+        response, results, _ = search_with_gpt(scenario['message'], on_token=print_stream("\n🤖 GPT-assistent:"))
+        print()
         
         if i < len(scenarios):
             input("\n[Tryck ENTER för nästa scenario...]")
@@ -242,6 +383,10 @@ def demo_scenarios():
 if __name__ == "__main__":
     import sys
     
+    # Exponera latens per steg (inklusive OpenAI-anropen) för Prometheus
+    if os.getenv("GRANTS_METRICS_PORT"):
+        metrics.serve(int(os.getenv("GRANTS_METRICS_PORT")))
+    
     # Kontrollera API-nyckel
     if not os.getenv("OPENAI_API_KEY"):
         print("\n" + "="*80)
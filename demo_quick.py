@@ -4,7 +4,7 @@ GRANTS.GOV DEMO - Snabbversion
 Visar alla resultat direkt utan pauser
 """
 
-from scripts.query_grants import query_grants
+from scripts.query_grants import query_grants_batch, warmup
 
 # Demo-frågor
 demo_queries = [
@@ -37,15 +37,22 @@ print("\nDetta system använder AI för att förstå din fråga och hitta")
 print("relevanta bidrag baserat på BETYDELSE, inte bara nyckelord.\n")
 print("="*80)
 
-for i, demo in enumerate(demo_queries, 1):
+# Ladda index och modell innan scenarierna körs
+try:
+    warmup()
+except FileNotFoundError:
+    exit(1)
+
+# Kör alla scenarier i en gemensam batch
+all_results = query_grants_batch([demo['query'] for demo in demo_queries], k=3)
+
+for i, (demo, results) in enumerate(zip(demo_queries, all_results), 1):
     print(f"\n{'═'*80}")
     print(f"SCENARIO {i}: {demo['scenario']}")
     print(f"{'═'*80}")
     print(f"📝 Situation: {demo['description']}")
     print(f"❓ Fråga: '{demo['query']}'")
     
-    results = query_grants(demo['query'], k=3, verbose=False)
-    
     if results:
         print(f"\n✅ Top 3 matchningar:\n")
         for j, grant in enumerate(results, 1):
@@ -0,0 +1,379 @@
+"""
+Asynkron GPT-assistent för många samtidiga användare
+Samma tvåstegsflöde som demo_openai.py (omskrivning -> sökning -> svar),
+men byggt på asyncio så att en process kan betjäna alla kommuner
+samtidigt:
+
+    - en delad AsyncOpenAI-klient (en anslutningspool för alla sessioner)
+    - en semafor som begränsar antalet samtidiga OpenAI-anrop
+    - token bucket-begränsning av anrop och tokens per minut, satt efter
+      API-kvoten, så att belastningstoppar köas i stället för att ge 429
+    - sökningen (query_grants) körs i en trådpool utanför event-loopen
+    - en historik per session; turer inom samma session körs i ordning
+
+Användning:
+    from scripts.async_assistant import AsyncAssistant
+
+    assistant = AsyncAssistant()
+    answer, results = await assistant.chat("malmo", "Finns det stöd för rent vatten?")
+
+    # Belastningstest mot den lokala OpenAI-ersättaren
+    python scripts/async_assistant.py --sessions 50 --turns 2 --stub
+"""
+
+import argparse
+import asyncio
+import contextvars
+import inspect
+import os
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Gör paketet scripts importerbart när filen körs direkt som skript
+if __package__ in (None, ""):
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts import metrics
+from scripts.conversation import SYSTEM_PROMPT, compact_history, messages_tokens, rewrite_request, answer_request
+
+# Max antal OpenAI-anrop som pågår samtidigt
+MAX_CONCURRENCY = int(os.environ.get("GPT_MAX_CONCURRENCY", "16"))
+# API-kvot: anrop och tokens per minut (0 = ingen begränsning)
+REQUESTS_PER_MINUTE = int(os.environ.get("GPT_RPM", "500"))
+TOKENS_PER_MINUTE = int(os.environ.get("GPT_TPM", "200000"))
+# Trådar för sökningen (FAISS och modellen släpper GIL)
+SEARCH_WORKERS = int(os.environ.get("GPT_SEARCH_WORKERS", "4"))
+# Max antal sessioner i minnet; den längst oanvända släpps först
+MAX_SESSIONS = 10000
+# Omförsök när API:t ändå svarar 429 (t.ex. kvot delad med andra processer)
+MAX_RETRIES = 3
+RETRY_BASE_DELAY = 1.0
+
+
+class TokenBucket:
+    """
+    Token bucket för asyncio: fylls på med rate_per_minute / 60 per sekund
+    upp till capacity. acquire() väntar tills det finns tillräckligt;
+    väntande anrop släpps in i tur och ordning.
+    """
+
+    def __init__(self, rate_per_minute, capacity=None, clock=time.monotonic):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = float(capacity or rate_per_minute)
+        self.clock = clock
+        self.tokens = self.capacity
+        self.updated = clock()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    async def acquire(self, amount=1):
+        """
+        Väntar tills amount tokens finns och drar av dem
+
+        Returns:
+            Väntetiden i sekunder
+        """
+        if self.rate <= 0:
+            return 0.0
+        # Ett enskilt anrop större än hela hinken får vänta på en full hink
+        amount = min(amount, self.capacity)
+        start = self.clock()
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+        return self.clock() - start
+
+    def refund(self, amount):
+        """
+        Lämnar tillbaka tokens som reserverades men inte användes
+        """
+        if self.rate <= 0 or amount <= 0:
+            return
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class AsyncAssistant:
+    """
+    GPT-assistent som betjänar många sessioner samtidigt i en event-loop
+
+    Skapa instansen inne i den event-loop som ska använda den.
+    """
+
+    def __init__(self, client=None, search_fn=None, max_concurrency=MAX_CONCURRENCY,
+                 requests_per_minute=REQUESTS_PER_MINUTE, tokens_per_minute=TOKENS_PER_MINUTE,
+                 search_workers=SEARCH_WORKERS, max_sessions=MAX_SESSIONS, k=5):
+        """
+        Args:
+            client: AsyncOpenAI-klient (None = skapas från OPENAI_API_KEY/OPENAI_BASE_URL)
+            search_fn: Synkron funktion (query, k) -> resultatlista (None = query_grants)
+            max_concurrency: Max antal samtidiga OpenAI-anrop
+            requests_per_minute: Anropskvot (0 = ingen begränsning)
+            tokens_per_minute: Tokenkvot (0 = ingen begränsning)
+            search_workers: Antal trådar för sökningen
+        """
+        if client is None:
+            from openai import AsyncOpenAI
+            client = AsyncOpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        if search_fn is None:
+            from scripts.query_grants import query_grants
+            search_fn = lambda query, k: query_grants(query, k=k, verbose=False)
+        self.client = client
+        self.search_fn = search_fn
+        self.k = k
+        self.max_sessions = max_sessions
+        self._semaphore = asyncio.Semaphore(max(1, int(max_concurrency)))
+        self._request_bucket = TokenBucket(requests_per_minute)
+        self._token_bucket = TokenBucket(tokens_per_minute)
+        self._search_pool = ThreadPoolExecutor(max_workers=max(1, int(search_workers)),
+                                               thread_name_prefix="assistant-search")
+        # session_id -> {"history": [...], "lock": asyncio.Lock()}
+        self._sessions = OrderedDict()
+        self.in_flight = 0
+        self.rate_limited_seconds = 0.0
+
+    async def close(self):
+        self._search_pool.shutdown(wait=False)
+        close = getattr(self.client, "close", None)
+        if close is not None:
+            await close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
+
+    def _session(self, session_id):
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = {"history": [], "lock": asyncio.Lock()}
+            while len(self._sessions) > self.max_sessions:
+                # Släpp den längst oanvända sessionen som inte har en pågående tur
+                for key, old in self._sessions.items():
+                    if key != session_id and not old["lock"].locked():
+                        del self._sessions[key]
+                        break
+                else:
+                    break
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def history(self, session_id):
+        """
+        Konversationshistoriken för en session (tom lista om den saknas)
+        """
+        session = self._sessions.get(session_id)
+        return list(session["history"]) if session else []
+
+    def end_session(self, session_id):
+        self._sessions.pop(session_id, None)
+
+    async def _run_in_pool(self, fn, *args):
+        # Kör i trådpoolen med samma contextvars (t.ex. pågående mätning)
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self._search_pool, context.run, fn, *args)
+
+    async def search(self, query, k=None):
+        """
+        Söker i bidragsdatabasen utan att blockera event-loopen
+        """
+        return await self._run_in_pool(self.search_fn, query, k or self.k)
+
+    async def _acquire_quota(self, request):
+        # Reservera hela promptens och svarets tokens; överskottet lämnas tillbaka efteråt
+        estimate = messages_tokens(request["messages"]) + request.get("max_tokens", 0)
+        waited = await self._request_bucket.acquire(1)
+        waited += await self._token_bucket.acquire(estimate)
+        if waited > 0:
+            self.rate_limited_seconds += waited
+            metrics.observe("grants_stage_seconds", waited, stage="rate_limit_wait")
+        return estimate
+
+    async def _call(self, request, call):
+        """
+        Kör call() inom samtidighetsgränsen och kvoten, med omförsök vid 429
+
+        Returns:
+            (resultat, reserverade tokens)
+        """
+        from openai import RateLimitError
+
+        for attempt in range(MAX_RETRIES + 1):
+            estimate = await self._acquire_quota(request)
+            try:
+                async with self._semaphore:
+                    self.in_flight += 1
+                    try:
+                        return await call(), estimate
+                    finally:
+                        self.in_flight -= 1
+            except RateLimitError:
+                if attempt == MAX_RETRIES:
+                    raise
+                metrics.inc("grants_events_total", event="openai_rate_limited")
+            await asyncio.sleep(RETRY_BASE_DELAY * 2 ** attempt)
+
+    async def _create(self, stage, request):
+        """
+        Ett vanligt (icke strömmat) OpenAI-anrop
+        """
+        async def call():
+            with metrics.stage(stage):
+                return await self.client.chat.completions.create(**request)
+
+        response, estimate = await self._call(request, call)
+        usage = getattr(response, "usage", None)
+        if usage is not None and usage.total_tokens:
+            self._token_bucket.refund(estimate - usage.total_tokens)
+        return response
+
+    async def _stream_answer(self, request, on_token):
+        """
+        Strömmar svaret; on_token kan vara en vanlig funktion eller en coroutine-funktion
+        """
+        async def call():
+            parts = []
+            with metrics.stage("openai_answer"):
+                # 429 kommer innan första token, så ett omförsök skickar inget dubbelt
+                stream = await self.client.chat.completions.create(stream=True, **request)
+                async for chunk in stream:
+                    if chunk.choices and chunk.choices[0].delta.content:
+                        text = chunk.choices[0].delta.content
+                        parts.append(text)
+                        result = on_token(text)
+                        if inspect.isawaitable(result):
+                            await result
+            return "".join(parts)
+
+        answer, _ = await self._call(request, call)
+        return answer
+
+    async def chat(self, session_id, user_message, on_token=None):
+        """
+        En tur i en session: omskrivning, sökning och svar
+
+        Args:
+            session_id: Sessionens id (t.ex. kommun eller användare)
+            user_message: Användarens meddelande
+            on_token: Valfri funktion (eller coroutine-funktion) som får svaret bit för bit
+
+        Returns:
+            (svar, sökresultat)
+        """
+        session = self._session(session_id)
+        # Turer i samma session körs i ordning; olika sessioner körs parallellt
+        async with session["lock"]:
+            with metrics.request("chat", session=session_id, streamed=on_token is not None):
+                return await self._chat(session["history"], user_message, on_token)
+
+    async def _chat(self, history, user_message, on_token):
+        # Historiken uppdateras först när turen är klar, så ett fel lämnar den orörd
+        turn = [{"role": "user", "content": user_message}]
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}] + compact_history(history + turn)
+
+        response = await self._create("openai_query", rewrite_request(messages))
+        search_query = response.choices[0].message.content.strip()
+
+        results = await self.search(search_query)
+        metrics.annotate(search_query=search_query, hits=len(results))
+        turn.append({"role": "assistant", "content": f"[INTERN SÖKNING: '{search_query}']"})
+
+        request = answer_request(messages, results)
+        if on_token is None:
+            response = await self._create("openai_answer", request)
+            answer = response.choices[0].message.content
+        else:
+            answer = await self._stream_answer(request, on_token)
+
+        turn.append({"role": "assistant", "content": answer})
+        history.extend(turn)
+        return answer, results
+
+
+async def load_test(assistant, n_sessions, turns, messages):
+    """
+    Kör n_sessions samtidiga sessioner med turns turer var
+
+    Returns:
+        dict med total tid, antal turer och latens per tur (p50/p95)
+    """
+    latencies = []
+
+    async def run_session(i):
+        for turn in range(turns):
+            message = messages[(i + turn) % len(messages)]
+            start = time.perf_counter()
+            await assistant.chat(f"kommun-{i}", message)
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_session(i) for i in range(n_sessions)))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "sessions": n_sessions,
+        "turns": len(latencies),
+        "total_s": elapsed,
+        "turns_per_s": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_s": latencies[len(latencies) // 2],
+        "p95_s": latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))],
+        "rate_limited_s": assistant.rate_limited_seconds,
+    }
+
+
+async def _main(args):
+    messages = [
+        "Vi ser ökande behov av insatser för ungas psykiska hälsa. Vad finns?",
+        "Vi planerar att göra vårt centrum mer cykelvänligt och hållbart.",
+        "Finns det stöd för rent vatten i små kommuner?",
+        "Har ni något för integration av nyanlända?",
+    ]
+    async with AsyncAssistant(max_concurrency=args.concurrency, requests_per_minute=args.rpm,
+                              tokens_per_minute=args.tpm) as assistant:
+        report = await load_test(assistant, args.sessions, args.turns, messages)
+    print("\n" + "=" * 60)
+    print(f"ASYNKRON ASSISTENT: {report['sessions']} sessioner, {report['turns']} turer")
+    print("=" * 60)
+    print(f"  Total tid:        {report['total_s']:.2f} s ({report['turns_per_s']:.1f} turer/s)")
+    print(f"  Latens per tur:   p50 {report['p50_s']:.2f} s   p95 {report['p95_s']:.2f} s")
+    print(f"  Väntan på kvot:   {report['rate_limited_s']:.2f} s totalt")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Belastningstest av den asynkrona GPT-assistenten")
+    parser.add_argument("--sessions", type=int, default=20, help="Antal samtidiga sessioner")
+    parser.add_argument("--turns", type=int, default=2, help="Turer per session")
+    parser.add_argument("--concurrency", type=int, default=MAX_CONCURRENCY, help="Max samtidiga OpenAI-anrop")
+    parser.add_argument("--rpm", type=int, default=REQUESTS_PER_MINUTE, help="Anrop per minut (0 = obegränsat)")
+    parser.add_argument("--tpm", type=int, default=TOKENS_PER_MINUTE, help="Tokens per minut (0 = obegränsat)")
+    parser.add_argument("--stub", action="store_true",
+                        help="Kör mot den lokala OpenAI-ersättaren (scripts/openai_stub.py)")
+    parser.add_argument("--latency", type=float, default=0.8, help="Ersättarens fördröjning per anrop")
+    args = parser.parse_args()
+
+    if args.stub:
+        from scripts.openai_stub import start_stub_server
+        server, base_url, _ = start_stub_server(latency=args.latency)
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+    elif not os.getenv("OPENAI_API_KEY"):
+        print("❌ OPENAI_API_KEY saknas. Sätt den eller kör med --stub.")
+        exit(1)
+
+    from scripts.query_grants import warmup
+    try:
+        warmup()
+    except FileNotFoundError:
+        exit(1)
+    asyncio.run(_main(args))
@@ -0,0 +1,304 @@
+"""
+Benchmark för indexering och sökning
+Syntetiserar bidragskorpusar (1k-1M poster, se scripts/synthetic_corpus.py)
+och mäter per korpusstorlek:
+
+    - create_embeddings: genomströmning (texter/s) på ett urval
+    - store och BM25-index: skrivtid
+    - per indextyp: byggtid, minne, laddtid/RSS, recall@k mot exakt index,
+      ren söktid i FAISS och query_grants-latens (p50/p95/p99) från fråga
+      till färdiga bidrag
+
+Resultatet skrivs som JSON (med commit, versioner och maskin) så att
+körningar från olika commits kan jämföras med --compare.
+
+Användning:
+    python scripts/benchmark.py --sizes 1000,10000,100000
+    python scripts/benchmark.py --sizes 1000000 --index-types ivf,hnsw,ivfpq
+    python scripts/benchmark.py --compare data/benchmark_baseline.json
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import numpy as np
+
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+
+# Gör paketet scripts importerbart när filen körs direkt som skript
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.encoder import get_encoder
+from scripts.fetch_and_index_grants import create_embeddings, create_searchable_text, create_lexical_text, model_name
+from scripts.grant_store import write_store
+from scripts.index_factory import (INDEX_TYPES, build_index, index_memory_bytes, latency_summary,
+                                   measure_index_load, measure_latency, recall_at_k)
+from scripts.lexical_index import build_lexical_index
+from scripts.query_grants import GrantSearcher
+from scripts.synthetic_corpus import generate_grants, generate_queries
+
+DEFAULT_SIZES = (1000, 10000)
+DEFAULT_OUTPUT = "data/benchmark_results.json"
+# Antal texter som körs genom modellen; större korpusar får syntetiska vektorer
+EMBED_SAMPLE = 2000
+N_QUERIES = 100
+K = 10
+# Kvot mot baslinjen som räknas som en regression i --compare
+REGRESSION_THRESHOLD = 1.2
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def environment_info():
+    """
+    Commit, versioner och maskin, så att resultat kan jämföras rättvist
+    """
+    import faiss
+
+    return {
+        "commit": _git_commit(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "faiss": getattr(faiss, "__version__", None),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "model": model_name,
+    }
+
+
+def synthesize_vectors(sample_vectors, n, seed=42, noise=0.05):
+    """
+    Skalar upp ett urval riktiga embeddings till n vektorer genom att
+    dra urvalsvektorer och lägga på brus (behåller fördelningens struktur)
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.integers(0, len(sample_vectors), size=n)
+    scale = noise * sample_vectors.std(axis=0, keepdims=True)
+    vectors = sample_vectors[rows] + rng.standard_normal((n, sample_vectors.shape[1]), dtype=np.float32) * scale
+    return np.ascontiguousarray(vectors, dtype=np.float32)
+
+
+def benchmark_size(n, index_types, work_dir, embed_sample=EMBED_SAMPLE, n_queries=N_QUERIES, k=K, seed=42,
+                   lexical=True):
+    """
+    Kör hela benchmarken för en korpusstorlek
+
+    Returns:
+        dict med mätvärden för storleken
+    """
+    import faiss
+
+    result = {"n_records": n}
+
+    print(f"\n📦 {n} bidrag")
+    start = time.perf_counter()
+    grants = list(generate_grants(n, seed=seed))
+    result["generate_seconds"] = time.perf_counter() - start
+
+    # Embeddings: genomströmning mäts på ett urval
+    texts = [create_searchable_text(grant) for grant in grants]
+    sample = texts[:min(n, embed_sample)]
+    encoder = get_encoder(model_name).warmup()
+    start = time.perf_counter()
+    sample_vectors = create_embeddings(sample)
+    embed_seconds = time.perf_counter() - start
+    result["embedding"] = {
+        "texts": len(sample),
+        "seconds": embed_seconds,
+        "texts_per_second": len(sample) / embed_seconds if embed_seconds else None,
+        "synthetic_vectors": len(sample) < n,
+    }
+    embeddings = sample_vectors if len(sample) == n else synthesize_vectors(sample_vectors, n, seed=seed)
+    del texts
+    print(f"  Embeddings: {result['embedding']['texts_per_second']:.1f} texter/s")
+
+    # Store och BM25-index
+    store_path = os.path.join(work_dir, "store")
+    start = time.perf_counter()
+    write_store(grants, store_path)
+    result["store_seconds"] = time.perf_counter() - start
+
+    lexical_path = None
+    if lexical:
+        lexical_path = os.path.join(work_dir, "lexical")
+        start = time.perf_counter()
+        build_lexical_index([create_lexical_text(grant) for grant in grants], lexical_path)
+        result["lexical_build_seconds"] = time.perf_counter() - start
+    del grants
+
+    # Frågor: texter för query_grants, vektorer för ren FAISS-sökning och recall
+    queries = generate_queries(n_queries, seed=seed)
+    query_vectors = np.ascontiguousarray(encoder.encode(queries), dtype=np.float32)
+    k = min(k, n)
+    exact = build_index(embeddings, "flat")
+    _, exact_ids = exact.search(query_vectors, k)
+    del exact
+
+    result["indexes"] = []
+    for index_type in index_types:
+        start = time.perf_counter()
+        index = build_index(embeddings, index_type)
+        build_seconds = time.perf_counter() - start
+
+        _, ids = index.search(query_vectors, k)
+        index_path = os.path.join(work_dir, f"{index_type}.faiss")
+        faiss.write_index(index, index_path)
+        row = {
+            "index_type": index_type,
+            "build_seconds": build_seconds,
+            "memory_bytes": index_memory_bytes(index),
+            f"recall@{k}": recall_at_k(ids, exact_ids, k),
+            "search": measure_latency(index, query_vectors, k),
+        }
+        row.update(measure_index_load(index_path))
+        del index
+
+        # Hela sökvägen: frågetext -> embedding -> FAISS -> bidrag (utan frågecache)
+        searcher = GrantSearcher(index_path=index_path, store_path=store_path, lexical_path=lexical_path,
+                                 encoder=encoder, query_cache_size=0, search_mode="vector",
+                                 index_root=None).warmup()
+        for mode in ("vector", "hybrid") if lexical else ("vector",):
+            timings = []
+            for query in queries:
+                start = time.perf_counter()
+                searcher.search(query, k=k, mode=mode)
+                timings.append((time.perf_counter() - start) * 1000)
+            row[f"query_grants_{mode}"] = latency_summary(timings)
+        searcher.grants_data.close()
+        result["indexes"].append(row)
+
+        print(f"  {index_type:6s} bygg={build_seconds:.2f} s  minne={row['memory_bytes'] / 1e6:.1f} MB  "
+              f"recall@{k}={row[f'recall@{k}']:.3f}  "
+              f"query_grants p50={row['query_grants_vector']['p50_ms']:.2f} ms "
+              f"p99={row['query_grants_vector']['p99_ms']:.2f} ms")
+
+    if lexical:
+        searcher = GrantSearcher(index_path=os.path.join(work_dir, f"{index_types[0]}.faiss"),
+                                 store_path=store_path, lexical_path=lexical_path,
+                                 encoder=encoder, query_cache_size=0, index_root=None)
+        timings = []
+        for query in queries:
+            start = time.perf_counter()
+            searcher.search(query, k=k, mode="lexical")
+            timings.append((time.perf_counter() - start) * 1000)
+        result["query_grants_lexical"] = latency_summary(timings)
+        searcher.grants_data.close()
+
+    return result
+
+
+def run_benchmark(sizes=DEFAULT_SIZES, index_types=INDEX_TYPES, **kwargs):
+    """
+    Kör benchmarken för alla storlekar
+
+    Returns:
+        dict med miljö ("environment") och resultat per storlek ("results")
+    """
+    report = {"environment": environment_info(), "results": []}
+    for n in sizes:
+        with tempfile.TemporaryDirectory() as work_dir:
+            report["results"].append(benchmark_size(n, list(index_types), work_dir, **kwargs))
+    return report
+
+
+def compare_reports(current, baseline, threshold=REGRESSION_THRESHOLD):
+    """
+    Jämför två benchmarkresultat (samma storlek och indextyp)
+
+    Returns:
+        Lista med (storlek, indextyp, mått, baslinje, nu, kvot, regression)
+    """
+    metrics = (("build_seconds",), ("search", "p50_ms"), ("query_grants_vector", "p50_ms"),
+               ("query_grants_vector", "p95_ms"), ("memory_bytes",))
+    baseline_rows = {(result["n_records"], row["index_type"]): row
+                     for result in baseline["results"] for row in result["indexes"]}
+    rows = []
+    for result in current["results"]:
+        for row in result["indexes"]:
+            old = baseline_rows.get((result["n_records"], row["index_type"]))
+            if old is None:
+                continue
+            for path in metrics:
+                new_value, old_value = row, old
+                for key in path:
+                    new_value, old_value = new_value.get(key, {}), old_value.get(key, {})
+                if not isinstance(new_value, (int, float)) or not isinstance(old_value, (int, float)) or not old_value:
+                    continue
+                ratio = new_value / old_value
+                rows.append((result["n_records"], row["index_type"], ".".join(path),
+                             old_value, new_value, ratio, ratio > threshold))
+    return rows
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark för indexering och sökning")
+    parser.add_argument("--sizes", default=",".join(str(n) for n in DEFAULT_SIZES),
+                        help="Korpusstorlekar, kommaseparerade (t.ex. 1000,10000,100000,1000000)")
+    parser.add_argument("--index-types", default=",".join(INDEX_TYPES),
+                        help="Indextyper att mäta, kommaseparerade")
+    parser.add_argument("--embed-sample", type=int, default=EMBED_SAMPLE,
+                        help="Antal texter som körs genom modellen (resten får syntetiska vektorer)")
+    parser.add_argument("--queries", type=int, default=N_QUERIES, help="Antal sökfrågor per mätning")
+    parser.add_argument("--k", type=int, default=K, help="Antal träffar per fråga")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-lexical", action="store_true", help="Hoppa över BM25-indexet")
+    parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON-fil för resultatet")
+    parser.add_argument("--compare", default=None, help="Tidigare resultat att jämföra mot")
+    return parser.parse_args(argv)
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    index_types = [t.strip() for t in args.index_types.split(",") if t.strip()]
+    unknown = set(index_types) - set(INDEX_TYPES)
+    if unknown:
+        print(f"❌ Okända indextyper: {', '.join(sorted(unknown))}")
+        exit(1)
+
+    print("=" * 60)
+    print("GRANTS.GOV DEMO - BENCHMARK")
+    print("=" * 60)
+
+    report = run_benchmark(
+        sizes=[int(n) for n in args.sizes.split(",") if n.strip()],
+        index_types=index_types,
+        embed_sample=args.embed_sample,
+        n_queries=args.queries,
+        k=args.k,
+        seed=args.seed,
+        lexical=not args.no_lexical,
+    )
+
+    os.makedirs(os.path.dirname(args.output) or ".", exist_ok=True)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✅ Resultat sparat i {args.output}")
+
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nJämförelse mot {args.compare} (commit {baseline['environment'].get('commit')}):")
+        regressions = 0
+        for n, index_type, metric, old, new, ratio, regression in compare_reports(report, baseline):
+            regressions += regression
+            marker = "⚠️ " if regression else "  "
+            print(f"{marker}{n:>8} {index_type:6s} {metric:26s} {old:12.3f} -> {new:12.3f} ({ratio:.2f}x)")
+        if regressions:
+            print(f"\n⚠️  {regressions} mått är mer än {REGRESSION_THRESHOLD:.1f}x sämre än baslinjen")
+            exit(1)
+        print("\n✅ Inga regressioner")
@@ -0,0 +1,269 @@
+"""
+Tokenbudget för konversationshistoriken i GPT-assistenten
+Utan gräns skickas hela historiken (alla frågor, sökmarkörer och svar)
+i båda API-anropen, så promptstorlek, latens och kostnad växer under en
+lång session. Här hålls det som skickas inom en budget:
+
+    - de senaste turerna skickas ordagrant
+    - äldre turer sammanfattas extraktivt (fråga, sökning och första
+      meningen i svaret) i ett systemmeddelande; de äldsta
+      sammanfattningarna släpps först om budgeten inte räcker
+    - sökresultaten till analysanropet kortas adaptivt (kortare
+      beskrivningar, sedan färre bidrag)
+
+Sammanfattningen görs utan extra API-anrop så att varje tur kostar lika
+mycket oavsett hur lång sessionen är.
+"""
+
+import os
+import re
+
+HISTORY_TOKEN_BUDGET = int(os.environ.get("GPT_HISTORY_TOKENS", "1500"))
+RESULTS_TOKEN_BUDGET = int(os.environ.get("GPT_RESULTS_TOKENS", "1000"))
+# Antal senaste turer (fråga + svar) som alltid skickas ordagrant
+KEEP_RECENT_TURNS = 2
+
+# Beskrivningslängder att prova för sökresultaten, längst först
+DESCRIPTION_LENGTHS = (200, 120, 60, 0)
+
+# GPT-systemmeddelande (definierar assistentens roll)
+SYSTEM_PROMPT = """Du är en hjälpsam assistent för svenska kommuner som söker statsbidrag.
+
+Din uppgift:
+1. Hjälpa användaren formulera vad de söker
+2. Analysera sökresultat och förklara vilka som passar bäst
+3. Ställa uppföljningsfrågor för att förstå behoven bättre
+4. Ge konkreta rekommendationer
+
+Du har tillgång till en sökmotor som hittar relevanta bidrag baserat på semantisk matchning.
+
+Kommunicera på svenska och var professionell men tillgänglig.
+"""
+
+SEARCH_MARKER = re.compile(r"^\[INTERN SÖKNING: '(.*)'\]$", re.DOTALL)
+
+_encoding = None
+
+
+def count_tokens(text):
+    """
+    Antal tokens i en text (tiktoken om det finns, annars ~4 tecken per token)
+    """
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except (ImportError, ValueError):
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def message_tokens(message):
+    # Varje meddelande har några tokens overhead för roll och avgränsare
+    return count_tokens(message.get("content") or "") + 4
+
+
+def messages_tokens(messages):
+    return sum(message_tokens(message) for message in messages)
+
+
+def split_turns(history):
+    """
+    Delar historiken i turer; en tur börjar med ett användarmeddelande
+    """
+    turns = []
+    for message in history:
+        if message.get("role") == "user" or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def summarize_turn(turn, max_chars=160):
+    """
+    Extraktiv sammanfattning av en tur på en rad
+    """
+    question, searches, answer = "", [], ""
+    for message in turn:
+        content = (message.get("content") or "").strip()
+        marker = SEARCH_MARKER.match(content)
+        if message.get("role") == "user":
+            question = content
+        elif marker:
+            searches.append(marker.group(1))
+        elif message.get("role") == "assistant":
+            answer = content
+
+    parts = []
+    if question:
+        parts.append(f"Användaren: {_shorten(question, max_chars)}")
+    if searches:
+        parts.append(f"sökning: {', '.join(searches)}")
+    if answer:
+        # Första meningen i svaret bär oftast rekommendationen
+        first_sentence = re.split(r"(?<=[.!?])\s", answer, maxsplit=1)[0]
+        parts.append(f"svar: {_shorten(first_sentence, max_chars)}")
+    return "; ".join(parts)
+
+
+def _shorten(text, max_chars):
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars - 3].rstrip() + "..."
+
+
+def compact_history(history, budget=HISTORY_TOKEN_BUDGET, keep_recent=KEEP_RECENT_TURNS):
+    """
+    Väljer vad av historiken som skickas till GPT inom en tokenbudget
+
+    Args:
+        history: Hela konversationshistoriken (ändras inte)
+        budget: Max antal tokens för historiken
+        keep_recent: Antal senaste turer som skickas ordagrant
+
+    Returns:
+        Lista med meddelanden att skicka efter systemprompten
+    """
+    if messages_tokens(history) <= budget:
+        return list(history)
+
+    turns = split_turns(history)
+    recent = [message for turn in turns[-keep_recent:] for message in turn]
+    older = turns[:-keep_recent] if len(turns) > keep_recent else []
+
+    # Sökmarkörer i de ordagranna turerna behövs inte när svaren finns med
+    recent = [message for message in recent[:-1]
+              if not SEARCH_MARKER.match((message.get("content") or "").strip())] + recent[-1:]
+
+    # De senaste turerna har företräde; korta svaren bland dem om budgeten inte räcker
+    while messages_tokens(recent) > budget and _truncate_longest_answer(recent):
+        pass
+
+    # Sammanfatta äldre turer, nyast först, så länge budgeten räcker
+    remaining = budget - messages_tokens(recent)
+    summary_lines = []
+    for turn in reversed(older):
+        line = f"- {summarize_turn(turn)}"
+        cost = count_tokens(line) + 1
+        if summary_lines:
+            if cost > remaining:
+                break
+        elif cost + count_tokens("Sammanfattning av tidigare samtal:") + 4 > remaining:
+            break
+        summary_lines.insert(0, line)
+        remaining -= cost
+
+    if not summary_lines:
+        return recent
+    summary = {
+        "role": "system",
+        "content": "Sammanfattning av tidigare samtal:\n" + "\n".join(summary_lines),
+    }
+    return [summary] + recent
+
+
+def _truncate_longest_answer(messages, min_chars=200):
+    """
+    Halverar det längsta assistentsvaret (utom det sista meddelandet)
+
+    Returns:
+        False om inget mer kan kortas
+    """
+    candidates = [i for i, message in enumerate(messages[:-1])
+                  if message.get("role") == "assistant" and len(message.get("content") or "") > min_chars]
+    if not candidates:
+        return False
+    i = max(candidates, key=lambda i: len(messages[i]["content"]))
+    content = messages[i]["content"]
+    messages[i] = dict(messages[i], content=content[:len(content) // 2].rstrip() + " [...]")
+    return True
+
+
+def format_result(index, grant, description_length):
+    text = (f"Bidrag {index + 1}:\n"
+            f"Titel: {grant['title']}\n"
+            f"Myndighet: {grant['agency']}\n"
+            f"Deadline: {grant['deadline']}\n"
+            f"Kategori: {grant['category']}")
+    if description_length:
+        description = grant['description']
+        if len(description) > description_length:
+            description = description[:description_length] + "..."
+        text += f"\nBeskrivning: {description}"
+    return text
+
+
+def format_results(results, budget=RESULTS_TOKEN_BUDGET):
+    """
+    Formaterar sökresultaten för GPT inom en tokenbudget
+
+    Beskrivningarna kortas först; räcker det inte tas de lägst rankade
+    bidragen bort (minst ett bidrag skickas alltid).
+    """
+    results = list(results)
+    while True:
+        for description_length in DESCRIPTION_LENGTHS:
+            text = "\n\n".join(format_result(i, grant, description_length) for i, grant in enumerate(results))
+            if count_tokens(text) <= budget:
+                return text
+        if len(results) <= 1:
+            return text
+        results = results[:-1]
+
+
+def rewrite_request(messages):
+    """
+    Argument till första GPT-anropet: formulera en sökfråga på engelska
+    """
+    return dict(
+        model="gpt-4o-mini",  # Snabb och kostnadseffektiv
+        messages=messages + [{
+            "role": "system",
+            "content": """Baserat på användarens meddelande, formulera EN KORT sökfråga på engelska 
+            som kan användas för att söka i bidragsdatabasen. Svara ENDAST med sökfrågan, inget annat.
+            
+            Exempel:
+            Användare: "Vi behöver pengar för att bygga cykelvägar"
+            Du: "infrastructure cycling transportation community development"
+            
+            Användare: "Har ni något för integration?"
+            Du: "integration immigrant settlement social services"
+            """
+        }],
+        temperature=0.3,
+        max_tokens=100
+    )
+
+
+def answer_request(messages, results):
+    """
+    Argument till andra GPT-anropet: analysera sökresultaten och svara användaren
+    """
+    # Formatera resultat för GPT (kortas adaptivt till tokenbudgeten)
+    results_text = format_results(results)
+    
+    return dict(
+        model="gpt-4o-mini",
+        messages=messages + [
+            {
+                "role": "system",
+                "content": f"""Här är sökresultaten från bidragsdatabasen:
+
+{results_text}
+
+Analysera dessa resultat och:
+1. Sammanfatta kort vilka bidrag som hittades
+2. Rekommendera de 1-3 mest relevanta
+3. Förklara VARFÖR de passar användarens behov
+4. Fråga om användaren vill veta mer eller söka annorlunda
+
+Var KONKRET och använd bidragstitlar när du refererar till dem.
+Svara på SVENSKA.
+"""
+            }
+        ],
+        temperature=0.7,
+        max_tokens=800
+    )
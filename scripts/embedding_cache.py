@@ -0,0 +1,262 @@
+"""
+Cachar för embeddings
+
+EmbeddingCache är innehållsadresserad: nyckeln är en hash av modellnamnet
+och den sökbara texten, så att bara nya eller ändrade bidrag behöver köras
+genom modellen vid omindexering.
+
+QueryEmbeddingCache är en LRU-cache för sökfrågor framför query-encodern.
+"""
+
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+DEFAULT_CACHE_PATH = "data/embedding_cache.npz"
+
+
+def content_key(text, model_name):
+    """
+    Skapar en stabil nyckel för en text och en modell
+    """
+    return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """
+    Persistent cache från innehållsnyckel till embedding-vektor
+
+    Lagras som en .npz-fil med en nyckelarray och en vektormatris.
+
+    Med max_entries hålls högst så många vektorer i minnet: när cachen är
+    full läses bara de första max_entries posterna från disk och nya
+    vektorer cachas inte (de räknas i skipped). None = obegränsad.
+    """
+
+    def __init__(self, model_name, path=DEFAULT_CACHE_PATH, max_entries=None):
+        self.model_name = model_name
+        self.path = path
+        self.max_entries = max_entries
+        self._vectors = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                if str(data["model_name"]) != self.model_name:
+                    return
+                keys = data["keys"]
+                vectors = data["vectors"]
+        except (OSError, KeyError, ValueError):
+            print(f"  ⚠️ Kunde inte läsa embedding-cache ({self.path}), börjar om")
+            return
+        if self.max_entries is not None and len(keys) > self.max_entries:
+            print(f"  ⚠️ Embedding-cachen har {len(keys)} poster, läser de första {self.max_entries}")
+            # Kopian släpper resten av matrisen
+            keys, vectors = keys[:self.max_entries], vectors[:self.max_entries].copy()
+            self._dirty = True
+        self._vectors = {str(key): vectors[i] for i, key in enumerate(keys)}
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def key(self, text):
+        return content_key(text, self.model_name)
+
+    def get(self, key):
+        vector = self._vectors.get(key)
+        if vector is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return vector
+
+    def put(self, key, vector):
+        if self.max_entries is not None and key not in self._vectors and len(self._vectors) >= self.max_entries:
+            self.skipped += 1
+            return
+        self._vectors[key] = np.asarray(vector, dtype=np.float32)
+        self._dirty = True
+
+    def prune(self, keep_keys):
+        """
+        Tar bort poster som inte längre används, så att cachen inte växer obegränsat
+        """
+        keep_keys = set(keep_keys)
+        stale = [key for key in self._vectors if key not in keep_keys]
+        for key in stale:
+            del self._vectors[key]
+        if stale:
+            self._dirty = True
+        return len(stale)
+
+    def save(self):
+        """
+        Skriver cachen atomiskt till disk
+        """
+        if not self._dirty or not self.path:
+            return
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        keys = list(self._vectors)
+        if keys:
+            vectors = np.vstack([self._vectors[key] for key in keys]).astype(np.float32)
+        else:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, model_name=np.array(self.model_name), keys=np.array(keys, dtype=str), vectors=vectors)
+        os.replace(tmp_path, self.path)
+        self._dirty = False
+
+
+def embed_with_cache(text_list, embed_fn, cache, prune=True, save=True):
+    """
+    Skapar embeddings för texterna men kör bara nya/ändrade texter genom embed_fn
+
+    Args:
+        text_list: Lista med sökbara texter
+        embed_fn: Funktion som tar en lista texter och returnerar en matris
+        cache: EmbeddingCache
+        prune: Om True, ta bort cacheposter som inte finns i text_list
+        save: Om False sparas cachen inte till disk (anroparen gör cache.save()
+              efter sista batchen)
+
+    Returns:
+        Matris med en embedding per text, i samma ordning som text_list
+    """
+    keys = [cache.key(text) for text in text_list]
+    vectors = [cache.get(key) for key in keys]
+
+    # Unika texter som saknas i cachen
+    missing = {}
+    for i, vector in enumerate(vectors):
+        if vector is None and keys[i] not in missing:
+            missing[keys[i]] = text_list[i]
+
+    reused = sum(vector is not None for vector in vectors)
+    print(f"  Embedding-cache: {reused} återanvända, {len(missing)} nya/ändrade")
+
+    if missing:
+        new_vectors = embed_fn(list(missing.values()))
+        fresh = {}
+        for key, vector in zip(missing, new_vectors):
+            cache.put(key, vector)
+            fresh[key] = vector
+        vectors = [fresh[key] if vector is None else vector for key, vector in zip(keys, vectors)]
+
+    if prune:
+        cache.prune(keys)
+    if save:
+        cache.save()
+
+    if not vectors:
+        return np.zeros((0, 0), dtype=np.float32)
+    return np.vstack(vectors).astype(np.float32)
+
+
+DEFAULT_QUERY_CACHE_PATH = "data/query_cache.npz"
+QUERY_CACHE_SIZE = 10000
+
+
+def normalize_query(query):
+    """
+    Normaliserar en sökfråga till cachenyckel (gemener, enkla mellanslag)
+    """
+    return " ".join(str(query).split()).casefold()
+
+
+class QueryEmbeddingCache:
+    """
+    Begränsad LRU-cache från normaliserad frågetext till embedding
+
+    En träff hoppar över både tokenisering och forward pass. Cachen är
+    trådsäker och kan sparas till disk mellan omstarter.
+    """
+
+    def __init__(self, model_name, path=DEFAULT_QUERY_CACHE_PATH, max_size=QUERY_CACHE_SIZE):
+        self.model_name = model_name
+        self.path = path
+        self.max_size = max(1, int(max_size))
+        self._vectors = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                if str(data["model_name"]) != self.model_name:
+                    return
+                keys = data["keys"]
+                vectors = data["vectors"]
+        except (OSError, KeyError, ValueError):
+            print(f"  ⚠️ Kunde inte läsa fråge-cache ({self.path}), börjar om")
+            return
+        # Filen är sparad från äldst till nyast
+        for i, key in enumerate(keys[-self.max_size:], start=max(0, len(keys) - self.max_size)):
+            self._vectors[str(key)] = vectors[i]
+
+    def __len__(self):
+        return len(self._vectors)
+
+    def get(self, query):
+        key = normalize_query(query)
+        with self._lock:
+            vector = self._vectors.get(key)
+            if vector is None:
+                self.misses += 1
+                return None
+            self._vectors.move_to_end(key)
+            self.hits += 1
+            return vector
+
+    def put(self, query, vector):
+        key = normalize_query(query)
+        with self._lock:
+            self._vectors[key] = np.asarray(vector, dtype=np.float32)
+            self._vectors.move_to_end(key)
+            while len(self._vectors) > self.max_size:
+                self._vectors.popitem(last=False)
+            self._dirty = True
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._vectors),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def save(self):
+        """
+        Skriver cachen atomiskt till disk (i LRU-ordning)
+        """
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            keys = list(self._vectors)
+            vectors = [self._vectors[key] for key in keys]
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        matrix = np.vstack(vectors).astype(np.float32) if vectors else np.zeros((0, 0), dtype=np.float32)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, model_name=np.array(self.model_name), keys=np.array(keys, dtype=str), vectors=matrix)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,340 @@
+"""
+Textencoder för bidrag och sökfrågor
+Modellen laddas först när den behövs, så att det är billigt att importera
+hjälpfunktioner utan att betala för tokenizer och modell.
+
+Backends (väljs med ENCODER_BACKEND eller get_encoder(backend=...)):
+    torch      - PyTorch AutoModel i full precision (standard)
+    onnx       - Modellen exporterad till ONNX och körd i ONNX Runtime
+    onnx-int8  - Som onnx, men med dynamisk int8-kvantisering av vikterna
+
+Paritet mot torch kontrolleras med:
+    python scripts/encoder.py --check-parity --backend onnx-int8
+"""
+
+import argparse
+import inspect
+import os
+import sys
+import threading
+
+import numpy as np
+
+os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
+
+# Gör paketet scripts importerbart när filen körs direkt som skript
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts import metrics
+
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+MAX_LENGTH = 512
+# Ingår i cache-nycklar så att gamla vektorer inte återanvänds om poolningen ändras
+POOLING = "masked-mean"
+
+BACKENDS = ("torch", "onnx", "onnx-int8")
+DEFAULT_BACKEND = os.environ.get("ENCODER_BACKEND", "torch")
+ONNX_DIR = "data/onnx"
+# Lägsta godtagbara cosinuslikhet mot torch i paritetskontrollen
+PARITY_THRESHOLD = 0.99
+
+
+def mean_pooling(last_hidden_state, attention_mask):
+    """
+    Medelvärde över tokens som inte är padding
+
+    Utan masken beror en texts vektor på hur lång den längsta texten i
+    samma batch är, så batchade och enskilda frågor skulle ge olika svar.
+    """
+    mask = attention_mask.unsqueeze(-1).to(last_hidden_state.dtype)
+    summed = (last_hidden_state * mask).sum(dim=1)
+    counts = mask.sum(dim=1).clamp(min=1e-9)
+    return summed / counts
+
+
+def mean_pooling_numpy(last_hidden_state, attention_mask):
+    """
+    Samma poolning som mean_pooling, för numpy-utdata från ONNX Runtime
+    """
+    mask = attention_mask[..., None].astype(last_hidden_state.dtype)
+    summed = (last_hidden_state * mask).sum(axis=1)
+    counts = np.clip(mask.sum(axis=1), 1e-9, None)
+    return summed / counts
+
+
+class TorchEncoder:
+    """
+    Lat, trådsäker wrapper runt tokenizer och PyTorch-modell
+    """
+
+    def __init__(self, model_name=MODEL_NAME, max_length=MAX_LENGTH):
+        self.model_name = model_name
+        self.max_length = max_length
+        self._tokenizer = None
+        self._model = None
+        self._lock = threading.Lock()
+
+    backend = "torch"
+
+    @property
+    def cache_id(self):
+        """
+        Identifierar vektorerna encodern ger (modell + poolning)
+        """
+        return f"{self.model_name}|{POOLING}"
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def _load(self):
+        if self._model is not None:
+            return
+        with self._lock:
+            if self._model is not None:
+                return
+            from transformers import AutoTokenizer, AutoModel
+
+            print("Laddar AI-modell...")
+            tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            model = AutoModel.from_pretrained(self.model_name)
+            model.eval()
+            self._tokenizer = tokenizer
+            self._model = model
+            print("  ✅ Modell laddad!")
+
+    @property
+    def tokenizer(self):
+        self._load()
+        return self._tokenizer
+
+    @property
+    def model(self):
+        self._load()
+        return self._model
+
+    def warmup(self):
+        """
+        Laddar modellen direkt i stället för vid första anropet
+        """
+        self._load()
+        return self
+
+    def token_lengths(self, texts):
+        """
+        Antal tokens per text efter trunkering (utan padding)
+        """
+        encoded = self.tokenizer(list(texts), truncation=True, max_length=self.max_length)
+        return [len(ids) for ids in encoded["input_ids"]]
+
+    def encode(self, texts):
+        """
+        Skapar embeddings för en lista av texter i en enda forward pass
+        """
+        import torch
+
+        with metrics.stage("tokenize"):
+            inputs = self.tokenizer(list(texts), padding=True, truncation=True,
+                                    max_length=self.max_length, return_tensors="pt")
+        with metrics.stage("forward"), torch.no_grad():
+            model_output = self.model(**inputs)
+            embeddings = mean_pooling(model_output.last_hidden_state, inputs["attention_mask"])
+        return embeddings.numpy().astype(np.float32)
+
+
+def export_onnx(model_name, path, quantize=False):
+    """
+    Exporterar modellen till ONNX (och kvantiserar vikterna till int8 om quantize=True)
+    """
+    import torch
+    from transformers import AutoTokenizer, AutoModel
+
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    fp32_path = path.replace(".int8.onnx", ".onnx") if quantize else path
+
+    if not os.path.exists(fp32_path):
+        print(f"Exporterar {model_name} till ONNX...")
+        tokenizer = AutoTokenizer.from_pretrained(model_name)
+        model = AutoModel.from_pretrained(model_name)
+        model.eval()
+        inputs = tokenizer(["exempeltext för export"], return_tensors="pt")
+        input_names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in inputs]
+        dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+        dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+
+        class _Wrapper(torch.nn.Module):
+            # Namngivna argument, oberoende av ordningen i modellens forward()
+            def __init__(self, inner):
+                super().__init__()
+                self.inner = inner
+
+            def forward(self, *args):
+                return self.inner(**dict(zip(input_names, args))).last_hidden_state
+
+        export_kwargs = {}
+        # Nyare torch använder dynamo-exporten som standard; den klassiska räcker här
+        if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+            export_kwargs["dynamo"] = False
+        with torch.no_grad():
+            torch.onnx.export(
+                _Wrapper(model),
+                tuple(inputs[name] for name in input_names),
+                fp32_path,
+                input_names=input_names,
+                output_names=["last_hidden_state"],
+                dynamic_axes=dynamic_axes,
+                opset_version=14,
+                **export_kwargs,
+            )
+        print(f"  ✅ ONNX-modell sparad: {fp32_path}")
+
+    if quantize and not os.path.exists(path):
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        print("Kvantiserar ONNX-modellen till int8...")
+        quantize_dynamic(fp32_path, path, weight_type=QuantType.QInt8)
+        print(f"  ✅ Kvantiserad modell sparad: {path}")
+
+    return path
+
+
+class OnnxEncoder(TorchEncoder):
+    """
+    Encoder som kör modellen i ONNX Runtime, valfritt int8-kvantiserad
+
+    Modellen exporteras en gång till ONNX_DIR och återanvänds sedan.
+    """
+
+    def __init__(self, model_name=MODEL_NAME, max_length=MAX_LENGTH, quantize=False,
+                 onnx_dir=ONNX_DIR, num_threads=None):
+        super().__init__(model_name, max_length)
+        self.quantize = quantize
+        self.num_threads = num_threads
+        filename = "model.int8.onnx" if quantize else "model.onnx"
+        self.onnx_path = os.path.join(onnx_dir, model_name.replace("/", "__"), filename)
+        self._input_names = ()
+
+    @property
+    def backend(self):
+        return "onnx-int8" if self.quantize else "onnx"
+
+    @property
+    def cache_id(self):
+        # Kvantiserade vektorer skiljer sig något och får egna cacheposter
+        if self.quantize:
+            return f"{self.model_name}|{POOLING}|int8"
+        return super().cache_id
+
+    def _load(self):
+        if self._model is not None:
+            return
+        with self._lock:
+            if self._model is not None:
+                return
+            import onnxruntime as ort
+            from transformers import AutoTokenizer
+
+            print(f"Laddar AI-modell ({self.backend})...")
+            if not os.path.exists(self.onnx_path):
+                export_onnx(self.model_name, self.onnx_path, quantize=self.quantize)
+            tokenizer = AutoTokenizer.from_pretrained(self.model_name)
+            options = ort.SessionOptions()
+            options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+            if self.num_threads:
+                options.intra_op_num_threads = self.num_threads
+            session = ort.InferenceSession(self.onnx_path, options, providers=["CPUExecutionProvider"])
+            self._input_names = tuple(node.name for node in session.get_inputs())
+            self._tokenizer = tokenizer
+            self._model = session
+            print("  ✅ Modell laddad!")
+
+    def encode(self, texts):
+        """
+        Skapar embeddings för en lista av texter i en enda körning
+        """
+        with metrics.stage("tokenize"):
+            inputs = self.tokenizer(list(texts), padding=True, truncation=True,
+                                    max_length=self.max_length, return_tensors="np")
+            feed = {name: inputs[name].astype(np.int64) for name in self._input_names}
+        with metrics.stage("forward"):
+            last_hidden_state = self.model.run(["last_hidden_state"], feed)[0]
+            embeddings = mean_pooling_numpy(last_hidden_state, inputs["attention_mask"])
+        return embeddings.astype(np.float32)
+
+
+def create_encoder(model_name=MODEL_NAME, backend=None):
+    """
+    Skapar en ny encoder för vald backend
+    """
+    backend = backend or DEFAULT_BACKEND
+    if backend == "torch":
+        return TorchEncoder(model_name)
+    if backend == "onnx":
+        return OnnxEncoder(model_name)
+    if backend == "onnx-int8":
+        return OnnxEncoder(model_name, quantize=True)
+    raise ValueError(f"Okänd encoder-backend '{backend}', välj bland {', '.join(BACKENDS)}")
+
+
+_encoders = {}
+_encoders_lock = threading.Lock()
+
+
+def get_encoder(model_name=MODEL_NAME, backend=None):
+    """
+    Returnerar en delad encoder per modellnamn och backend (laddas först vid användning)
+    """
+    key = (model_name, backend or DEFAULT_BACKEND)
+    with _encoders_lock:
+        encoder = _encoders.get(key)
+        if encoder is None:
+            encoder = create_encoder(*key)
+            _encoders[key] = encoder
+        return encoder
+
+
+def check_parity(texts, backend="onnx-int8", model_name=MODEL_NAME, threshold=PARITY_THRESHOLD):
+    """
+    Jämför en backend mot torch med cosinuslikhet per text
+
+    Returns:
+        (lägsta likhet, medellikhet, godkänd)
+    """
+    reference = get_encoder(model_name, "torch").encode(texts)
+    candidate = get_encoder(model_name, backend).encode(texts)
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    candidate = candidate / np.linalg.norm(candidate, axis=1, keepdims=True)
+    similarity = (reference * candidate).sum(axis=1)
+    return float(similarity.min()), float(similarity.mean()), bool(similarity.min() >= threshold)
+
+
+PARITY_TEXTS = [
+    "funding for education programs helping disadvantaged youth",
+    "environmental protection climate change sustainability",
+    "community health wellness programs mental health",
+    "Vi ser ökande behov av insatser för ungas psykiska hälsa",
+    "Clean Water Infrastructure Grant. Support for water quality improvement projects including "
+    "wastewater treatment, stormwater management, drinking water systems, and water conservation.",
+    "EPA-2024-007",
+]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Encoder-verktyg")
+    parser.add_argument("--check-parity", action="store_true", help="Jämför backend mot torch")
+    parser.add_argument("--backend", choices=BACKENDS, default="onnx-int8")
+    parser.add_argument("--threshold", type=float, default=PARITY_THRESHOLD)
+    args = parser.parse_args()
+
+    if not args.check_parity:
+        parser.print_help()
+        sys.exit(0)
+
+    min_sim, mean_sim, ok = check_parity(PARITY_TEXTS, args.backend, threshold=args.threshold)
+    print(f"\nParitet {args.backend} mot torch: min cos={min_sim:.4f}, medel cos={mean_sim:.4f}")
+    if ok:
+        print(f"  ✅ Godkänd (tröskel {args.threshold})")
+    else:
+        print(f"  ❌ Under tröskeln {args.threshold}")
+        sys.exit(1)
@@ -1,101 +1,247 @@
 import requests
-from transformers import AutoTokenizer, AutoModel
-import torch
-import faiss
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import os
 import json
-from datetime import datetime
+import sys
+import argparse
+import multiprocessing
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+
+# Gör paketet scripts importerbart när filen körs direkt som skript
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.embedding_cache import DEFAULT_CACHE_PATH
+from scripts.encoder import MODEL_NAME, get_encoder
+from scripts.http_cache import CHANGED
+from scripts.index_versions import DEFAULT_INDEX_ROOT, INDEX_FILE, STORE_DIR, LEXICAL_DIR, MANIFEST_FILE
+from scripts.index_factory import (INDEX_TYPES, STORAGE_TYPES, compare_index_types, write_report,
+                                   DEFAULT_NPROBE, DEFAULT_HNSW_M, DEFAULT_EF_CONSTRUCTION,
+                                   DEFAULT_EF_SEARCH, DEFAULT_PQ_M, DEFAULT_PQ_NBITS)
 
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
 # Steg 1: Hämta bidragsdata från Grants.gov
-def fetch_grants_data():
+SEARCH2_URL = os.environ.get("GRANTS_API_URL", "https://api.grants.gov/v1/api/search2")
+GRANT_CATEGORIES = ["education", "health", "environment", "community", "technology"]
+PAGE_SIZE = 100        # Antal träffar per anrop mot search2
+MAX_WORKERS = 8        # Max antal samtidiga anrop
+REQUEST_TIMEOUT = 30   # Sekunder per anrop
+MAX_RETRIES = 3        # Omförsök vid timeout och 5xx
+
+
+def create_session(pool_size=MAX_WORKERS, retries=MAX_RETRIES, backoff_factor=0.5):
     """
-    Hämtar bidrag från Grants.gov API
-    Returnerar en lista med bidragsinformation
+    Skapar en delad HTTP-session med keep-alive och omförsök med backoff
     """
-    print("Hämtar bidrag från Grants.gov...")
-    print("OBS: Detta kan ta 1-2 minuter...\n")
-    
-    # Grants.gov API endpoint (nytt API v1)
-    base_url = "https://api.grants.gov/v1/api/search2"
-    
-    all_grants = []
-    
-    # Hämta olika kategorier för att få en bra mix
-    categories = ["education", "health", "environment", "community", "technology"]
-    
-    for i, category in enumerate(categories, 1):
+    retry = Retry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=(500, 502, 503, 504),
+        allowed_methods=frozenset(["GET", "POST"]),
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Content-Type": "application/json"})
+    return session
+
+
+def normalize_grant(grant, category):
+    """
+    Skapar en strukturerad representation av ett bidrag från search2
+    """
+    return {
+        'id': grant.get('id', 'N/A'),
+        'number': grant.get('number', 'N/A'),
+        'title': grant.get('title', 'Ingen titel'),
+        'description': grant.get('synopsis', grant.get('description', 'Ingen beskrivning')),
+        'agency': grant.get('agencyName', 'N/A'),
+        'amount_min': grant.get('awardFloor', 'N/A'),
+        'amount_max': grant.get('awardCeiling', 'N/A'),
+        'deadline': grant.get('closeDate', 'N/A'),
+        'posted_date': grant.get('openDate', 'N/A'),
+        'category': category,
+        'url': f"https://www.grants.gov/search-results-detail/{grant.get('id', '')}"
+    }
+
+
+def fetch_page(session, category, start_record, rows=PAGE_SIZE, base_url=SEARCH2_URL, sort_by=None, cache=None):
+    """
+    Hämtar en sida ur search2 för en kategori
+
+    Args:
+        sort_by: Valfri sortering, t.ex. "openDate|desc"
+        cache: Valfri HTTPCache (scripts/http_cache.py) för svaren
+
+    Returns:
+        (lista med träffar, totalt antal träffar för kategorin, status) där
+        status kommer från cachen (FRESH, NOT_MODIFIED, UNCHANGED eller
+        CHANGED); utan cache alltid CHANGED
+    """
+    payload = {
+        "keyword": category,
+        "oppStatuses": "posted",
+        "rows": rows,
+        "startRecordNum": start_record
+    }
+    if sort_by:
+        payload["sortBy"] = sort_by
+    if cache is not None:
+        status_code, result, status = cache.post_json(session, base_url, payload, timeout=REQUEST_TIMEOUT)
+    else:
+        status = CHANGED
+        response = session.post(base_url, json=payload, timeout=REQUEST_TIMEOUT)
+        status_code = response.status_code
         try:
-            print(f"[{i}/{len(categories)}] Hämtar kategori: {category}...")
-            
-            # Använd POST med JSON body enligt nya API:et
-            payload = {
-                "keyword": category,
-                "oppStatuses": "posted",
-                "rows": 30  # Färre resultat per kategori för snabbare demo
-            }
-            
-            headers = {
-                "Content-Type": "application/json"
+            result = response.json()
+        except ValueError:
+            result = {}
+
+    if status_code != 200:
+        error_msg = result.get('msg', 'Okänt fel') if isinstance(result, dict) else 'Okänt fel'
+        raise RuntimeError(f"Status {status_code}: {error_msg}")
+
+    # Nya API:et har strukturen {"data": {"hitCount": N, "oppHits": [...]}}
+    data = result.get('data') or {}
+    if 'oppHits' not in data:
+        raise RuntimeError(f"Ingen 'oppHits' i svaret: {result.get('msg', 'Inget felmeddelande')}")
+
+    hits = data['oppHits'] or []
+    return hits, int(data.get('hitCount', len(hits)) or 0), status
+
+
+def iter_grants_gov(categories=None, base_url=SEARCH2_URL, page_size=PAGE_SIZE,
+                    max_workers=MAX_WORKERS, max_per_category=None, session=None, cache=None):
+    """
+    Hämtar bidrag från Grants.gov som en ström, i kategori- och sidordning
+
+    Första sidan för alla kategorier hämtas parallellt (den ger antalet
+    träffar); därefter hämtas varje kategoris sidor med högst max_workers
+    anrop i taget. Bara sidorna som är på väg ligger i minnet.
+
+    Yields:
+        Normaliserade bidrag (samma bidrag kan komma under flera kategorier,
+        se dedupe_grants)
+    """
+    categories = list(categories or GRANT_CATEGORIES)
+    own_session = session is None
+    if own_session:
+        session = create_session(pool_size=max_workers)
+
+    def record_limit(hit_count):
+        if max_per_category is None:
+            return hit_count
+        return min(hit_count, max_per_category)
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            first_pages = {
+                category: executor.submit(fetch_page, session, category, 0, page_size, base_url, cache=cache)
+                for category in categories
             }
-            
-            response = requests.post(base_url, json=payload, headers=headers, timeout=30)
-            
-            if response.status_code == 200:
-                result = response.json()
-                
-                # Nya API:et har strukturen {"data": {"oppHits": [...]}}
-                if 'data' in result and 'oppHits' in result['data']:
-                    grants = result['data']['oppHits']
-                    print(f"  ✅ Hittade {len(grants)} bidrag")
-                    
-                    for grant in grants:
-                        # Skapa en strukturerad representation av bidraget
-                        grant_info = {
-                            'id': grant.get('id', 'N/A'),
-                            'number': grant.get('number', 'N/A'),
-                            'title': grant.get('title', 'Ingen titel'),
-                            'description': grant.get('synopsis', grant.get('description', 'Ingen beskrivning')),
-                            'agency': grant.get('agencyName', 'N/A'),
-                            'amount_min': grant.get('awardFloor', 'N/A'),
-                            'amount_max': grant.get('awardCeiling', 'N/A'),
-                            'deadline': grant.get('closeDate', 'N/A'),
-                            'posted_date': grant.get('openDate', 'N/A'),
-                            'category': category,
-                            'url': f"https://www.grants.gov/search-results-detail/{grant.get('id', '')}"
-                        }
-                        
-                        # Undvik dubbletter
-                        if not any(g['id'] == grant_info['id'] for g in all_grants):
-                            all_grants.append(grant_info)
-                else:
-                    print(f"  ⚠️ Ingen 'oppHits' i svaret för {category}")
-                    print(f"     Svar: {result.get('msg', 'Inget felmeddelande')}")
-            else:
-                print(f"  ❌ Fel vid hämtning av {category}: Status {response.status_code}")
+            for category in categories:
                 try:
-                    error_msg = response.json().get('msg', 'Okänt fel')
-                    print(f"     Felmeddelande: {error_msg}")
-                except:
-                    pass
-        
-        except requests.exceptions.Timeout:
-            print(f"  ⚠️ Timeout för kategorin '{category}' - fortsätter...")
-            continue
-        except Exception as e:
-            print(f"  ⚠️ Fel för kategorin '{category}': {str(e)}")
-            continue
-    
+                    hits, hit_count, _ = first_pages.pop(category).result()
+                except requests.exceptions.Timeout:
+                    print(f"  ⚠️ Timeout för kategorin '{category}' - fortsätter...")
+                    continue
+                except Exception as e:
+                    print(f"  ⚠️ Fel för kategorin '{category}': {str(e)}")
+                    continue
+
+                total = record_limit(hit_count)
+                print(f"  ✅ {category}: {total} bidrag att hämta")
+                for grant in hits[:total]:
+                    yield normalize_grant(grant, category)
+
+                # Resterande sidor: högst max_workers anrop i förväg, levererade i ordning
+                starts = iter(range(page_size, total, page_size))
+                pending = deque()
+                for start in starts:
+                    pending.append((start, executor.submit(fetch_page, session, category, start,
+                                                           min(page_size, total - start), base_url, cache=cache)))
+                    if len(pending) >= max_workers:
+                        break
+                while pending:
+                    start, future = pending.popleft()
+                    next_start = next(starts, None)
+                    if next_start is not None:
+                        pending.append((next_start, executor.submit(
+                            fetch_page, session, category, next_start,
+                            min(page_size, total - next_start), base_url, cache=cache)))
+                    try:
+                        hits, _, _ = future.result()
+                    except Exception as e:
+                        print(f"  ⚠️ Fel för '{category}' (post {start}): {str(e)}")
+                        continue
+                    for grant in hits[:max(0, total - start)]:
+                        yield normalize_grant(grant, category)
+    finally:
+        if own_session:
+            session.close()
+
+
+def dedupe_grants(grants, seen_ids=None):
+    """
+    Släpper igenom varje bidrags-id en gång (första förekomsten gäller)
+
+    Args:
+        grants: Bidrag (kan vara en generator)
+        seen_ids: Valfri mängd med id:n som redan setts; fylls på
+    """
+    seen_ids = set() if seen_ids is None else seen_ids
+    for grant in grants:
+        if grant['id'] not in seen_ids:
+            seen_ids.add(grant['id'])
+            yield grant
+
+
+def fetch_grants_data(categories=None, base_url=SEARCH2_URL, page_size=PAGE_SIZE,
+                      max_workers=MAX_WORKERS, max_per_category=None, session=None, cache=None,
+                      fallback_demo=True):
+    """
+    Hämtar bidrag från Grants.gov API
+    Bläddrar igenom hela resultatmängden för varje kategori och kör
+    kategorier och sidor parallellt över en gemensam keep-alive-session.
+    Returnerar en lista med bidragsinformation (se iter_grants_gov för
+    samma hämtning som en ström)
+
+    Args:
+        categories: Kategorier (sökord) att hämta, standard GRANT_CATEGORIES
+        base_url: search2-endpoint, kan pekas mot en lokal stub-server
+        page_size: Antal träffar per anrop
+        max_workers: Max antal samtidiga anrop
+        max_per_category: Valfri övre gräns för antal träffar per kategori
+        session: Befintlig requests.Session (skapas annars)
+        cache: Valfri HTTPCache för svaren (se scripts/http_cache.py)
+        fallback_demo: Returnera demo-data om inget kunde hämtas
+    """
+    categories = list(categories or GRANT_CATEGORIES)
+    print("Hämtar bidrag från Grants.gov...")
+    print(f"  {len(categories)} kategorier, {page_size} träffar per sida, {max_workers} parallella anrop\n")
+
+    all_grants = list(dedupe_grants(iter_grants_gov(categories, base_url, page_size, max_workers,
+                                                    max_per_category, session, cache)))
+
     print(f"\n✅ Totalt antal unika bidrag hämtade: {len(all_grants)}")
-    
+
     # Om API:et inte fungerade, skapa demo-data
-    if len(all_grants) == 0:
+    if len(all_grants) == 0 and fallback_demo:
         print("\n⚠️ Kunde inte hämta data från Grants.gov API")
         print("Skapar demo-data istället...\n")
         all_grants = create_demo_data()
-    
+
     return all_grants
 
 def create_demo_data():
@@ -213,35 +359,128 @@ def create_demo_data():
     return demo_grants
 
 # Steg 2: Skapa embedding för bidragsdata
-model_name = "sentence-transformers/all-MiniLM-L6-v2"
-print("Laddar AI-modell för textanalys...")
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModel.from_pretrained(model_name)
-print("Modell laddad!")
+# Modellen laddas först när create_embeddings anropas
+model_name = MODEL_NAME
+
+TOKEN_BUDGET = 8192  # Max antal tokens (inklusive padding) per batch
+
+def make_token_batches(lengths, max_tokens=TOKEN_BUDGET, max_batch_size=64):
+    """
+    Delar upp texter i batchar efter tokenlängd
+    
+    Texterna sorteras efter längd så att korta texter inte paddas upp till en
+    lång, och varje batch fylls tills längsta text * antal texter når max_tokens.
+    
+    Returns:
+        Lista med batchar, varje batch en lista med index i originalordning
+    """
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    batches = []
+    batch = []
+    for i in order:
+        # Längsta texten i batchen kommer först eftersom ordningen är fallande
+        longest = lengths[batch[0]] if batch else lengths[i]
+        if batch and (len(batch) >= max_batch_size or longest * (len(batch) + 1) > max_tokens):
+            batches.append(batch)
+            batch = []
+        batch.append(i)
+    if batch:
+        batches.append(batch)
+    return batches
 
-def create_embeddings(text_list, batch_size=32):
+def create_embeddings(text_list, batch_size=64, max_tokens=TOKEN_BUDGET):
     """
     Skapar embeddings för en lista av texter
-    Använder batchar för bättre minneshantering
+    Texterna grupperas efter tokenlängd och batchar dimensioneras efter en
+    tokenbudget i stället för ett fast antal, för mindre padding.
+    Resultatet returneras i samma ordning som text_list.
     """
-    all_embeddings = []
-    total_batches = (len(text_list) + batch_size - 1) // batch_size
+    encoder = get_encoder(model_name)
+    if not text_list:
+        return np.zeros((0, 0), dtype=np.float32)
+    
+    lengths = encoder.token_lengths(text_list)
+    batches = make_token_batches(lengths, max_tokens=max_tokens, max_batch_size=batch_size)
+    total_batches = len(batches)
     
     print(f"Skapar embeddings för {len(text_list)} bidrag i {total_batches} batchar...")
     
-    for i in range(0, len(text_list), batch_size):
-        batch_texts = text_list[i:i+batch_size]
-        inputs = tokenizer(batch_texts, padding=True, truncation=True, 
-                          max_length=512, return_tensors="pt")
-        with torch.no_grad():
-            model_output = model(**inputs)
-        batch_embeddings = model_output.last_hidden_state.mean(dim=1).numpy()
-        all_embeddings.append(batch_embeddings)
+    all_embeddings = None
+    for batch_number, batch in enumerate(batches, 1):
+        batch_texts = [text_list[i] for i in batch]
+        batch_embeddings = encoder.encode(batch_texts)
+        if all_embeddings is None:
+            all_embeddings = np.zeros((len(text_list), batch_embeddings.shape[1]), dtype=np.float32)
+        # Återställ originalordningen
+        all_embeddings[batch] = batch_embeddings
         
-        if (i // batch_size + 1) % 5 == 0:
-            print(f"  Bearbetat batch {i // batch_size + 1}/{total_batches}")
+        if batch_number % 5 == 0:
+            print(f"  Bearbetat batch {batch_number}/{total_batches}")
+    
+    return all_embeddings
+
+def _init_embedding_worker(threads_per_worker):
+    """
+    Begränsar antalet trådar per process så att arbetarna inte konkurrerar om kärnorna
+    """
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads_per_worker)
+    import torch
+    torch.set_num_threads(threads_per_worker)
+    torch.set_num_interop_threads(1)
+
+def _embed_shard(shard_path, texts, batch_size, max_tokens):
+    """
+    Körs i en arbetsprocess: skapar embeddings för en shard och sparar dem till disk
+    """
+    np.save(shard_path, create_embeddings(texts, batch_size=batch_size, max_tokens=max_tokens))
+    return shard_path
+
+def create_embeddings_parallel(text_list, num_workers=None, shards_per_worker=4,
+                               batch_size=64, max_tokens=TOKEN_BUDGET, shard_dir=None):
+    """
+    Skapar embeddings parallellt i flera processer
+    
+    Texterna delas i ordnade shards som fördelas över en processpool. Varje
+    arbetare laddar en egen modell med ett begränsat antal torch-trådar och
+    skriver sin shard till disk. Shardarna slås ihop i originalordning.
+    
+    Args:
+        text_list: Lista med sökbara texter
+        num_workers: Antal processer (standard: antal kärnor)
+        shards_per_worker: Fler shards än processer jämnar ut lasten
+        shard_dir: Katalog för shard-filer (standard: temporär katalog)
+    """
+    num_workers = max(1, num_workers or os.cpu_count() or 1)
+    if num_workers == 1 or len(text_list) < 2 * num_workers:
+        return create_embeddings(text_list, batch_size=batch_size, max_tokens=max_tokens)
+    
+    threads_per_worker = max(1, (os.cpu_count() or num_workers) // num_workers)
+    num_shards = min(len(text_list), num_workers * shards_per_worker)
+    bounds = np.linspace(0, len(text_list), num_shards + 1, dtype=int)
+    
+    print(f"Skapar embeddings för {len(text_list)} bidrag i {num_shards} shards "
+          f"på {num_workers} processer ({threads_per_worker} trådar per process)...")
     
-    return np.vstack(all_embeddings)
+    with tempfile.TemporaryDirectory(dir=shard_dir) as tmp_dir:
+        shard_paths = [os.path.join(tmp_dir, f"shard_{i:05d}.npy") for i in range(num_shards)]
+        # spawn ger rena processer utan ärvda torch-trådpooler
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=num_workers, mp_context=context,
+                                 initializer=_init_embedding_worker,
+                                 initargs=(threads_per_worker,)) as executor:
+            futures = [
+                executor.submit(_embed_shard, shard_paths[i], text_list[bounds[i]:bounds[i + 1]],
+                                batch_size, max_tokens)
+                for i in range(num_shards)
+            ]
+            for done, future in enumerate(futures, 1):
+                future.result()
+                if done % max(1, num_shards // 10) == 0:
+                    print(f"  Klar shard {done}/{num_shards}")
+        
+        # Slå ihop i ordning
+        return np.vstack([np.load(path) for path in shard_paths]).astype(np.float32)
 
 def create_searchable_text(grant):
     """
@@ -255,60 +494,112 @@ def create_searchable_text(grant):
     ]
     return " ".join([str(p) for p in parts if p and p != 'N/A'])
 
+def create_lexical_text(grant):
+    """
+    Sökbar text för BM25-indexet: samma fält som embeddingen plus
+    programnummer och id, så att exakta identifierare kan hittas
+    """
+    parts = [create_searchable_text(grant), grant.get('number'), grant.get('id')]
+    return " ".join([str(p) for p in parts if p and p != 'N/A'])
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Hämtar och indexerar bidrag")
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat",
+                        help="Typ av FAISS-index (standard: flat, exakt sökning)")
+    parser.add_argument("--storage", choices=STORAGE_TYPES, default="float32",
+                        help="Vektorlagring för flat/ivf/hnsw (float16/sq8 komprimerar)")
+    parser.add_argument("--nlist", type=int, default=None, help="Antal IVF-kluster (ivf/ivfpq)")
+    parser.add_argument("--nprobe", type=int, default=DEFAULT_NPROBE, help="Kluster per sökning (ivf/ivfpq)")
+    parser.add_argument("--hnsw-m", type=int, default=DEFAULT_HNSW_M, help="Grannar per nod (hnsw)")
+    parser.add_argument("--ef-construction", type=int, default=DEFAULT_EF_CONSTRUCTION,
+                        help="Sökbredd vid bygge (hnsw)")
+    parser.add_argument("--ef-search", type=int, default=DEFAULT_EF_SEARCH, help="Sökbredd vid sökning (hnsw)")
+    parser.add_argument("--pq-m", type=int, default=DEFAULT_PQ_M, help="Antal PQ-delkvantiserare (ivfpq)")
+    parser.add_argument("--pq-nbits", type=int, default=DEFAULT_PQ_NBITS, help="Bitar per PQ-kod (ivfpq)")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Antal processer för embeddings (0 = alla kärnor, 1 = en process)")
+    parser.add_argument("--index-report", action="store_true",
+                        help="Jämför alla indextyper (recall@k, söktid, minne) mot exakt index")
+    return parser.parse_args(argv)
+
 # Huvudprogram
 if __name__ == "__main__":
+    args = parse_args()
+    index_params = {
+        "index_type": args.index_type,
+        "storage": args.storage,
+        "nlist": args.nlist,
+        "nprobe": args.nprobe,
+        "hnsw_m": args.hnsw_m,
+        "ef_construction": args.ef_construction,
+        "ef_search": args.ef_search,
+        "pq_m": args.pq_m,
+        "pq_nbits": args.pq_nbits,
+    }
+    
     print("="*60)
     print("GRANTS.GOV DEMO - INDEXERING")
     print("="*60)
     print()
     
-    # Hämta bidragsdata
-    grants_data = fetch_grants_data()
-    
-    if not grants_data:
-        print("\n❌ Kunde inte hämta några bidrag. Kontrollera internetanslutningen.")
-        exit(1)
-    
-    print(f"\n✅ Hämtade {len(grants_data)} bidrag")
-    
-    # Skapa sökbara texter
-    print("\nFörbereder texter för indexering...")
-    searchable_texts = [create_searchable_text(grant) for grant in grants_data]
-    
-    # Skapa embeddings
-    grant_embeddings = create_embeddings(searchable_texts)
-    
-    # Skapa data-mappen om den inte finns
-    os.makedirs("data", exist_ok=True)
-    
-    # Steg 3: Lagra embeddings i FAISS för snabb sökning
-    print("\nSkapar FAISS-index...")
-    dimension = grant_embeddings.shape[1]
-    index = faiss.IndexFlatL2(dimension)
-    index.add(np.array(grant_embeddings))
-    
-    # Spara index
-    faiss.write_index(index, "data/grants_index.faiss")
-    print(f"  ✅ FAISS-index sparat (dimension: {dimension})")
-    
-    # Spara bidragsinformation som JSON
-    with open("data/grants_data.json", "w", encoding="utf-8") as f:
-        json.dump(grants_data, f, indent=2, ensure_ascii=False)
-    print(f"  ✅ Bidragsdata sparad")
-    
-    # Skapa en enkel metadatafil
-    with open("data/grants_metadata.txt", "w", encoding="utf-8") as f:
-        f.write(f"Indexerad: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
-        f.write(f"Antal bidrag: {len(grants_data)}\n")
-        f.write(f"Embedding dimension: {dimension}\n")
+    # Hämtning, embeddings och indexering körs som en ström, en batch i taget,
+    # så att minnet inte växer med antalet bidrag (se scripts/ingest.py)
+    from scripts.ingest import ingest
+
+    def grants_source():
+        print("Hämtar bidrag från Grants.gov...")
+        count = 0
+        for grant in iter_grants_gov():
+            count += 1
+            yield grant
+        # Om API:et inte fungerade, skapa demo-data
+        if count == 0:
+            print("\n⚠️ Kunde inte hämta data från Grants.gov API")
+            print("Skapar demo-data istället...\n")
+            yield from create_demo_data()
+
+    # Embeddings (bara nya/ändrade bidrag körs genom modellen)
+    if args.workers == 1:
+        embed_fn = create_embeddings
+    else:
+        embed_fn = lambda texts: create_embeddings_parallel(texts, num_workers=args.workers or None)
+
+    # Vektorerna behålls bara om indextyperna ska jämföras
+    report_vectors = []
+    on_batch = (lambda grants, vectors: report_vectors.append(vectors)) if args.index_report else None
+
+    # Alla filer skrivs i en egen versionskatalog och publiceras tillsammans,
+    # så att en sökprocess aldrig ser ett nytt index med gammal bidragsdata.
+    # FAISS-id = rad i bidragsdatan, så att scripts/live_index.py kan uppdatera per bidrag
+    print(f"\nIndexerar ({args.index_type}, {args.storage})...")
+    manifest = ingest(grants_source(), DEFAULT_INDEX_ROOT, index_params, embed_fn=embed_fn,
+                      model_name=model_name, on_batch=on_batch)
+    version_id = manifest["version"]
+
+    # Jämför indextyper mot exakt sökning
+    if args.index_report:
+        print("\nJämför indextyper...")
+        configs = [dict(index_params, index_type=index_type) for index_type in INDEX_TYPES]
+        configs += [dict(index_params, index_type="flat", storage=storage)
+                    for storage in STORAGE_TYPES if storage != index_params["storage"]]
+        grant_embeddings = np.vstack(report_vectors)
+        report = compare_index_types(grant_embeddings, k=10, configs=configs, measure_load=True)
+        write_report(report, "data/index_report.json", "data/index_report.md")
+        for row in report:
+            recall = row["recall@%d" % row['k']]
+            label = f"{row['config']['index_type']}/{row['config'].get('storage', '-')}"
+            print(f"  {label:14s} recall@{row['k']}={recall:.3f} "
+                  f"p50={row['p50_ms']:.3f} ms  minne={row['memory_bytes'] / 1e3:.1f} kB")
+        print("  ✅ Rapport sparad i data/index_report.md")
     
     print("\n" + "="*60)
     print("✅ INDEXERING KLAR!")
     print("="*60)
     print(f"\nFiler skapade:")
-    print(f"  - data/grants_index.faiss")
-    print(f"  - data/grants_data.json")
-    print(f"  - data/grants_metadata.txt")
+    print(f"  - {DEFAULT_INDEX_ROOT}/versions/{version_id}/ ({INDEX_FILE}, {STORE_DIR}/, {LEXICAL_DIR}/, "
+          f"{MANIFEST_FILE})")
+    print(f"  - {DEFAULT_INDEX_ROOT}/CURRENT")
+    print(f"  - {DEFAULT_CACHE_PATH}")
     print(f"\nNu kan du köra sökningen med: python demo_grants.py")
     print("="*60)
 
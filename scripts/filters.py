@@ -0,0 +1,241 @@
+"""
+Strukturerad förfiltrering av bidrag
+Filtren räknas ut som en bitmask över FAISS-raderna från de typade
+kolumnerna i bidragsdatan och skickas till FAISS som en ID-selektor, så
+att sökningen bara betraktar matchande bidrag i stället för att
+överhämta och efterfiltrera.
+
+Filter (alla valfria):
+    open_only        - Bara bidrag med deadline idag eller senare (eller utan deadline)
+    deadline_after   - Deadline på eller efter datumet ('2025-04-01')
+    deadline_before  - Deadline på eller före datumet
+    agencies         - Lista med myndigheter (skiftlägesokänsligt)
+    categories       - Lista med kategorier (skiftlägesokänsligt)
+    min_amount       - Bidrag där maxbeloppet är minst detta
+    max_amount       - Bidrag där minbeloppet (eller maxbeloppet) är högst detta
+
+Bidrag som saknar värde för ett filtrerat fält (t.ex. okänt belopp) tas
+inte med, med undantag för open_only där saknad deadline räknas som löpande.
+"""
+
+from datetime import date
+
+import numpy as np
+
+from scripts.grant_store import parse_date
+from scripts.index_factory import base_index
+
+# Max antal matchande rader för exakt reservsökning
+EXACT_FALLBACK_LIMIT = 50000
+
+FILTER_KEYS = (
+    "open_only", "deadline_after", "deadline_before",
+    "agencies", "categories", "min_amount", "max_amount",
+)
+
+
+def validate_filters(filters):
+    """
+    Kontrollerar filternycklarna och returnerar en dict (tom om inga filter)
+
+    Bara None, tomma strängar och tomma listor räknas som "inget filter";
+    0 är ett giltigt belopp och behålls.
+    """
+    if not filters:
+        return {}
+    unknown = set(filters) - set(FILTER_KEYS)
+    if unknown:
+        raise ValueError(f"Okända filter: {', '.join(sorted(unknown))} (giltiga: {', '.join(FILTER_KEYS)})")
+    return {key: value for key, value in filters.items() if not _is_unset(value)}
+
+
+def canonical_filters(filters):
+    """
+    Validerar filtren och skriver dem på en fast form: datum som ISO-strängar,
+    myndigheter och kategorier som sorterade listor, belopp som tal
+
+    Två filter som ger samma mask får samma form, och formen går alltid att
+    serialisera till JSON.
+
+    Raises:
+        ValueError: vid okända filter, ogiltiga datum eller belopp
+    """
+    canonical = {}
+    for key, value in validate_filters(filters).items():
+        if key in ("deadline_after", "deadline_before"):
+            value = str(_parse_filter_date(value))
+        elif key in ("agencies", "categories"):
+            value = sorted({str(v) for v in ([value] if isinstance(value, str) else value)})
+        elif key in ("min_amount", "max_amount"):
+            value = float(value)
+        else:
+            value = bool(value)
+        canonical[key] = value
+    return canonical
+
+
+def _is_unset(value):
+    # Ingen likhetsjämförelse mot False, eftersom 0 == False
+    if value is None:
+        return True
+    if isinstance(value, str):
+        return not value.strip()
+    if isinstance(value, (list, tuple, set)):
+        return not value
+    return False
+
+
+class GrantFilterIndex:
+    """
+    Typade kolumner och bitmappar per facettvärde för snabba filtermasker
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.size = len(store)
+        self._arrays = {}
+        self._facet_values = {}
+        self._facet_bitmaps = {}
+
+    def _array(self, name):
+        if name not in self._arrays:
+            self._arrays[name] = np.asarray(self.store.column(name))
+        return self._arrays[name]
+
+    def _facet_mask(self, name, wanted):
+        """
+        Bitmask för rader vars värde i en kategorisk kolumn finns i wanted
+        """
+        if isinstance(wanted, str):
+            wanted = [wanted]
+        if name not in self._facet_values:
+            codes, values = self.store.categorical(name)
+            self._arrays[name] = np.asarray(codes)
+            lookup = {}
+            for code, value in enumerate(values):
+                lookup.setdefault(str(value).casefold(), []).append(code)
+            self._facet_values[name] = lookup
+
+        mask = np.zeros(self.size, dtype=bool)
+        for value in wanted:
+            for code in self._facet_values[name].get(str(value).casefold(), []):
+                key = (name, code)
+                if key not in self._facet_bitmaps:
+                    self._facet_bitmaps[key] = self._arrays[name] == code
+                mask |= self._facet_bitmaps[key]
+        return mask
+
+    def mask(self, filters, today=None):
+        """
+        Bitmask över alla rader, eller None om inga filter är satta
+        """
+        filters = validate_filters(filters)
+        # open_only=False ensamt filtrerar inget
+        if all(value is False for value in filters.values()):
+            return None
+
+        mask = np.ones(self.size, dtype=bool)
+
+        if filters.get("open_only") or filters.get("deadline_after") or filters.get("deadline_before"):
+            deadline = self._array("deadline")
+            if filters.get("open_only"):
+                today = np.datetime64(today or date.today(), "D")
+                mask &= np.isnat(deadline) | (deadline >= today)
+            if filters.get("deadline_after"):
+                mask &= deadline >= _parse_filter_date(filters["deadline_after"])
+            if filters.get("deadline_before"):
+                mask &= deadline <= _parse_filter_date(filters["deadline_before"])
+
+        if filters.get("agencies"):
+            mask &= self._facet_mask("agency", filters["agencies"])
+        if filters.get("categories"):
+            mask &= self._facet_mask("category", filters["categories"])
+
+        if filters.get("min_amount") is not None:
+            # NaN-jämförelser blir False, så okända belopp filtreras bort
+            mask &= self._array("amount_max") >= float(filters["min_amount"])
+        if filters.get("max_amount") is not None:
+            amount_min = self._array("amount_min")
+            lowest = np.where(np.isnan(amount_min), self._array("amount_max"), amount_min)
+            mask &= lowest <= float(filters["max_amount"])
+
+        return mask
+
+
+def _parse_filter_date(value):
+    parsed = parse_date(value)
+    if np.isnat(parsed):
+        raise ValueError(f"Ogiltigt datum i filter: {value!r}")
+    return parsed
+
+
+def make_search_params(index, mask):
+    """
+    Skapar FAISS-sökparametrar med en bitmapp-selektor för masken
+
+    Returns:
+        (params, keepalive) - keepalive måste hållas vid liv under sökningen
+    """
+    import faiss
+
+    bits = np.packbits(mask, bitorder="little")
+    selector = faiss.IDSelectorBitmap(len(bits), faiss.swig_ptr(bits))
+
+    # Med en IndexIDMap gäller selektorn id:na, som här är radnumren
+    inner = base_index(index)
+    if hasattr(inner, "hnsw"):
+        params = faiss.SearchParametersHNSW(sel=selector, efSearch=inner.hnsw.efSearch)
+    else:
+        try:
+            ivf = faiss.extract_index_ivf(index)
+            params = faiss.SearchParametersIVF(sel=selector, nprobe=ivf.nprobe)
+        except RuntimeError:
+            params = faiss.SearchParameters(sel=selector)
+    return params, (bits, selector)
+
+
+def prepare_exact_search(index):
+    """
+    Bygger direktmappningen (id -> position) i ett IVF-index så att
+    exact_filtered_search kan rekonstruera vektorer
+
+    Ändrar indexet och ska därför anropas när indexet laddas, innan det
+    delas med söktrådarna, aldrig under en sökning. Flat- och HNSW-index
+    behöver ingen förberedelse.
+    """
+    import faiss
+
+    try:
+        ivf = faiss.extract_index_ivf(index)
+    except RuntimeError:
+        return index
+    if ivf.direct_map.no():
+        try:
+            ivf.make_direct_map()
+        except RuntimeError:
+            # Egna id:n (t.ex. efter upsert) kräver en hashtabell
+            ivf.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+
+def exact_filtered_search(index, query_vectors, row_ids, k):
+    """
+    Exakt sökning över ett fåtal rader (reserv när ANN-indexet ger för få träffar)
+
+    Indexet läses bara; IVF-index måste ha förberetts med prepare_exact_search.
+
+    Returns:
+        (distances, indices) som index.search, eller None om indexet inte kan
+        rekonstruera vektorer
+    """
+    import faiss
+
+    try:
+        vectors = index.reconstruct_batch(np.asarray(row_ids, dtype=np.int64))
+    except RuntimeError:
+        return None
+
+    k = min(k, len(row_ids))
+    distances, positions = faiss.knn(np.ascontiguousarray(query_vectors, dtype=np.float32),
+                                     np.ascontiguousarray(vectors, dtype=np.float32), k)
+    return distances, np.asarray(row_ids, dtype=np.int64)[positions]
@@ -0,0 +1,266 @@
+"""
+Källadaptrar för bulkladdning av bidrag (t.ex. svenska statsbidrag)
+En adapter läser råposter ur en fil eller databas i strömmande form och
+mappar dem till samma bidragsformat som create_searchable_text och
+resten av indexeringen använder:
+
+    id, number, title, description, agency, amount_min, amount_max,
+    deadline, posted_date, category, url
+
+Inbyggda adaptrar:
+    JSONLSource   - JSONL-fil (ett objekt per rad, även .gz), läses rad för rad
+    CSVSource     - CSV/TSV-fil, läses rad för rad med csv.DictReader
+    SQLiteSource  - SQLite-databas, läses med en markör och fetchmany
+    SQLSource     - valfri DB-API-anslutning (t.ex. PostgreSQL med en
+                    namngiven markör på serversidan)
+
+Mappningen anger för varje bidragsfält vilken kolumn det hämtas från: ett
+kolumnnamn, en lista med alternativa kolumner (första icke-tomma används)
+eller en funktion rad -> värde. Fält som inte mappas hämtas enligt
+SWEDISH_MAPPING (svenska kolumnnamn eller fältets eget namn). Fält som
+saknas i posten får ett standardvärde (defaults, annars 'N/A'). Poster
+utan id hoppas över och räknas i skipped.
+
+Ingen adapter läser in hela källan; en adapter är en iterable som kan ges
+direkt till ingest() eller LiveIndex.upsert().
+
+Användning:
+    from scripts.grant_sources import CSVSource, SQLiteSource
+    from scripts.ingest import ingest
+
+    source = SQLiteSource("statsbidrag.db", "SELECT * FROM statsbidrag",
+                          defaults={"category": "Statsbidrag"})
+    manifest = ingest(source)
+
+    python scripts/ingest.py --source sqlite --path statsbidrag.db --query "SELECT * FROM statsbidrag"
+    python scripts/ingest.py --source csv --path program.csv --mapping mappning.json
+"""
+
+import csv
+import gzip
+import json
+import os
+import sqlite3
+
+# Bidragsfälten i den ordning normalize_grant skapar dem
+GRANT_FIELDS = ('id', 'number', 'title', 'description', 'agency', 'amount_min', 'amount_max',
+                'deadline', 'posted_date', 'category', 'url')
+
+# Standardvärden för fält som saknas i källan (övriga får 'N/A')
+FIELD_DEFAULTS = {
+    'title': 'Ingen titel',
+    'description': 'Ingen beskrivning',
+}
+
+# Standardmappning för svenska kolumnnamn (som i exemplen i
+# GRANTS_DEMO_README.md); kolumner med bidragsfältens egna namn fungerar också
+SWEDISH_MAPPING = {
+    'id': ('id', 'bidrag_id', 'diarienummer'),
+    'number': ('number', 'nummer', 'diarienummer'),
+    'title': ('title', 'namn', 'titel', 'rubrik'),
+    'description': ('description', 'beskrivning', 'syfte'),
+    'agency': ('agency', 'myndighet', 'bidragsgivare'),
+    'amount_min': ('amount_min', 'belopp_min', 'minsta_belopp'),
+    'amount_max': ('amount_max', 'belopp_max', 'belopp', 'hogsta_belopp'),
+    'deadline': ('deadline', 'sista_ansokningsdag', 'sista_dag'),
+    'posted_date': ('posted_date', 'oppnar', 'publicerad', 'publiceringsdatum'),
+    'category': ('category', 'kategori', 'omrade'),
+    'url': ('url', 'länk', 'lank'),
+}
+
+# Antal rader per fetchmany mot databasen
+SQL_FETCH_SIZE = int(os.environ.get("GRANTS_SQL_FETCH_SIZE", "1000"))
+
+
+def _is_empty(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+class GrantSource:
+    """
+    Bas för källadaptrar: underklasser implementerar records() som ger
+    råposter (dict), __iter__ ger mappade bidrag
+    """
+
+    def __init__(self, mapping=None, defaults=None):
+        self.mapping = dict(SWEDISH_MAPPING, **(mapping or {}))
+        self.defaults = dict(FIELD_DEFAULTS, **(defaults or {}))
+        self.skipped = 0
+
+    def records(self):
+        raise NotImplementedError
+
+    def map_record(self, record):
+        """
+        Mappar en råpost till bidragsformatet, None om posten saknar id
+        """
+        grant = {}
+        for field in GRANT_FIELDS:
+            spec = self.mapping[field]
+            if callable(spec):
+                value = spec(record)
+            else:
+                value = None
+                for column in ((spec,) if isinstance(spec, str) else spec):
+                    if not _is_empty(record.get(column)):
+                        value = record[column]
+                        break
+            grant[field] = self.defaults.get(field, 'N/A') if _is_empty(value) else value
+        if grant['id'] == 'N/A':
+            return None
+        grant['id'] = str(grant['id'])
+        return grant
+
+    def __iter__(self):
+        self.skipped = 0
+        for record in self.records():
+            grant = self.map_record(record)
+            if grant is None:
+                self.skipped += 1
+                continue
+            yield grant
+
+
+def _open_text(path, encoding):
+    if path.endswith(".gz"):
+        return gzip.open(path, "rt", encoding=encoding, newline="")
+    return open(path, "r", encoding=encoding, newline="")
+
+
+class JSONLSource(GrantSource):
+    """
+    JSONL-fil med ett objekt per rad (gzip om filnamnet slutar på .gz)
+    """
+
+    def __init__(self, path, mapping=None, defaults=None, encoding="utf-8"):
+        super().__init__(mapping, defaults)
+        self.path = path
+        self.encoding = encoding
+
+    def records(self):
+        with _open_text(self.path, self.encoding) as f:
+            for line_number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError as e:
+                    raise ValueError(f"{self.path}:{line_number}: ogiltig JSON ({e})") from None
+
+
+class CSVSource(GrantSource):
+    """
+    CSV-fil med rubrikrad; avgränsaren gissas (',', ';' eller tab) om den inte anges
+    """
+
+    def __init__(self, path, mapping=None, defaults=None, delimiter=None, encoding="utf-8-sig"):
+        super().__init__(mapping, defaults)
+        self.path = path
+        self.delimiter = delimiter
+        self.encoding = encoding
+
+    def records(self):
+        with _open_text(self.path, self.encoding) as f:
+            delimiter = self.delimiter
+            if delimiter is None:
+                header = f.readline()
+                f.seek(0)
+                delimiter = max((",", ";", "\t"), key=header.count)
+            yield from csv.DictReader(f, delimiter=delimiter)
+
+
+class SQLSource(GrantSource):
+    """
+    Rader från en SQL-fråga via en DB-API-anslutning, fetch_size rader i taget
+
+    Args:
+        connect: Funktion utan argument som returnerar en anslutning
+        query: SELECT-frågan; kolumnnamnen används i mappningen
+        params: Parametrar till frågan
+        cursor_name: Namn på en markör på serversidan för drivrutiner som
+                     stöder det (t.ex. psycopg2); None = vanlig markör
+    """
+
+    def __init__(self, connect, query, params=(), mapping=None, defaults=None, fetch_size=SQL_FETCH_SIZE,
+                 cursor_name=None):
+        super().__init__(mapping, defaults)
+        self.connect = connect
+        self.query = query
+        self.params = params
+        self.fetch_size = fetch_size
+        self.cursor_name = cursor_name
+
+    def records(self):
+        connection = self.connect()
+        try:
+            cursor = connection.cursor(self.cursor_name) if self.cursor_name else connection.cursor()
+            try:
+                cursor.execute(self.query, self.params)
+                columns = [column[0] for column in cursor.description]
+                while True:
+                    rows = cursor.fetchmany(self.fetch_size)
+                    if not rows:
+                        break
+                    for row in rows:
+                        yield dict(zip(columns, row))
+            finally:
+                cursor.close()
+        finally:
+            connection.close()
+
+
+class SQLiteSource(SQLSource):
+    """
+    SQLite-databas som öppnas skrivskyddat; en SQLite-markör stegar fram
+    raderna efter hand, så resultatet läses aldrig in i sin helhet
+    """
+
+    def __init__(self, path, query="SELECT * FROM statsbidrag", params=(), mapping=None, defaults=None,
+                 fetch_size=SQL_FETCH_SIZE):
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+        super().__init__(lambda: sqlite3.connect(f"file:{path}?mode=ro", uri=True), query, params,
+                         mapping, defaults, fetch_size)
+        self.path = path
+
+
+# Adapter per filändelse för open_source
+SOURCE_TYPES = {
+    ".jsonl": JSONLSource,
+    ".ndjson": JSONLSource,
+    ".csv": CSVSource,
+    ".tsv": CSVSource,
+    ".db": SQLiteSource,
+    ".sqlite": SQLiteSource,
+    ".sqlite3": SQLiteSource,
+}
+
+
+def load_mapping(path):
+    """
+    Läser en mappning från en JSON-fil: {"bidragsfält": "kolumn" eller ["kolumn", ...]}
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        mapping = json.load(f)
+    unknown = set(mapping) - set(GRANT_FIELDS)
+    if unknown:
+        raise ValueError(f"Okända bidragsfält i {path}: {', '.join(sorted(unknown))}")
+    return mapping
+
+
+def open_source(path, source_type=None, **kwargs):
+    """
+    Skapar en adapter utifrån filändelsen (eller source_type: jsonl, csv, sqlite)
+
+    Övriga argument (mapping, defaults, query, ...) skickas till adaptern.
+    """
+    if source_type is None:
+        name = path[:-len(".gz")] if path.endswith(".gz") else path
+        source_class = SOURCE_TYPES.get(os.path.splitext(name)[1].lower())
+        if source_class is None:
+            raise ValueError(f"Okänd filtyp för {path}, ange källtypen (jsonl, csv eller sqlite)")
+    else:
+        source_class = SOURCE_TYPES[f".{source_type}"]
+    if source_class is CSVSource and path.endswith((".tsv", ".tsv.gz")):
+        kwargs.setdefault("delimiter", "\t")
+    return source_class(path, **kwargs)
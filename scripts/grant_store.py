@@ -0,0 +1,408 @@
+"""
+Kompakt, minnesmappad lagring av bidragsdata
+Ersätter grants_data.json vid sökning: bidragen skrivs som en post per rad
+med en offsettabell, så att en post kan läsas i O(1) via FAISS-radens id
+utan att hela filen tolkas. Bara träffarna i en sökning avkodas.
+
+Numeriska fält (belopp, datum) tolkas en gång vid indexeringen och sparas
+som typade kolumner bredvid posterna.
+
+Katalogstruktur:
+    records.jsonl   - en JSON-post per rad, i FAISS-ordning
+    offsets.npy     - int64 start-offset per post (n + 1 värden)
+    amount_min.npy  - float64, NaN om belopp saknas
+    amount_max.npy  - float64, NaN om belopp saknas
+    deadline.npy    - datetime64[D], NaT om datum saknas
+    posted_date.npy - datetime64[D], NaT om datum saknas
+    agency.npy      - int32-kod per post, värdena i agency_values.json
+    category.npy    - int32-kod per post, värdena i category_values.json
+    ids.json        - bidragets id per rad
+
+Flera store-katalogar kan läsas efter varandra som en store med
+SegmentedStore (t.ex. bas + delta efter en upsert).
+"""
+
+import json
+import mmap
+import os
+import shutil
+from datetime import datetime
+
+import numpy as np
+
+DEFAULT_STORE_PATH = "data/grants_store"
+
+RECORDS_FILE = "records.jsonl"
+OFFSETS_FILE = "offsets.npy"
+IDS_FILE = "ids.json"
+
+AMOUNT_COLUMNS = ("amount_min", "amount_max")
+DATE_COLUMNS = ("deadline", "posted_date")
+CATEGORICAL_COLUMNS = ("agency", "category")
+
+DATE_FORMATS = ("%Y-%m-%d", "%m/%d/%Y", "%Y%m%d", "%b %d, %Y")
+
+
+def parse_amount(value):
+    """
+    Tolkar ett belopp ('50000', '$1,000', 50000) till float, NaN om det saknas
+    """
+    if value is None or isinstance(value, bool):
+        return float("nan")
+    if isinstance(value, (int, float)):
+        return float(value)
+    text = str(value).strip().replace(",", "").replace("$", "").replace(" ", "")
+    if not text or text.upper() == "N/A":
+        return float("nan")
+    try:
+        return float(text)
+    except ValueError:
+        return float("nan")
+
+
+def parse_date(value):
+    """
+    Tolkar ett datum i något av de vanliga formaten till datetime64[D], NaT om det saknas
+    """
+    if not value or str(value).strip().upper() == "N/A":
+        return np.datetime64("NaT", "D")
+    text = str(value).strip()
+    if "T" in text:
+        text = text.split("T")[0]
+    for date_format in DATE_FORMATS:
+        try:
+            return np.datetime64(datetime.strptime(text, date_format).date(), "D")
+        except ValueError:
+            continue
+    return np.datetime64("NaT", "D")
+
+
+def encode_categorical(values):
+    """
+    Kodar strängvärden som int32-koder och en lista med unika värden
+    """
+    vocabulary = {}
+    codes = np.array([vocabulary.setdefault(str(value), len(vocabulary)) for value in values], dtype=np.int32)
+    return codes, list(vocabulary)
+
+
+def write_store(grants, path=DEFAULT_STORE_PATH):
+    """
+    Skriver bidragen till en store-katalog (atomiskt via en temporär katalog)
+
+    grants kan vara en generator; posterna skrivs löpande (se StoreWriter).
+
+    Returns:
+        Antal skrivna poster
+    """
+    writer = StoreWriter(path)
+    try:
+        for grant in grants:
+            writer.append(grant)
+    except BaseException:
+        writer.abort()
+        raise
+    return writer.close()
+
+
+class StoreWriter:
+    """
+    Skriver en store-katalog post för post
+
+    Posterna och kolumnerna skrivs till disk i block om FLUSH_SIZE poster,
+    så minnet växer inte med antalet bidrag (bara med antalet unika
+    myndigheter och kategorier). Katalogen byts in atomiskt i close().
+    """
+
+    FLUSH_SIZE = 4096
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self.tmp_path = path.rstrip("/\\") + ".tmp"
+        if os.path.exists(self.tmp_path):
+            shutil.rmtree(self.tmp_path)
+        os.makedirs(self.tmp_path)
+
+        self.count = 0
+        self._position = 0
+        self._records = open(os.path.join(self.tmp_path, RECORDS_FILE), "wb")
+        self._ids = open(os.path.join(self.tmp_path, IDS_FILE), "w", encoding="utf-8")
+        self._ids.write("[")
+        # Kolumnerna samlas i block och läggs till i råa binärfiler, som blir .npy i close()
+        self._dtypes = {OFFSETS_FILE: np.int64}
+        self._dtypes.update({name: np.float64 for name in AMOUNT_COLUMNS})
+        self._dtypes.update({name: "datetime64[D]" for name in DATE_COLUMNS})
+        self._dtypes.update({name: np.int32 for name in CATEGORICAL_COLUMNS})
+        self._raw = {name: open(self._raw_path(name), "wb") for name in self._dtypes}
+        self._chunks = {name: [] for name in self._dtypes}
+        self._chunks[OFFSETS_FILE].append(0)
+        self._vocabularies = {name: {} for name in CATEGORICAL_COLUMNS}
+
+    def _raw_path(self, name):
+        return os.path.join(self.tmp_path, f"{name}.raw")
+
+    def append(self, grant):
+        line = json.dumps(grant, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+        self._records.write(line)
+        self._position += len(line)
+        self._ids.write(("," if self.count else "") + json.dumps(str(grant.get('id', '')), ensure_ascii=False))
+        self.count += 1
+
+        self._chunks[OFFSETS_FILE].append(self._position)
+        for name in AMOUNT_COLUMNS:
+            self._chunks[name].append(parse_amount(grant.get(name)))
+        for name in DATE_COLUMNS:
+            self._chunks[name].append(parse_date(grant.get(name)))
+        for name in CATEGORICAL_COLUMNS:
+            vocabulary = self._vocabularies[name]
+            self._chunks[name].append(vocabulary.setdefault(str(grant.get(name, 'N/A')), len(vocabulary)))
+        if len(self._chunks[OFFSETS_FILE]) >= self.FLUSH_SIZE:
+            self._flush()
+
+    def extend(self, grants):
+        for grant in grants:
+            self.append(grant)
+
+    def _flush(self):
+        for name, chunk in self._chunks.items():
+            if chunk:
+                self._raw[name].write(np.array(chunk, dtype=self._dtypes[name]).tobytes())
+                chunk.clear()
+
+    def _close_files(self):
+        self._records.close()
+        self._ids.close()
+        for f in self._raw.values():
+            f.close()
+
+    def abort(self):
+        self._close_files()
+        shutil.rmtree(self.tmp_path, ignore_errors=True)
+
+    def close(self):
+        """
+        Skriver kolumnerna och byter in katalogen
+
+        Returns:
+            Antal skrivna poster
+        """
+        self._flush()
+        self._ids.write("]")
+        self._close_files()
+
+        for name, dtype in self._dtypes.items():
+            raw_path = self._raw_path(name)
+            target = OFFSETS_FILE if name == OFFSETS_FILE else f"{name}.npy"
+            # Minnesmappad läsning, så kolumnen behöver inte få plats i processens minne
+            column = (np.memmap(raw_path, dtype=dtype, mode="r") if os.path.getsize(raw_path)
+                      else np.zeros(0, dtype=dtype))
+            np.save(os.path.join(self.tmp_path, target), column)
+            del column
+            os.remove(raw_path)
+        for name in CATEGORICAL_COLUMNS:
+            with open(os.path.join(self.tmp_path, f"{name}_values.json"), "w", encoding="utf-8") as f:
+                json.dump(list(self._vocabularies[name]), f, ensure_ascii=False)
+
+        # Byt ut den gamla katalogen så att läsare aldrig ser en halvskriven store
+        old_path = self.path.rstrip("/\\") + ".old"
+        if os.path.exists(self.path):
+            if os.path.exists(old_path):
+                shutil.rmtree(old_path)
+            os.replace(self.path, old_path)
+        os.replace(self.tmp_path, self.path)
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+
+        return self.count
+
+
+class GrantStore:
+    """
+    Minnesmappad läsare för en store-katalog
+
+    Posterna avkodas först när de efterfrågas; flera processer som läser
+    samma store delar sidcachen.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH):
+        self.path = path
+        self._offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode="r")
+        self._file = open(os.path.join(path, RECORDS_FILE), "rb")
+        size = int(self._offsets[-1])
+        # mmap av en tom fil är inte tillåtet
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        self._columns = {}
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    def __getitem__(self, row):
+        row = int(row)
+        if row < 0 or row >= len(self):
+            raise IndexError(row)
+        start, end = int(self._offsets[row]), int(self._offsets[row + 1])
+        return json.loads(self._data[start:end].decode("utf-8"))
+
+    def get(self, row):
+        """
+        Returnerar posten på rad row som en ny dict
+        """
+        return self[row]
+
+    def column(self, name):
+        """
+        Returnerar en typad kolumn (minnesmappad numpy-array)
+        """
+        if name not in self._columns:
+            column_path = os.path.join(self.path, f"{name}.npy")
+            if os.path.exists(column_path):
+                self._columns[name] = np.load(column_path, mmap_mode="r")
+            else:
+                # Äldre store utan kolumnen: bygg den från posterna en gång
+                self._columns[name] = _build_column(name, (self[row] for row in range(len(self))))
+        return self._columns[name]
+
+    def categorical(self, name):
+        """
+        Returnerar (koder, värden) för en kategorisk kolumn
+        """
+        key = f"{name}:values"
+        if key not in self._columns:
+            values_path = os.path.join(self.path, f"{name}_values.json")
+            if not os.path.exists(values_path):
+                return _build_categorical(self, name)
+            with open(values_path, "r", encoding="utf-8") as f:
+                self._columns[key] = json.load(f)
+        return self.column(name), self._columns[key]
+
+    def ids(self):
+        """
+        Bidragens id per rad
+        """
+        if "id:values" not in self._columns:
+            ids_path = os.path.join(self.path, IDS_FILE)
+            if os.path.exists(ids_path):
+                with open(ids_path, "r", encoding="utf-8") as f:
+                    self._columns["id:values"] = json.load(f)
+            else:
+                # Äldre store utan id-fil
+                self._columns["id:values"] = [str(self[row].get('id', '')) for row in range(len(self))]
+        return self._columns["id:values"]
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+
+class ListGrantStore:
+    """
+    Samma gränssnitt som GrantStore men över en lista (t.ex. grants_data.json)
+    """
+
+    def __init__(self, grants):
+        self._grants = grants
+        self._columns = {}
+
+    def __len__(self):
+        return len(self._grants)
+
+    def __getitem__(self, row):
+        return self._grants[int(row)]
+
+    def get(self, row):
+        return dict(self._grants[int(row)])
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = _build_column(name, self._grants)
+        return self._columns[name]
+
+    def categorical(self, name):
+        return _build_categorical(self, name)
+
+    def ids(self):
+        return [str(grant.get('id', '')) for grant in self._grants]
+
+    def close(self):
+        pass
+
+
+class SegmentedStore:
+    """
+    Flera store-segment efter varandra som en store
+
+    Rad r i segment i har radnumret starts[i] + r, så segment kan läggas
+    till i slutet utan att befintliga rader byter nummer.
+    """
+
+    def __init__(self, segments):
+        self.segments = list(segments)
+        self.starts = np.cumsum([0] + [len(segment) for segment in self.segments])
+        self._columns = {}
+
+    def __len__(self):
+        return int(self.starts[-1])
+
+    def _locate(self, row):
+        row = int(row)
+        if row < 0 or row >= len(self):
+            raise IndexError(row)
+        i = int(np.searchsorted(self.starts, row, side="right")) - 1
+        return self.segments[i], row - int(self.starts[i])
+
+    def __getitem__(self, row):
+        segment, local_row = self._locate(row)
+        return segment[local_row]
+
+    def get(self, row):
+        segment, local_row = self._locate(row)
+        return segment.get(local_row)
+
+    def column(self, name):
+        if name not in self._columns:
+            self._columns[name] = np.concatenate([np.asarray(segment.column(name)) for segment in self.segments])
+        return self._columns[name]
+
+    def categorical(self, name):
+        key = f"{name}:values"
+        if key not in self._columns:
+            # Segmenten har egna värdelistor; koderna räknas om till en gemensam
+            values, lookup, parts = [], {}, []
+            for segment in self.segments:
+                codes, segment_values = segment.categorical(name)
+                for value in segment_values:
+                    if value not in lookup:
+                        lookup[value] = len(values)
+                        values.append(value)
+                remap = np.array([lookup[value] for value in segment_values], dtype=np.int32)
+                parts.append(remap[np.asarray(codes)] if len(remap) else np.asarray(codes, dtype=np.int32))
+            self._columns[name] = np.concatenate(parts)
+            self._columns[key] = values
+        return self._columns[name], self._columns[key]
+
+    def ids(self):
+        return [grant_id for segment in self.segments for grant_id in segment.ids()]
+
+    def close(self):
+        for segment in self.segments:
+            segment.close()
+
+
+def _build_column(name, grants):
+    if name in AMOUNT_COLUMNS:
+        return np.array([parse_amount(g.get(name)) for g in grants], dtype=np.float64)
+    if name in DATE_COLUMNS:
+        return np.array([parse_date(g.get(name)) for g in grants], dtype="datetime64[D]")
+    raise KeyError(name)
+
+
+def _build_categorical(store, name):
+    if name not in CATEGORICAL_COLUMNS:
+        raise KeyError(name)
+    key = f"{name}:values"
+    if key not in store._columns:
+        codes, values = encode_categorical(store[row].get(name, 'N/A') for row in range(len(store)))
+        store._columns[name] = codes
+        store._columns[key] = values
+    return store._columns[name], store._columns[key]
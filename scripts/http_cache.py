@@ -0,0 +1,141 @@
+"""
+HTTP-svarscache på disk för hämtningen från Grants.gov
+Varje lyckat svar sparas i en fil nycklad på URL och JSON-payload. Vid
+nästa anrop med samma payload:
+
+    - svaret används direkt om det är yngre än max_age (inget anrop)
+    - annars skickas ett villkorligt anrop (If-None-Match /
+      If-Modified-Since om servern gav ETag / Last-Modified); 304 ger det
+      sparade svaret
+    - ett nytt 200-svar med samma innehåll som det sparade räknas som
+      oförändrat, så att anroparen kan hoppa över sidan
+
+Används av uppdateringsjobbet (scripts/refresh_grants.py) så att en
+omstart eller en ny körning inom max_age inte hämtar samma sidor igen.
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+
+DEFAULT_HTTP_CACHE_PATH = "data/http_cache"
+HTTP_CACHE_MAX_AGE = float(os.environ.get("GRANTS_HTTP_CACHE_MAX_AGE", "300"))
+
+# Status för ett svar från post_json
+FRESH = "fresh"                # Sparat svar inom max_age, inget anrop
+NOT_MODIFIED = "not_modified"  # Servern svarade 304
+UNCHANGED = "unchanged"        # Nytt svar, samma innehåll som det sparade
+CHANGED = "changed"            # Nytt eller ändrat innehåll
+# Svar med samma innehåll som förra gången anroparen såg det
+SAME_AS_BEFORE = (FRESH, NOT_MODIFIED, UNCHANGED)
+
+
+def request_key(url, payload):
+    text = url + "\n" + json.dumps(payload, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class HTTPCache:
+    """
+    Cache för POST-anrop med JSON-svar, en fil per anrop
+    """
+
+    def __init__(self, path=DEFAULT_HTTP_CACHE_PATH, max_age=HTTP_CACHE_MAX_AGE, clock=time.time):
+        self.path = path
+        self.max_age = max_age
+        self.clock = clock
+        self.counts = {FRESH: 0, NOT_MODIFIED: 0, UNCHANGED: 0, CHANGED: 0}
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+
+    def _entry_path(self, key):
+        return os.path.join(self.path, f"{key}.json")
+
+    def _read(self, key):
+        try:
+            with open(self._entry_path(key), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def _count(self, status):
+        with self._lock:
+            self.counts[status] += 1
+
+    def _write(self, key, entry):
+        entry_path = self._entry_path(key)
+        tmp_path = f"{entry_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(entry, f, ensure_ascii=False)
+        os.replace(tmp_path, entry_path)
+
+    def post_json(self, session, url, payload, timeout=None):
+        """
+        POST med JSON-payload via cachen
+
+        Returns:
+            (statuskod, JSON-svar, status) där status är FRESH, NOT_MODIFIED,
+            UNCHANGED eller CHANGED; fel (statuskod != 200) cachas inte
+        """
+        key = request_key(url, payload)
+        entry = self._read(key)
+        now = self.clock()
+        if entry is not None and now - entry["fetched_at"] < self.max_age:
+            self._count(FRESH)
+            return 200, entry["body"], FRESH
+
+        headers = {}
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry is not None and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        response = session.post(url, json=payload, timeout=timeout, headers=headers)
+
+        if response.status_code == 304 and entry is not None:
+            entry["fetched_at"] = now
+            self._write(key, entry)
+            self._count(NOT_MODIFIED)
+            return 200, entry["body"], NOT_MODIFIED
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        if response.status_code != 200:
+            return response.status_code, body, CHANGED
+
+        digest = hashlib.sha256(json.dumps(body, sort_keys=True).encode("utf-8")).hexdigest()
+        status = UNCHANGED if entry is not None and entry.get("digest") == digest else CHANGED
+        self._write(key, {
+            "url": url,
+            "payload": payload,
+            "fetched_at": now,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "digest": digest,
+            "body": body,
+        })
+        self._count(status)
+        return 200, body, status
+
+    def prune(self, max_age_seconds):
+        """
+        Tar bort svar som inte hämtats på max_age_seconds
+
+        Returns:
+            Antal borttagna filer
+        """
+        removed = 0
+        now = self.clock()
+        for name in os.listdir(self.path):
+            if not name.endswith(".json"):
+                continue
+            entry = self._read(name[:-len(".json")])
+            if entry is None or now - entry.get("fetched_at", 0) > max_age_seconds:
+                try:
+                    os.remove(os.path.join(self.path, name))
+                    removed += 1
+                except OSError:
+                    pass
+        return removed
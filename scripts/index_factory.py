@@ -0,0 +1,478 @@
+"""
+Fabrik för FAISS-index
+Bygger exakta eller approximativa (ANN) index och jämför dem mot det
+exakta indexet: recall@k, söktid, byggtid och minnesåtgång.
+
+Indextyper:
+    flat     - Exakt sökning (IndexFlatL2), standard
+    ivf      - IVF-Flat: klusterindelad sökning, styrs av nlist/nprobe
+    hnsw     - HNSW-graf, styrs av M/efConstruction/efSearch
+    ivfpq    - IVF med produktkvantisering, komprimerade vektorer
+
+Vektorlagring (flat/ivf/hnsw):
+    float32  - Full precision (standard)
+    float16  - Halv precision, halva minnet
+    sq8      - 8-bitars skalärkvantisering, en fjärdedel av minnet
+
+Index kan läsas minnesmappat (load_index(path, mmap=True)) så att flera
+sökprocesser på samma maskin delar sidcachen i stället för var sin kopia.
+"""
+
+import json
+import math
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+INDEX_TYPES = ("flat", "ivf", "hnsw", "ivfpq")
+STORAGE_TYPES = ("float32", "float16", "sq8")
+
+# Parametrar som påverkar respektive indextyp
+INDEX_PARAMS = {
+    "flat": ("storage",),
+    "ivf": ("storage", "nlist", "nprobe"),
+    "hnsw": ("storage", "hnsw_m", "ef_construction", "ef_search"),
+    "ivfpq": ("nlist", "nprobe", "pq_m", "pq_nbits"),
+}
+
+DEFAULT_NPROBE = 8
+DEFAULT_HNSW_M = 32
+DEFAULT_EF_CONSTRUCTION = 40
+DEFAULT_EF_SEARCH = 64
+DEFAULT_PQ_M = 8
+DEFAULT_PQ_NBITS = 8
+
+# FAISS vill ha minst ~39 träningspunkter per kluster
+MIN_POINTS_PER_CENTROID = 39
+
+# Antal vektorer som samlas för träning när ett index byggs i omgångar
+DEFAULT_TRAIN_SIZE = int(os.environ.get("GRANTS_INDEX_TRAIN_SIZE", "50000"))
+
+
+def default_nlist(n_vectors):
+    """
+    Tumregel för antal IVF-kluster: ~4*sqrt(n), begränsat av antal vektorer
+    """
+    nlist = int(4 * math.sqrt(max(n_vectors, 1)))
+    return max(1, min(nlist, n_vectors // MIN_POINTS_PER_CENTROID or 1))
+
+
+def _scalar_quantizer_type(storage):
+    import faiss
+
+    if storage == "float16":
+        return faiss.ScalarQuantizer.QT_fp16
+    if storage == "sq8":
+        return faiss.ScalarQuantizer.QT_8bit
+    raise ValueError(f"Okänd vektorlagring '{storage}', välj bland {', '.join(STORAGE_TYPES)}")
+
+
+def build_index(embeddings, index_type="flat", nlist=None, nprobe=DEFAULT_NPROBE,
+                hnsw_m=DEFAULT_HNSW_M, ef_construction=DEFAULT_EF_CONSTRUCTION,
+                ef_search=DEFAULT_EF_SEARCH, pq_m=DEFAULT_PQ_M, pq_nbits=DEFAULT_PQ_NBITS,
+                storage="float32", ids=None):
+    """
+    Bygger (och vid behov tränar) ett FAISS-index över embeddings
+
+    Args:
+        embeddings: Matris (n, d) med float32-vektorer
+        index_type: En av INDEX_TYPES
+        nlist: Antal IVF-kluster (standard: default_nlist(n))
+        nprobe: Antal kluster som genomsöks per fråga (ivf/ivfpq)
+        hnsw_m: Antal grannar per nod i HNSW-grafen
+        ef_construction / ef_search: Sökbredd vid bygge/sökning (hnsw)
+        pq_m: Antal delkvantiserare (måste dela dimensionen)
+        pq_nbits: Bitar per delkod (ivfpq)
+        storage: Vektorlagring för flat/ivf/hnsw, en av STORAGE_TYPES
+        ids: Valfria int64-id per vektor, så att vektorer kan tas bort och
+             läggas till per id (IVF lagrar id:na själv, övriga läggs i en
+             IndexIDMap2)
+
+    Returns:
+        Ett färdigt FAISS-index med alla vektorer tillagda
+    """
+    import faiss
+
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    n_vectors, dimension = embeddings.shape
+
+    if storage not in STORAGE_TYPES:
+        raise ValueError(f"Okänd vektorlagring '{storage}', välj bland {', '.join(STORAGE_TYPES)}")
+    compressed = storage != "float32"
+
+    if index_type == "flat":
+        if compressed:
+            index = faiss.IndexScalarQuantizer(dimension, _scalar_quantizer_type(storage), faiss.METRIC_L2)
+        else:
+            index = faiss.IndexFlatL2(dimension)
+
+    elif index_type == "hnsw":
+        if compressed:
+            index = faiss.IndexHNSWSQ(dimension, _scalar_quantizer_type(storage), hnsw_m)
+        else:
+            index = faiss.IndexHNSWFlat(dimension, hnsw_m)
+        index.hnsw.efConstruction = ef_construction
+        index.hnsw.efSearch = ef_search
+
+    elif index_type in ("ivf", "ivfpq"):
+        nlist = min(nlist or default_nlist(n_vectors), n_vectors)
+        quantizer = faiss.IndexFlatL2(dimension)
+        if index_type == "ivf" and compressed:
+            index = faiss.IndexIVFScalarQuantizer(quantizer, dimension, nlist,
+                                                  _scalar_quantizer_type(storage), faiss.METRIC_L2)
+        elif index_type == "ivf":
+            index = faiss.IndexIVFFlat(quantizer, dimension, nlist)
+        else:
+            if dimension % pq_m != 0:
+                raise ValueError(f"pq_m={pq_m} måste dela dimensionen {dimension}")
+            # Varje delkvantiserare har 2^nbits centroider som måste kunna tränas
+            max_nbits = max(1, int(math.log2(max(n_vectors, 2))))
+            if pq_nbits > max_nbits:
+                print(f"  ⚠️ För få vektorer för pq_nbits={pq_nbits}, använder {max_nbits}")
+                pq_nbits = max_nbits
+            index = faiss.IndexIVFPQ(quantizer, dimension, nlist, pq_m, pq_nbits)
+        index.nprobe = min(nprobe, nlist)
+
+    else:
+        raise ValueError(f"Okänd indextyp '{index_type}', välj bland {', '.join(INDEX_TYPES)}")
+
+    # IVF-kluster och skalärkvantiserare måste tränas innan vektorerna läggs till
+    if not index.is_trained:
+        index.train(embeddings)
+    if ids is None:
+        index.add(embeddings)
+        return index
+    if index_type not in ("ivf", "ivfpq"):
+        index = faiss.IndexIDMap2(index)
+    index.add_with_ids(embeddings, np.ascontiguousarray(ids, dtype=np.int64))
+    return index
+
+
+class IncrementalIndexBuilder:
+    """
+    Bygger ett index i omgångar, för när embeddings strömmar in i batchar
+
+    Index som måste tränas (IVF, IVF-PQ och komprimerad lagring) samlar de
+    första train_size vektorerna, tränas på dem och tar sedan emot resten
+    direkt. Flat/HNSW med float32 byggs från första batchen. Vektorerna får
+    id 0, 1, 2, ... i den ordning de läggs till.
+
+    Träningsurvalet är början av strömmen; är källan sorterad (t.ex. per
+    kategori) bör train_size täcka en stor del av korpusen.
+    """
+
+    def __init__(self, train_size=DEFAULT_TRAIN_SIZE, **index_params):
+        self.index_params = index_params
+        needs_training = (index_params.get("index_type", "flat") in ("ivf", "ivfpq")
+                          or index_params.get("storage", "float32") != "float32")
+        self.train_size = max(1, train_size) if needs_training else 1
+        self.index = None
+        self.ntotal = 0
+        self._pending = []
+        self._pending_rows = 0
+
+    def add(self, vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if not len(vectors):
+            return
+        if self.index is None:
+            self._pending.append(vectors)
+            self._pending_rows += len(vectors)
+            if self._pending_rows >= self.train_size:
+                self._build()
+            return
+        self.index.add_with_ids(vectors, np.arange(self.ntotal, self.ntotal + len(vectors), dtype=np.int64))
+        self.ntotal += len(vectors)
+
+    def _build(self):
+        sample = np.vstack(self._pending)
+        self._pending, self._pending_rows = [], 0
+        self.index = build_index(sample, **self.index_params, ids=np.arange(len(sample)))
+        self.ntotal = len(sample)
+
+    def finish(self):
+        """
+        Returns:
+            Det färdiga indexet (tränas här om färre än train_size vektorer kom in)
+        """
+        if self.index is None:
+            if not self._pending:
+                raise ValueError("Inga vektorer att indexera")
+            self._build()
+        return self.index
+
+
+def base_index(index):
+    """
+    Det underliggande indexet i en IndexIDMap/IndexIDMap2 (annars indexet självt)
+    """
+    import faiss
+
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return faiss.downcast_index(index.index)
+    return index
+
+
+def with_id_map(index):
+    """
+    Gör att ett index kan ta bort och lägga till vektorer per id, med
+    id = radnummer för befintliga vektorer. IVF-index har redan id:n;
+    övriga läggs i en IndexIDMap2.
+    """
+    import faiss
+
+    if isinstance(index, (faiss.IndexIDMap, faiss.IndexIDMap2)):
+        return index
+    try:
+        faiss.extract_index_ivf(index)
+        return index
+    except RuntimeError:
+        pass
+    # IndexIDMap2 kräver ett tomt index när det skapas; vektorerna finns
+    # redan, så id-tabellen fylls i efteråt
+    ntotal = index.ntotal
+    index.ntotal = 0
+    wrapped = faiss.IndexIDMap2(index)
+    index.ntotal = wrapped.ntotal = ntotal
+    faiss.copy_array_to_vector(np.arange(ntotal, dtype=np.int64), wrapped.id_map)
+    wrapped.construct_rev_map()
+    # Omslaget äger nu det inre indexet
+    index.this.disown()
+    wrapped.own_fields = True
+    return wrapped
+
+
+def load_index(path, mmap=False):
+    """
+    Läser ett index från disk, valfritt minnesmappat och skrivskyddat
+
+    Med mmap=True läses vektorerna inte in i processens minne utan mappas
+    från filen, så flera processer som läser samma index delar sidcachen.
+    """
+    import faiss
+
+    if not mmap:
+        return faiss.read_index(path)
+    # IO_FLAG_MMAP_IFC mappar vektorerna i flat-/SQ-/HNSW-index (nyare FAISS)
+    flags = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP) | faiss.IO_FLAG_READ_ONLY
+    return faiss.read_index(path, flags)
+
+
+_LOAD_PROBE = """
+import os, sys, time
+sys.path.insert(0, sys.argv[3])
+import faiss  # Importtiden ska inte räknas som laddtid
+from scripts.index_factory import load_index
+
+def rss_kb():
+    # Aktuell RSS från /proc på Linux, annars topp-RSS via resource
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+    except ImportError:
+        return None
+    # ru_maxrss är kB på Linux och byte på macOS
+    scale = 1024 if sys.platform == "darwin" else 1
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale
+
+before = rss_kb()
+start = time.perf_counter()
+index = load_index(sys.argv[1], mmap=sys.argv[2] == "1")
+load_ms = (time.perf_counter() - start) * 1000
+after = rss_kb()
+print(load_ms, -1 if before is None or after is None else after - before)
+"""
+
+
+def measure_index_load(path, mmap=False):
+    """
+    Mäter laddtid och RSS-ökning för ett index i en separat process
+
+    Returns:
+        dict med load_ms och rss_mb (None om RSS inte kan mätas på plattformen)
+    """
+    package_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", _LOAD_PROBE, path, "1" if mmap else "0", package_root],
+        capture_output=True, text=True, check=True,
+    ).stdout.split()
+    load_ms, rss_kb = float(output[-2]), float(output[-1])
+    return {"load_ms": load_ms, "rss_mb": rss_kb / 1024 if rss_kb >= 0 else None}
+
+
+def tune_index(index, nprobe=None, ef_search=None):
+    """
+    Sätter sökparametrar på ett befintligt index (t.ex. efter read_index)
+    """
+    import faiss
+
+    if nprobe is not None:
+        try:
+            ivf = faiss.extract_index_ivf(index)
+            ivf.nprobe = min(int(nprobe), ivf.nlist)
+        except RuntimeError:
+            pass
+    if ef_search is not None and hasattr(base_index(index), "hnsw"):
+        base_index(index).hnsw.efSearch = int(ef_search)
+    return index
+
+
+def index_memory_bytes(index):
+    """
+    Storleken på indexet serialiserat, en bra approximation av minnesåtgången
+    """
+    import faiss
+
+    return int(faiss.serialize_index(index).nbytes)
+
+
+def recall_at_k(approx_ids, exact_ids, k):
+    """
+    Andel av de exakta top-k-grannarna som också finns i det approximativa svaret
+    """
+    hits = 0
+    for approx_row, exact_row in zip(approx_ids, exact_ids):
+        exact = {int(i) for i in exact_row[:k] if i >= 0}
+        hits += len(exact.intersection(int(i) for i in approx_row[:k] if i >= 0))
+    total = sum(len([i for i in row[:k] if i >= 0]) for row in exact_ids)
+    return hits / total if total else 1.0
+
+
+def measure_latency(index, queries, k, repeats=1):
+    """
+    Söktid per fråga i millisekunder (en fråga åt gången)
+    """
+    timings = []
+    for _ in range(repeats):
+        for row in range(len(queries)):
+            start = time.perf_counter()
+            index.search(queries[row:row + 1], k)
+            timings.append((time.perf_counter() - start) * 1000)
+    return latency_summary(timings)
+
+
+def latency_summary(timings_ms):
+    """
+    Medel och percentiler (p50/p95/p99) för en lista med tider i millisekunder
+    """
+    timings = np.asarray(timings_ms, dtype=np.float64)
+    return {
+        "mean_ms": float(timings.mean()),
+        "p50_ms": float(np.percentile(timings, 50)),
+        "p95_ms": float(np.percentile(timings, 95)),
+        "p99_ms": float(np.percentile(timings, 99)),
+    }
+
+
+def compare_index_types(embeddings, queries=None, k=10, configs=None, n_queries=200, seed=42,
+                        measure_load=False):
+    """
+    Jämför indextyper mot det exakta indexet
+
+    Args:
+        embeddings: Korpusens vektorer
+        queries: Frågevektorer (standard: ett slumpurval ur korpusen)
+        k: Antal grannar för recall@k
+        configs: Lista med dicts som skickas till build_index (måste ha 'index_type')
+        measure_load: Om True, mät även laddtid och RSS med och utan minnesmappning
+
+    Returns:
+        Lista med en rad per konfiguration
+    """
+    embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+    if queries is None:
+        rng = np.random.default_rng(seed)
+        rows = rng.choice(len(embeddings), size=min(n_queries, len(embeddings)), replace=False)
+        queries = embeddings[rows]
+    queries = np.ascontiguousarray(queries, dtype=np.float32)
+    k = min(k, len(embeddings))
+
+    if configs is None:
+        configs = [{"index_type": index_type} for index_type in INDEX_TYPES]
+
+    exact = build_index(embeddings, "flat")
+    _, exact_ids = exact.search(queries, k)
+
+    report = []
+    for config in configs:
+        config = {key: value for key, value in config.items()
+                  if key == "index_type" or key in INDEX_PARAMS.get(config["index_type"], ())}
+        start = time.perf_counter()
+        index = build_index(embeddings, **config)
+        build_seconds = time.perf_counter() - start
+
+        _, ids = index.search(queries, k)
+        row = {
+            "config": config,
+            "n_vectors": int(len(embeddings)),
+            "k": int(k),
+            f"recall@{k}": recall_at_k(ids, exact_ids, k),
+            "build_seconds": build_seconds,
+            "memory_bytes": index_memory_bytes(index),
+        }
+        row.update(measure_latency(index, queries, k))
+        if measure_load:
+            row.update(_measure_saved_index(index))
+        report.append(row)
+    return report
+
+
+def _measure_saved_index(index):
+    import faiss
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "index.faiss")
+        faiss.write_index(index, path)
+        in_ram = measure_index_load(path, mmap=False)
+        mapped = measure_index_load(path, mmap=True)
+    return {
+        "load_ms": in_ram["load_ms"],
+        "load_rss_mb": in_ram["rss_mb"],
+        "mmap_load_ms": mapped["load_ms"],
+        "mmap_rss_mb": mapped["rss_mb"],
+    }
+
+
+def write_report(report, json_path, markdown_path=None):
+    """
+    Sparar jämförelsen som JSON och (valfritt) som en markdowntabell
+    """
+    with open(json_path, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+
+    if markdown_path:
+        lines = [
+            "# Jämförelse av indextyper",
+            "",
+            "| Index | Parametrar | Recall@k | p50 (ms) | p99 (ms) | Byggtid (s) | Minne (kB) "
+            "| Laddning (ms) | RSS (MB) | mmap-laddning (ms) | mmap-RSS (MB) |",
+            "|-------|------------|----------|----------|----------|-------------|------------"
+            "|---------------|----------|--------------------|---------------|",
+        ]
+
+        def fmt(value, digits):
+            return "-" if value is None else f"{value:.{digits}f}"
+
+        for row in report:
+            config = dict(row["config"])
+            index_type = config.pop("index_type")
+            params = ", ".join(f"{key}={'auto' if value is None else value}"
+                               for key, value in config.items()) or "-"
+            recall = row[f"recall@{row['k']}"]
+            lines.append(
+                f"| {index_type} | {params} | {recall:.3f} | {row['p50_ms']:.3f} | "
+                f"{row['p99_ms']:.3f} | {row['build_seconds']:.2f} | {row['memory_bytes'] / 1e3:.1f} | "
+                f"{fmt(row.get('load_ms'), 1)} | {fmt(row.get('load_rss_mb'), 1)} | "
+                f"{fmt(row.get('mmap_load_ms'), 1)} | {fmt(row.get('mmap_rss_mb'), 1)} |"
+            )
+        lines.append("")
+        with open(markdown_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines))
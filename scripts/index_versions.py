@@ -0,0 +1,266 @@
+"""
+Versionerade indexkataloger med manifest
+Varje indexering skrivs till en egen katalog och publiceras först när
+allt är skrivet, så att en sökprocess aldrig ser ett index och en
+bidragsdata från olika byggen:
+
+    data/index/
+        CURRENT                      - id för publicerad version (byts atomiskt)
+        versions/
+            20261018-101500-3f9c2a/
+                manifest.json        - modell, dimension, antal rader, checksummor, byggtid
+                index.faiss          - FAISS-index
+                store/               - bidragsdata (scripts/grant_store.py)
+                lexical/             - BM25-index (scripts/lexical_index.py)
+                delta/               - bidrag tillagda med upsert sedan senaste kompaktering
+                lexical_delta/       - BM25-index för delta/
+                tombstones.npy       - borttagna eller ersatta rader (scripts/live_index.py)
+
+Publiceringen sker i två atomiska steg: byggkatalogen (*.tmp) döps om
+till sitt versions-id och därefter ersätts CURRENT. Sökprocesser läser
+CURRENT och byter till den nya versionen utan omstart (se GrantSearcher).
+
+Användning:
+    version_id, build_path = begin_version()
+    faiss.write_index(index, os.path.join(build_path, INDEX_FILE))
+    write_store(grants, os.path.join(build_path, STORE_DIR))
+    manifest = publish_version(build_path, model=encoder.cache_id, dimension=384, rows=len(grants))
+
+    python scripts/index_versions.py            # lista versioner
+    python scripts/index_versions.py --verify   # kontrollera checksummor för CURRENT
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import sys
+import uuid
+from datetime import datetime
+
+DEFAULT_INDEX_ROOT = os.environ.get("GRANTS_INDEX_ROOT", "data/index")
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+MANIFEST_FILE = "manifest.json"
+INDEX_FILE = "index.faiss"
+STORE_DIR = "store"
+LEXICAL_DIR = "lexical"
+DELTA_STORE_DIR = "delta"
+DELTA_LEXICAL_DIR = "lexical_delta"
+TOMBSTONES_FILE = "tombstones.npy"
+MANIFEST_FORMAT = 1
+# Antal versioner som sparas på disk (inklusive den publicerade)
+KEEP_VERSIONS = 3
+
+
+def versions_path(root=DEFAULT_INDEX_ROOT):
+    return os.path.join(root, VERSIONS_DIR)
+
+
+def version_path(version_id, root=DEFAULT_INDEX_ROOT):
+    return os.path.join(root, VERSIONS_DIR, version_id)
+
+
+def begin_version(root=DEFAULT_INDEX_ROOT):
+    """
+    Skapar en byggkatalog för en ny version
+
+    Returns:
+        (version_id, build_path) - skriv indexfilerna i build_path
+    """
+    version_id = f"{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}"
+    build_path = version_path(version_id, root) + ".tmp"
+    os.makedirs(build_path)
+    return version_id, build_path
+
+
+def file_checksum(path, chunk_size=1 << 20):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _list_files(path):
+    files = []
+    for dir_path, _, names in os.walk(path):
+        for name in names:
+            full_path = os.path.join(dir_path, name)
+            relative = os.path.relpath(full_path, path).replace(os.sep, "/")
+            if relative != MANIFEST_FILE:
+                files.append(relative)
+    return sorted(files)
+
+
+def link_tree(source, target):
+    """
+    Kopierar en katalog med hårda länkar (vanlig kopia om länkar inte går)
+
+    Oförändrade filer från föregående version delas då utan att skrivas om.
+    """
+    for dir_path, _, names in os.walk(source):
+        target_dir = os.path.join(target, os.path.relpath(dir_path, source))
+        os.makedirs(target_dir, exist_ok=True)
+        for name in names:
+            try:
+                os.link(os.path.join(dir_path, name), os.path.join(target_dir, name))
+            except OSError:
+                shutil.copy2(os.path.join(dir_path, name), os.path.join(target_dir, name))
+
+
+def publish_version(build_path, root=DEFAULT_INDEX_ROOT, keep=KEEP_VERSIONS, known_files=None, **fields):
+    """
+    Skriver manifestet och publicerar byggkatalogen som aktuell version
+
+    Args:
+        build_path: Katalog från begin_version()
+        keep: Antal versioner att behålla på disk (äldre tas bort)
+        known_files: Checksummor ur en tidigare versions manifest för filer som
+                     länkats oförändrade därifrån (räknas då inte om)
+        **fields: Byggdata till manifestet, t.ex. model, dimension, rows, index_type
+
+    Returns:
+        Manifestet (dict)
+    """
+    version_id = os.path.basename(build_path.rstrip("/\\"))
+    if version_id.endswith(".tmp"):
+        version_id = version_id[:-len(".tmp")]
+
+    manifest = {
+        "format": MANIFEST_FORMAT,
+        "version": version_id,
+        "built_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    manifest.update(fields)
+    known_files = known_files or {}
+    manifest["files"] = {}
+    for relative in _list_files(build_path):
+        size = os.path.getsize(os.path.join(build_path, relative))
+        known = known_files.get(relative)
+        if known and known["size"] == size:
+            manifest["files"][relative] = known
+        else:
+            manifest["files"][relative] = {"size": size, "sha256": file_checksum(os.path.join(build_path, relative))}
+    with open(os.path.join(build_path, MANIFEST_FILE), "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+        f.flush()
+        os.fsync(f.fileno())
+
+    # Steg 1: byggkatalogen får sitt slutliga namn
+    final_path = version_path(version_id, root)
+    os.replace(build_path, final_path)
+
+    # Steg 2: CURRENT pekar om till den nya versionen
+    current_path = os.path.join(root, CURRENT_FILE)
+    tmp_path = current_path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(version_id + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, current_path)
+
+    prune_versions(root, keep)
+    return manifest
+
+
+def current_version(root=DEFAULT_INDEX_ROOT):
+    """
+    Id för publicerad version, eller None om ingen finns
+    """
+    try:
+        with open(os.path.join(root, CURRENT_FILE), "r", encoding="utf-8") as f:
+            return f.read().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+def read_manifest(version_id, root=DEFAULT_INDEX_ROOT):
+    with open(os.path.join(version_path(version_id, root), MANIFEST_FILE), "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def verify_version(version_id, root=DEFAULT_INDEX_ROOT, checksums=False):
+    """
+    Kontrollerar att versionens filer stämmer med manifestet
+
+    Storlekarna kontrolleras alltid; checksummorna bara med checksums=True
+    (läser alla filer).
+
+    Returns:
+        Lista med fel (tom om versionen är hel)
+    """
+    path = version_path(version_id, root)
+    try:
+        manifest = read_manifest(version_id, root)
+    except (OSError, ValueError) as e:
+        return [f"manifest: {e}"]
+    errors = []
+    for relative, expected in manifest.get("files", {}).items():
+        full_path = os.path.join(path, relative)
+        if not os.path.exists(full_path):
+            errors.append(f"{relative}: saknas")
+        elif os.path.getsize(full_path) != expected["size"]:
+            errors.append(f"{relative}: fel storlek")
+        elif checksums and file_checksum(full_path) != expected["sha256"]:
+            errors.append(f"{relative}: fel checksumma")
+    return errors
+
+
+def list_versions(root=DEFAULT_INDEX_ROOT):
+    """
+    Publicerade versioner, äldst först (ofullständiga byggen räknas inte)
+    """
+    path = versions_path(root)
+    if not os.path.isdir(path):
+        return []
+    return sorted(name for name in os.listdir(path)
+                  if not name.endswith(".tmp") and os.path.exists(os.path.join(path, name, MANIFEST_FILE)))
+
+
+def prune_versions(root=DEFAULT_INDEX_ROOT, keep=KEEP_VERSIONS):
+    """
+    Tar bort äldre versioner
+
+    Den publicerade versionen tas aldrig bort. Föregående versioner sparas
+    så att sökprocesser som ännu inte bytt kan läsa klart.
+    """
+    current = current_version(root)
+    old = [version_id for version_id in list_versions(root) if version_id != current]
+    removed = []
+    for version_id in old[:max(0, len(old) - max(0, keep - 1))]:
+        try:
+            shutil.rmtree(version_path(version_id, root))
+            removed.append(version_id)
+        except OSError:
+            # T.ex. Windows där en annan process fortfarande har filerna öppna
+            pass
+    return removed
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Visar och kontrollerar versionerade index")
+    parser.add_argument("--root", default=DEFAULT_INDEX_ROOT)
+    parser.add_argument("--verify", action="store_true", help="Kontrollera checksummor för publicerad version")
+    args = parser.parse_args()
+
+    current = current_version(args.root)
+    if current is None:
+        print(f"❌ Ingen publicerad version i {args.root}. Kör först: python scripts/fetch_and_index_grants.py")
+        sys.exit(1)
+
+    for version_id in list_versions(args.root):
+        manifest = read_manifest(version_id, args.root)
+        marker = "→" if version_id == current else " "
+        print(f"{marker} {version_id}  {manifest.get('grants', manifest.get('rows', '?'))} bidrag  dim {manifest.get('dimension', '?')}  "
+              f"{manifest.get('index_type', '?')}  {manifest.get('model', '?')}  byggd {manifest['built_at']}")
+
+    if args.verify:
+        errors = verify_version(current, args.root, checksums=True)
+        if errors:
+            print(f"\n❌ Version {current} är skadad:")
+            for error in errors:
+                print(f"   {error}")
+            sys.exit(1)
+        print(f"\n✅ Version {current} stämmer med manifestet")
@@ -0,0 +1,217 @@
+"""
+Strömmande indexering med begränsat minne
+Bidragen går genom en kedja av generatorer, en batch i taget, så att
+varken bidragen, texterna eller deras embeddings behöver ligga i minnet
+för hela korpusen samtidigt:
+
+    källa -> normalisering -> dubblettfilter (id-mängd) -> batchar
+          -> embeddings (via cachen) -> FAISS-index (i omgångar)
+          -> store och BM25-index (skrivs löpande)
+
+En källa är vilken iterable som helst med bidrag i samma format som
+create_searchable_text använder (id, title, description, agency,
+category, ...); råposter i ett annat format mappas med normalize. Det som
+fortfarande växer med korpusen är FAISS-indexet självt, mängden med sedda
+id:n, BM25-postningarna (~12 byte per term och bidrag) och
+embedding-cachen. Cachen hålls under INGEST_CACHE_ENTRIES vektorer
+(GRANTS_INGEST_CACHE_ENTRIES); bidrag utöver gränsen bäddas in utan att
+cachas, och cache_path=None stänger av cachen helt.
+
+Användning:
+    from scripts.ingest import ingest
+    from scripts.fetch_and_index_grants import iter_grants_gov
+
+    manifest = ingest(iter_grants_gov(), index_params={"index_type": "hnsw"})
+
+    python scripts/ingest.py --source demo
+    python scripts/ingest.py --source synthetic --count 200000 --batch-size 4096
+    python scripts/ingest.py --source jsonl --path statsbidrag.jsonl
+    python scripts/ingest.py --source sqlite --path statsbidrag.db --query "SELECT * FROM statsbidrag"
+
+Filer och databaser läses med adaptrarna i scripts/grant_sources.py.
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import time
+from itertools import islice
+
+import faiss
+import numpy as np
+
+# Gör paketet scripts importerbart när filen körs direkt som skript
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.embedding_cache import EmbeddingCache, embed_with_cache, DEFAULT_CACHE_PATH
+from scripts.encoder import MODEL_NAME, get_encoder
+from scripts.fetch_and_index_grants import (create_demo_data, create_embeddings, create_lexical_text,
+                                            create_searchable_text, dedupe_grants, iter_grants_gov)
+from scripts.grant_store import StoreWriter
+from scripts.index_factory import INDEX_TYPES, STORAGE_TYPES, DEFAULT_TRAIN_SIZE, IncrementalIndexBuilder
+from scripts.index_versions import (DEFAULT_INDEX_ROOT, INDEX_FILE, STORE_DIR, LEXICAL_DIR, begin_version,
+                                    publish_version)
+from scripts.lexical_index import LexicalIndexWriter
+
+# Antal bidrag per batch genom embedding och indexering
+INGEST_BATCH_SIZE = int(os.environ.get("GRANTS_INGEST_BATCH", "2048"))
+# Max antal vektorer i embedding-cachen under indexeringen (0 = obegränsat)
+INGEST_CACHE_ENTRIES = int(os.environ.get("GRANTS_INGEST_CACHE_ENTRIES", "500000"))
+
+
+def batched(iterable, size):
+    """
+    Delar en ström i listor om högst size element
+    """
+    iterator = iter(iterable)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def ingest(source, root=DEFAULT_INDEX_ROOT, index_params=None, embed_fn=None, normalize=None,
+           batch_size=INGEST_BATCH_SIZE, model_name=MODEL_NAME, train_size=DEFAULT_TRAIN_SIZE,
+           cache_path=DEFAULT_CACHE_PATH, cache_entries=INGEST_CACHE_ENTRIES, on_batch=None, **manifest_fields):
+    """
+    Indexerar en ström av bidrag och publicerar den som en ny indexversion
+
+    Args:
+        source: Iterable med bidrag (eller råposter, se normalize)
+        root: Indexroten (se scripts/index_versions.py)
+        index_params: Argument till build_index (index_type, storage, nlist, ...)
+        embed_fn: Funktion som tar en lista texter och returnerar en matris
+        normalize: Valfri funktion råpost -> bidrag (None = hoppa över posten)
+        batch_size: Antal bidrag per batch
+        train_size: Antal vektorer att träna IVF/komprimerad lagring på
+        cache_path: Embedding-cachen (None = ingen cache, allt bäddas in)
+        cache_entries: Max antal vektorer i cachen (0 = obegränsat)
+        on_batch: Valfri callback(bidrag, vektorer) per batch, t.ex. för en rapport
+        **manifest_fields: Extra fält till manifestet
+
+    Returns:
+        Manifestet för den publicerade versionen
+    """
+    index_params = dict(index_params or {})
+    embed_fn = embed_fn or create_embeddings
+    cache_id = get_encoder(model_name).cache_id
+    embedding_cache = EmbeddingCache(cache_id, cache_path, cache_entries or None) if cache_path else None
+
+    grants = source
+    if normalize is not None:
+        grants = (grant for grant in map(normalize, source) if grant is not None)
+    grants = dedupe_grants(grants)
+
+    version_id, build_path = begin_version(root)
+    store = StoreWriter(os.path.join(build_path, STORE_DIR))
+    lexical = LexicalIndexWriter(os.path.join(build_path, LEXICAL_DIR))
+    builder = IncrementalIndexBuilder(train_size, **index_params)
+    # Nycklarna behövs för att rensa cachen från bidrag som inte längre finns
+    cache_keys = set()
+    start = time.perf_counter()
+    try:
+        for batch in batched(grants, batch_size):
+            texts = [create_searchable_text(grant) for grant in batch]
+            if embedding_cache is None:
+                vectors = np.asarray(embed_fn(texts), dtype=np.float32)
+            else:
+                cache_keys.update(embedding_cache.key(text) for text in texts)
+                vectors = embed_with_cache(texts, embed_fn, embedding_cache, prune=False, save=False)
+            builder.add(vectors)
+            for grant in batch:
+                store.append(grant)
+                lexical.add(create_lexical_text(grant))
+            if on_batch is not None:
+                on_batch(batch, vectors)
+            print(f"  {store.count} bidrag indexerade ({time.perf_counter() - start:.1f} s)")
+
+        if not store.count:
+            raise ValueError("Källan gav inga bidrag")
+        index = builder.finish()
+        if embedding_cache is not None:
+            if embedding_cache.skipped:
+                print(f"  ⚠️ Embedding-cachen är full ({cache_entries} vektorer), "
+                      f"{embedding_cache.skipped} nya vektorer cachades inte")
+            embedding_cache.prune(cache_keys)
+            embedding_cache.save()
+
+        faiss.write_index(index, os.path.join(build_path, INDEX_FILE))
+        store.close()
+        n_terms = lexical.close()
+    except BaseException:
+        store.abort()
+        shutil.rmtree(build_path, ignore_errors=True)
+        raise
+
+    manifest = publish_version(
+        build_path, root,
+        model=cache_id,
+        dimension=int(index.d),
+        rows=int(index.ntotal),
+        index_type=index_params.get("index_type", "flat"),
+        storage=index_params.get("storage", "float32"),
+        index_params=index_params,
+        lexical_terms=int(n_terms),
+        **manifest_fields,
+    )
+    print(f"  ✅ Indexversion {version_id} publicerad: {store.count} bidrag på "
+          f"{time.perf_counter() - start:.1f} s")
+    return manifest
+
+
+def _synthetic_source(args):
+    from scripts.synthetic_corpus import generate_grants
+
+    return generate_grants(args.count)
+
+
+def _file_source(source_type):
+    def create(args):
+        from scripts.grant_sources import load_mapping, open_source
+
+        if not args.path:
+            raise SystemExit(f"--source {source_type} kräver --path")
+        kwargs = {"defaults": dict(item.split("=", 1) for item in args.default)}
+        if args.mapping:
+            kwargs["mapping"] = load_mapping(args.mapping)
+        if source_type == "sqlite" and args.query:
+            kwargs["query"] = args.query
+        return open_source(args.path, source_type, **kwargs)
+
+    return create
+
+
+# Inbyggda källor för kommandoraden: namn -> funktion(args) som ger en ström av bidrag
+SOURCES = {
+    "grants-gov": lambda args: iter_grants_gov(),
+    "demo": lambda args: create_demo_data(),
+    "synthetic": _synthetic_source,
+    "jsonl": _file_source("jsonl"),
+    "csv": _file_source("csv"),
+    "sqlite": _file_source("sqlite"),
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Strömmande indexering av bidrag")
+    parser.add_argument("--source", choices=sorted(SOURCES), default="grants-gov")
+    parser.add_argument("--count", type=int, default=10000, help="Antal bidrag (synthetic)")
+    parser.add_argument("--path", help="Fil eller databas (jsonl, csv, sqlite)")
+    parser.add_argument("--mapping", metavar="FIL", help="JSON-fil med bidragsfält -> kolumn (jsonl, csv, sqlite)")
+    parser.add_argument("--query", help="SQL-fråga (sqlite, standard: SELECT * FROM statsbidrag)")
+    parser.add_argument("--default", action="append", default=[], metavar="FÄLT=VÄRDE",
+                        help="Värde för fält som saknas i källan, t.ex. category=Statsbidrag")
+    parser.add_argument("--batch-size", type=int, default=INGEST_BATCH_SIZE)
+    parser.add_argument("--index-type", choices=INDEX_TYPES, default="flat")
+    parser.add_argument("--storage", choices=STORAGE_TYPES, default="float32")
+    parser.add_argument("--root", default=DEFAULT_INDEX_ROOT)
+    args = parser.parse_args()
+
+    source = SOURCES[args.source](args)
+    ingest(source, args.root, {"index_type": args.index_type, "storage": args.storage},
+           batch_size=args.batch_size, data_source=args.path or args.source)
+    if getattr(source, "skipped", 0):
+        print(f"  ⚠️ {source.skipped} poster utan id hoppades över")
@@ -0,0 +1,325 @@
+"""
+Lexikalt BM25-index över bidragen
+Byggs vid indexeringen bredvid FAISS-indexet och fångar det som
+embeddings missar: exakta programnummer ('EPA-2024-007'), CFDA-nummer
+och myndighetsförkortningar. Sökningar besvaras utan AI-modellen.
+
+Sammansatta identifierare indexeras både hela och uppdelade, så att
+'EPA-2024-007' matchar frågan 'EPA-2024-007' exakt men även 'EPA'.
+
+Katalogstruktur (inverterat index i CSR-form):
+    vocabulary.json   - termerna i sorterad ordning
+    term_offsets.npy  - int64 start-offset per term i posting-listorna (V + 1 värden)
+    doc_ids.npy       - int32 FAISS-rad per posting
+    term_freqs.npy    - float32 termfrekvens per posting
+    doc_lengths.npy   - float32 antal termer per bidrag
+    meta.json         - antal bidrag, medellängd och BM25-parametrar
+"""
+
+import json
+import math
+import os
+import re
+import shutil
+from collections import Counter
+
+import numpy as np
+
+DEFAULT_LEXICAL_PATH = "data/grants_lexical"
+
+# BM25-parametrar
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Ord och sammansatta identifierare ('epa-2024-007', '10.001', 'k-12')
+TOKEN_PATTERN = re.compile(r"\w+(?:[-./]\w+)*")
+SEPARATOR_PATTERN = re.compile(r"[-./]")
+
+
+def tokenize(text):
+    """
+    Delar upp en text i termer (gemener); sammansatta identifierare ger
+    både hela termen och delarna
+    """
+    tokens = []
+    for match in TOKEN_PATTERN.findall(str(text).casefold()):
+        tokens.append(match)
+        if SEPARATOR_PATTERN.search(match):
+            tokens.extend(part for part in SEPARATOR_PATTERN.split(match) if part)
+    return tokens
+
+
+def looks_like_identifier(query):
+    """
+    True om frågan bara består av identifierare (varje ord innehåller en siffra)
+    """
+    words = TOKEN_PATTERN.findall(str(query).casefold())
+    return bool(words) and all(any(ch.isdigit() for ch in word) for word in words)
+
+
+def build_lexical_index(texts, path=DEFAULT_LEXICAL_PATH, k1=BM25_K1, b=BM25_B):
+    """
+    Bygger och sparar ett BM25-index (atomiskt via en temporär katalog)
+
+    Args:
+        texts: En text per FAISS-rad (kan vara en generator)
+        path: Katalog att spara indexet i
+
+    Returns:
+        Antal termer i vokabulären
+    """
+    writer = LexicalIndexWriter(path, k1, b)
+    for text in texts:
+        writer.add(text)
+    return writer.close()
+
+
+class LexicalIndexWriter:
+    """
+    Bygger ett BM25-index en text i taget
+
+    Postningarna samlas som kompakta numpy-block (term-id, rad, frekvens)
+    i stället för Python-listor per term och sorteras per term först i
+    close(), så minnet är ungefär 12 byte per postning.
+    """
+
+    FLUSH_SIZE = 1 << 16
+
+    def __init__(self, path=DEFAULT_LEXICAL_PATH, k1=BM25_K1, b=BM25_B):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._terms = {}
+        self._blocks = []
+        self._term_ids, self._doc_ids, self._term_freqs = [], [], []
+        self._doc_lengths = []
+        self.n_docs = 0
+
+    def add(self, text):
+        counts = Counter(tokenize(text))
+        row = self.n_docs
+        self._doc_lengths.append(sum(counts.values()))
+        for term, count in counts.items():
+            self._term_ids.append(self._terms.setdefault(term, len(self._terms)))
+            self._doc_ids.append(row)
+            self._term_freqs.append(count)
+        self.n_docs += 1
+        if len(self._term_ids) >= self.FLUSH_SIZE:
+            self._flush()
+
+    def _flush(self):
+        if self._term_ids:
+            self._blocks.append((np.array(self._term_ids, dtype=np.int32), np.array(self._doc_ids, dtype=np.int32),
+                                 np.array(self._term_freqs, dtype=np.float32)))
+            self._term_ids, self._doc_ids, self._term_freqs = [], [], []
+
+    def close(self):
+        """
+        Sorterar postningarna per term och sparar indexet
+
+        Returns:
+            Antal termer i vokabulären
+        """
+        self._flush()
+        terms = list(self._terms)
+        vocabulary = sorted(terms)
+        # Term-id i ordningen de först sågs -> position i den sorterade vokabulären
+        rank = np.empty(len(terms), dtype=np.int32)
+        rank[sorted(range(len(terms)), key=terms.__getitem__)] = np.arange(len(terms), dtype=np.int32)
+
+        if self._blocks:
+            term_ids = rank[np.concatenate([block[0] for block in self._blocks])]
+            doc_ids = np.concatenate([block[1] for block in self._blocks])
+            term_freqs = np.concatenate([block[2] for block in self._blocks])
+        else:
+            term_ids = np.zeros(0, dtype=np.int32)
+            doc_ids = np.zeros(0, dtype=np.int32)
+            term_freqs = np.zeros(0, dtype=np.float32)
+        self._blocks = []
+        # Stabil sortering: inom en term ligger raderna kvar i stigande ordning
+        order = np.argsort(term_ids, kind="stable")
+        term_offsets = np.zeros(len(vocabulary) + 1, dtype=np.int64)
+        term_offsets[1:] = np.cumsum(np.bincount(term_ids, minlength=len(vocabulary)))
+
+        meta = {
+            "n_docs": self.n_docs,
+            "avg_doc_length": float(np.mean(self._doc_lengths)) if self.n_docs else 0.0,
+            "k1": self.k1,
+            "b": self.b,
+        }
+
+        tmp_path = self.path.rstrip("/\\") + ".tmp"
+        if os.path.exists(tmp_path):
+            shutil.rmtree(tmp_path)
+        os.makedirs(tmp_path)
+
+        with open(os.path.join(tmp_path, "vocabulary.json"), "w", encoding="utf-8") as f:
+            json.dump(vocabulary, f, ensure_ascii=False)
+        np.save(os.path.join(tmp_path, "term_offsets.npy"), term_offsets)
+        np.save(os.path.join(tmp_path, "doc_ids.npy"), doc_ids[order])
+        np.save(os.path.join(tmp_path, "term_freqs.npy"), term_freqs[order])
+        np.save(os.path.join(tmp_path, "doc_lengths.npy"), np.array(self._doc_lengths, dtype=np.float32))
+        with open(os.path.join(tmp_path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f, indent=2)
+
+        # Byt ut den gamla katalogen så att läsare aldrig ser ett halvskrivet index
+        old_path = self.path.rstrip("/\\") + ".old"
+        if os.path.exists(self.path):
+            if os.path.exists(old_path):
+                shutil.rmtree(old_path)
+            os.replace(self.path, old_path)
+        os.replace(tmp_path, self.path)
+        if os.path.exists(old_path):
+            shutil.rmtree(old_path)
+
+        return len(vocabulary)
+
+
+class LexicalIndex:
+    """
+    Minnesmappad läsare för ett BM25-index
+
+    Bara posting-listorna för frågans termer läses, så en sökning kostar
+    proportionellt mot antalet träffar och inte mot antalet bidrag.
+    """
+
+    def __init__(self, path=DEFAULT_LEXICAL_PATH):
+        self.path = path
+        with open(os.path.join(path, "vocabulary.json"), "r", encoding="utf-8") as f:
+            self.vocabulary = {term: i for i, term in enumerate(json.load(f))}
+        with open(os.path.join(path, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        self.n_docs = meta["n_docs"]
+        self.avg_doc_length = meta["avg_doc_length"] or 1.0
+        self.k1 = meta["k1"]
+        self.b = meta["b"]
+        self.term_offsets = np.load(os.path.join(path, "term_offsets.npy"), mmap_mode="r")
+        self.doc_ids = np.load(os.path.join(path, "doc_ids.npy"), mmap_mode="r")
+        self.term_freqs = np.load(os.path.join(path, "term_freqs.npy"), mmap_mode="r")
+        self.doc_lengths = np.load(os.path.join(path, "doc_lengths.npy"), mmap_mode="r")
+
+    def __len__(self):
+        return self.n_docs
+
+    def postings(self, term):
+        """
+        (rader, termfrekvenser, dokumentlängder) för en term, eller None
+        """
+        term_id = self.vocabulary.get(term)
+        if term_id is None:
+            return None
+        start, end = int(self.term_offsets[term_id]), int(self.term_offsets[term_id + 1])
+        ids = np.asarray(self.doc_ids[start:end])
+        return ids, np.asarray(self.term_freqs[start:end]), np.asarray(self.doc_lengths[ids])
+
+    def search(self, query, k=5, mask=None):
+        """
+        BM25-sökning
+
+        Args:
+            query: Sökfråga
+            k: Max antal träffar
+            mask: Valfri bool-array över raderna (se scripts/filters.py)
+
+        Returns:
+            (scores, indices) sorterade med högst poäng först; kan vara färre än k
+        """
+        return bm25_search([(self, 0)], query, k, mask)
+
+
+class SegmentedLexicalIndex:
+    """
+    Flera BM25-index efter varandra (bas + delta) som ett index
+
+    Segmentet på plats i har sina rader från starts[i]. Poängen räknas med
+    gemensam statistik (antal dokument, dokumentfrekvens, snittlängd), så
+    ett litet delta-segment viktas som om det låg i basindexet.
+    """
+
+    def __init__(self, segments, starts):
+        self.segments = list(segments)
+        self.starts = [int(start) for start in starts]
+        self.n_docs = sum(segment.n_docs for segment in self.segments)
+        self.avg_doc_length = (sum(segment.avg_doc_length * segment.n_docs for segment in self.segments)
+                               / max(1, self.n_docs)) or 1.0
+        self.k1 = self.segments[0].k1
+        self.b = self.segments[0].b
+        self.vocabulary = {}
+        for segment in self.segments:
+            self.vocabulary.update(dict.fromkeys(segment.vocabulary))
+
+    def __len__(self):
+        return self.n_docs
+
+    def search(self, query, k=5, mask=None):
+        return bm25_search(list(zip(self.segments, self.starts)), query, k, mask,
+                           n_docs=self.n_docs, avg_doc_length=self.avg_doc_length)
+
+
+def bm25_search(segments, query, k=5, mask=None, n_docs=None, avg_doc_length=None):
+    """
+    BM25 över ett eller flera segment
+
+    Args:
+        segments: Lista med (LexicalIndex, första rad)
+        n_docs / avg_doc_length: Gemensam statistik (standard: första segmentets)
+
+    Returns:
+        (scores, indices) sorterade med högst poäng först; kan vara färre än k
+    """
+    first = segments[0][0]
+    n_docs = first.n_docs if n_docs is None else n_docs
+    avg_doc_length = avg_doc_length or first.avg_doc_length
+    k1, b = first.k1, first.b
+
+    ids_parts, score_parts = [], []
+    for term in dict.fromkeys(tokenize(query)):
+        postings = [(segment.postings(term), start) for segment, start in segments]
+        postings = [(found, start) for found, start in postings if found is not None]
+        if not postings:
+            continue
+        df = sum(len(ids) for (ids, _, _), _ in postings)
+        idf = math.log(1.0 + (n_docs - df + 0.5) / (df + 0.5))
+        for (ids, tf, lengths), start in postings:
+            norm = k1 * (1.0 - b + b * lengths / avg_doc_length)
+            ids_parts.append(ids.astype(np.int64) + start)
+            score_parts.append(idf * tf * (k1 + 1.0) / (tf + norm))
+
+    if not ids_parts:
+        return np.zeros(0, dtype=np.float32), np.zeros(0, dtype=np.int64)
+
+    # Summera poängen per bidrag över frågans termer
+    candidates, inverse = np.unique(np.concatenate(ids_parts), return_inverse=True)
+    scores = np.bincount(inverse, weights=np.concatenate(score_parts)).astype(np.float32)
+    if mask is not None:
+        keep = mask[candidates]
+        candidates, scores = candidates[keep], scores[keep]
+
+    if len(scores) > k:
+        top = np.argpartition(-scores, k - 1)[:k]
+        candidates, scores = candidates[top], scores[top]
+    order = np.argsort(-scores, kind="stable")
+    return scores[order], candidates[order].astype(np.int64)
+
+
+def reciprocal_rank_fusion(rankings, k=5, rrf_k=60):
+    """
+    Slår ihop flera rankningar med Reciprocal Rank Fusion
+
+    Args:
+        rankings: Listor med rad-id i rangordning (bästa först)
+        k: Antal resultat
+        rrf_k: Utjämningskonstant (60 enligt Cormack et al.)
+
+    Returns:
+        (scores, indices) med högst sammanslagen poäng först
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, row in enumerate(ranking):
+            row = int(row)
+            if row >= 0:
+                fused[row] = fused.get(row, 0.0) + 1.0 / (rrf_k + rank + 1)
+    best = sorted(fused.items(), key=lambda item: -item[1])[:k]
+    return (np.array([score for _, score in best], dtype=np.float32),
+            np.array([row for row, _ in best], dtype=np.int64))
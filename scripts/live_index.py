@@ -0,0 +1,455 @@
+"""
+Uppdatering av det publicerade indexet per bidrag (upsert/delete)
+En full indexering bäddar in och skriver om hela katalogen även när bara
+några bidrag har ändrats. Här adresseras FAISS-vektorerna i stället med
+id (IndexIDMap2, eller IVF-indexets egna id:n), så att en dags ändringar
+kostar i proportion till ändringarna:
+
+    - upsert bäddar bara in nya/ändrade bidrag och lägger dem sist som
+      nya rader i ett delta-segment; den gamla raden tas bort ur FAISS
+      och markeras som borttagen (tombstone) för BM25 och filter
+    - delete tar bort raderna på samma sätt
+    - publish skriver en ny indexversion där basens store och BM25-index
+      länkas oförändrade från föregående version
+    - compact bygger om basen från levande bidrag (embeddings från cachen)
+      när för många rader är borttagna eller deltat har vuxit; kan köras i
+      bakgrunden medan upsert/delete fortsätter
+
+FAISS-id:t är bidragets rad i store + delta (rader återanvänds aldrig),
+så filter, BM25 och store kan fortsätta adressera rader. HNSW kan inte ta
+bort vektorer; där filtreras borttagna rader bort vid sökning tills
+indexet kompakteras.
+
+Användning:
+    live = LiveIndex()
+    live.upsert(changed_grants)
+    live.delete(["12345"])
+    live.publish()
+    if live.needs_compaction():
+        live.compact_in_background()
+
+    python scripts/live_index.py --stats
+    python scripts/live_index.py --upsert nya_bidrag.jsonl --delete 12345 67890
+    python scripts/live_index.py --compact
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from datetime import date
+
+import faiss
+import numpy as np
+
+# Gör paketet scripts importerbart när filen körs direkt som skript
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.embedding_cache import EmbeddingCache, embed_with_cache, DEFAULT_CACHE_PATH
+from scripts.encoder import MODEL_NAME, get_encoder
+from scripts.fetch_and_index_grants import create_embeddings, create_searchable_text, create_lexical_text
+from scripts.grant_store import GrantStore, parse_date, write_store
+from scripts.index_factory import base_index, build_index, with_id_map
+from scripts.index_versions import (DEFAULT_INDEX_ROOT, INDEX_FILE, STORE_DIR, LEXICAL_DIR, DELTA_STORE_DIR,
+                                    DELTA_LEXICAL_DIR, TOMBSTONES_FILE, begin_version, current_version,
+                                    link_tree, publish_version, read_manifest, version_path)
+from scripts.lexical_index import build_lexical_index
+
+# Kompaktera när andelen borttagna rader eller deltats storlek passerar gränserna
+MAX_DEAD_RATIO = float(os.environ.get("GRANTS_MAX_DEAD_RATIO", "0.2"))
+MAX_DELTA_RATIO = float(os.environ.get("GRANTS_MAX_DELTA_RATIO", "0.5"))
+
+# Manifestfält som sätts av publish_version och inte ärvs från föregående version
+_VERSION_FIELDS = ("format", "version", "built_at", "files")
+
+
+def _same_record(a, b):
+    return json.dumps(a, ensure_ascii=False, sort_keys=True) == json.dumps(b, ensure_ascii=False, sort_keys=True)
+
+
+class LiveIndex:
+    """
+    Det publicerade indexet öppnat för ändringar per bidrags-id
+
+    Ändringar görs i minnet och syns för sökprocesserna först efter
+    publish(). Metoderna är trådsäkra.
+    """
+
+    def __init__(self, root=DEFAULT_INDEX_ROOT, embed_fn=None, model_name=MODEL_NAME):
+        self.root = root
+        self.embed_fn = embed_fn or create_embeddings
+        self.cache_id = get_encoder(model_name).cache_id
+        self.embedding_cache = EmbeddingCache(self.cache_id, DEFAULT_CACHE_PATH)
+        self._lock = threading.RLock()
+        # Cachen används både av upsert och av en kompaktering i bakgrunden
+        self._cache_lock = threading.Lock()
+        # Ändringar som görs medan en kompaktering pågår spelas upp på den nya basen
+        self._pending = None
+        self._compaction = None
+
+        version_id = current_version(root)
+        if version_id is None:
+            raise FileNotFoundError(f"Ingen publicerad indexversion i {root}. "
+                                    f"Kör först: python scripts/fetch_and_index_grants.py")
+        self._open(version_id)
+
+    def _open(self, version_id):
+        path = version_path(version_id, self.root)
+        manifest = read_manifest(version_id, self.root)
+        if manifest.get("model") != self.cache_id:
+            raise ValueError(f"Indexversion {version_id} är byggd med {manifest.get('model')}, "
+                             f"inte {self.cache_id}; kör en full indexering")
+
+        self.index = with_id_map(faiss.read_index(os.path.join(path, INDEX_FILE)))
+        # HNSW-grafen kan inte ta bort noder; borttagna rader filtreras vid sökning
+        self.removable = not hasattr(base_index(self.index), "hnsw")
+        self.base = GrantStore(os.path.join(path, STORE_DIR))
+        delta_path = os.path.join(path, DELTA_STORE_DIR)
+        self.delta = []
+        if os.path.isdir(delta_path):
+            delta_store = GrantStore(delta_path)
+            self.delta = [delta_store[row] for row in range(len(delta_store))]
+            delta_store.close()
+        tombstones_path = os.path.join(path, TOMBSTONES_FILE)
+        self.dead = set(np.load(tombstones_path).tolist()) if os.path.exists(tombstones_path) else set()
+
+        ids = list(self.base.ids()) + [str(grant.get('id', '')) for grant in self.delta]
+        self.rows_by_id = {grant_id: row for row, grant_id in enumerate(ids) if row not in self.dead}
+        self.version = version_id
+        self.manifest = manifest
+        self.dirty = False
+
+    def reopen(self):
+        """
+        Öppnar den publicerade versionen på nytt, t.ex. efter en full
+        indexering (opublicerade ändringar kastas)
+        """
+        with self._lock:
+            self.base.close()
+            version_id = current_version(self.root)
+            if version_id is None:
+                raise FileNotFoundError(f"Ingen publicerad indexversion i {self.root}")
+            self._open(version_id)
+
+    @property
+    def total_rows(self):
+        return len(self.base) + len(self.delta)
+
+    def _record(self, row):
+        if row < len(self.base):
+            return self.base[row]
+        return self.delta[row - len(self.base)]
+
+    def get(self, grant_id):
+        """
+        Bidraget med id grant_id, eller None
+        """
+        with self._lock:
+            row = self.rows_by_id.get(str(grant_id))
+            return None if row is None else self._record(row)
+
+    def expired_ids(self, today=None):
+        """
+        Id:n för levande bidrag vars deadline har passerats
+        """
+        today = np.datetime64(today or date.today(), "D")
+        with self._lock:
+            deadlines = np.concatenate([
+                np.asarray(self.base.column("deadline"), dtype="datetime64[D]"),
+                np.array([parse_date(grant.get('deadline')) for grant in self.delta], dtype="datetime64[D]"),
+            ])
+            # NaT (deadline saknas) jämförs alltid som False
+            rows = np.flatnonzero(deadlines < today)
+            ids = self.base.ids()
+            return [ids[row] if row < len(ids) else str(self.delta[row - len(ids)].get('id', ''))
+                    for row in rows.tolist() if row not in self.dead]
+
+    def _embed(self, grants):
+        texts = [create_searchable_text(grant) for grant in grants]
+        # Cachen sparas först i publish()/compact(), inte vid varje upsert
+        with self._cache_lock:
+            return embed_with_cache(texts, self.embed_fn, self.embedding_cache, prune=False, save=False)
+
+    def _save_cache(self):
+        with self._cache_lock:
+            self.embedding_cache.save()
+
+    def _remove_rows(self, rows):
+        self.dead.update(rows)
+        if rows and self.removable:
+            self.index.remove_ids(np.array(rows, dtype=np.int64))
+
+    def upsert(self, grants):
+        """
+        Lägger till nya bidrag och ersätter ändrade (nyckel: bidragets id)
+
+        Oförändrade bidrag hoppas över; bara nya/ändrade texter bäddas in.
+
+        Returns:
+            {"added": n, "updated": n, "unchanged": n}
+        """
+        # Samma id flera gånger i en sats: den sista gäller
+        by_id = {}
+        for grant in grants:
+            by_id[str(grant.get('id', ''))] = grant
+
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("upsert", list(by_id.values())))
+
+            changed, old_rows = [], []
+            for grant_id, grant in by_id.items():
+                row = self.rows_by_id.get(grant_id)
+                if row is not None:
+                    if _same_record(self._record(row), grant):
+                        continue
+                    old_rows.append(row)
+                changed.append(grant)
+            counts = {"added": len(changed) - len(old_rows), "updated": len(old_rows),
+                      "unchanged": len(by_id) - len(changed)}
+            if not changed:
+                return counts
+
+            vectors = self._embed(changed)
+
+            self._remove_rows(old_rows)
+            start = self.total_rows
+            self.index.add_with_ids(vectors, np.arange(start, start + len(changed), dtype=np.int64))
+            for offset, grant in enumerate(changed):
+                self.rows_by_id[str(grant.get('id', ''))] = start + offset
+            self.delta.extend(changed)
+            self.dirty = True
+            return counts
+
+    def delete(self, grant_ids):
+        """
+        Tar bort bidrag per id (okända id:n ignoreras)
+
+        Returns:
+            Antal borttagna bidrag
+        """
+        grant_ids = [str(grant_id) for grant_id in grant_ids]
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append(("delete", grant_ids))
+            rows = [self.rows_by_id.pop(grant_id) for grant_id in dict.fromkeys(grant_ids)
+                    if grant_id in self.rows_by_id]
+            self._remove_rows(rows)
+            if rows:
+                self.dirty = True
+            return len(rows)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "version": self.version,
+                "grants": len(self.rows_by_id),
+                "rows": self.total_rows,
+                "vectors": int(self.index.ntotal),
+                "base_rows": len(self.base),
+                "delta_rows": len(self.delta),
+                "tombstones": len(self.dead),
+                "compacting": self._compaction is not None,
+            }
+
+    def needs_compaction(self, max_dead_ratio=MAX_DEAD_RATIO, max_delta_ratio=MAX_DELTA_RATIO):
+        """
+        True när borttagna rader eller deltat tar för stor del av indexet
+        """
+        with self._lock:
+            if not self.total_rows:
+                return False
+            return (len(self.dead) > max_dead_ratio * self.total_rows
+                    or len(self.delta) > max_delta_ratio * max(len(self.base), 1))
+
+    def _check_current(self):
+        published = current_version(self.root)
+        if published != self.version:
+            raise RuntimeError(f"Indexversion {published} har publicerats av någon annan sedan "
+                               f"{self.version} öppnades; öppna LiveIndex på nytt")
+
+    def _manifest_fields(self):
+        return {key: value for key, value in self.manifest.items() if key not in _VERSION_FIELDS}
+
+    def publish(self):
+        """
+        Publicerar ändringarna som en ny indexversion
+
+        Basens store och BM25-index länkas från föregående version; bara
+        FAISS-indexet, deltat och listan med borttagna rader skrivs.
+        Embeddings för nya bidrag sparas i embedding-cachen samtidigt.
+
+        Returns:
+            Manifestet för den nya versionen (None om inget ändrats)
+        """
+        with self._lock:
+            if not self.dirty:
+                return None
+            self._check_current()
+            parent_path = version_path(self.version, self.root)
+            version_id, build_path = begin_version(self.root)
+            try:
+                for name in (STORE_DIR, LEXICAL_DIR):
+                    if os.path.isdir(os.path.join(parent_path, name)):
+                        link_tree(os.path.join(parent_path, name), os.path.join(build_path, name))
+                faiss.write_index(self.index, os.path.join(build_path, INDEX_FILE))
+                if self.delta:
+                    write_store(self.delta, os.path.join(build_path, DELTA_STORE_DIR))
+                    build_lexical_index([create_lexical_text(grant) for grant in self.delta],
+                                        os.path.join(build_path, DELTA_LEXICAL_DIR))
+                if self.dead:
+                    np.save(os.path.join(build_path, TOMBSTONES_FILE), np.array(sorted(self.dead), dtype=np.int64))
+
+                # De länkade filerna är oförändrade och behöver inga nya checksummor
+                linked = {relative: entry for relative, entry in self.manifest.get("files", {}).items()
+                          if relative.split("/", 1)[0] in (STORE_DIR, LEXICAL_DIR)}
+                fields = self._manifest_fields()
+                fields.update(rows=int(self.index.ntotal), grants=len(self.rows_by_id),
+                              base_rows=len(self.base), delta_rows=len(self.delta),
+                              tombstones=len(self.dead), parent=self.version)
+                manifest = publish_version(build_path, self.root, known_files=linked, **fields)
+            except BaseException:
+                shutil.rmtree(build_path, ignore_errors=True)
+                raise
+
+            # Tillståndet i minnet stämmer redan; bara basens store öppnas från den nya katalogen
+            self.base.close()
+            self.base = GrantStore(os.path.join(version_path(version_id, self.root), STORE_DIR))
+            self.version = version_id
+            self.manifest = manifest
+            self.dirty = False
+        self._save_cache()
+        return manifest
+
+    def compact(self):
+        """
+        Bygger om basen från de levande bidragen och publicerar den
+
+        Embeddings hämtas ur cachen, så ingen text bäddas in på nytt. Under
+        bygget kan upsert/delete fortsätta; de ändringarna spelas upp på den
+        nya basen och publiceras direkt efteråt.
+
+        Returns:
+            Manifestet för den kompakterade versionen
+        """
+        with self._lock:
+            if self._compaction is not None and self._compaction is not threading.current_thread():
+                raise RuntimeError("En kompaktering pågår redan")
+            self._compaction = threading.current_thread()
+            # Opublicerade ändringar kommer med i ögonblicksbilden av de levande bidragen
+            self.publish()
+            self._pending = []
+            parent = self.version
+            grants = [self._record(row) for row in sorted(self.rows_by_id.values())]
+            fields = self._manifest_fields()
+            index_params = dict(self.manifest.get("index_params") or {})
+
+        try:
+            start = time.perf_counter()
+            vectors = self._embed(grants)
+            index = build_index(vectors, **index_params, ids=np.arange(len(grants)))
+            version_id, build_path = begin_version(self.root)
+            try:
+                faiss.write_index(index, os.path.join(build_path, INDEX_FILE))
+                write_store(grants, os.path.join(build_path, STORE_DIR))
+                n_terms = build_lexical_index([create_lexical_text(grant) for grant in grants],
+                                              os.path.join(build_path, LEXICAL_DIR))
+                for key in ("base_rows", "delta_rows", "tombstones", "parent"):
+                    fields.pop(key, None)
+                fields.update(rows=int(index.ntotal), grants=len(grants), lexical_terms=int(n_terms),
+                              compacted_from=parent)
+
+                with self._lock:
+                    # Versioner publicerade härifrån under bygget ersätts; deras ändringar spelas upp nedan
+                    self._check_current()
+                    manifest = publish_version(build_path, self.root, **fields)
+                    self.base.close()
+                    self._open(version_id)
+                    pending, self._pending = self._pending, None
+                    for operation, argument in pending:
+                        getattr(self, operation)(argument)
+                    if self.dirty:
+                        manifest = self.publish()
+            except BaseException:
+                shutil.rmtree(build_path, ignore_errors=True)
+                raise
+            self._save_cache()
+            print(f"  ✅ Index kompakterat: {len(grants)} bidrag, {len(pending)} ändringar under bygget "
+                  f"({time.perf_counter() - start:.1f} s)")
+            return manifest
+        finally:
+            with self._lock:
+                self._pending = None
+                self._compaction = None
+
+    def compact_in_background(self, only_if_needed=True):
+        """
+        Kör compact() i en bakgrundstråd
+
+        Returns:
+            Tråden, eller None om ingen kompaktering behövs eller redan pågår
+        """
+        with self._lock:
+            if self._compaction is not None or (only_if_needed and not self.needs_compaction()):
+                return None
+
+        def run():
+            try:
+                self.compact()
+            except Exception as e:
+                print(f"  ⚠️ Kompakteringen misslyckades: {e}")
+
+        thread = threading.Thread(target=run, name="index-compaction", daemon=True)
+        thread.start()
+        return thread
+
+    def wait_for_compaction(self, timeout=None):
+        """
+        Väntar tills en pågående kompaktering i bakgrunden är klar
+        """
+        thread = self._compaction
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+
+
+def read_grants_file(path):
+    """
+    Läser bidrag från en JSON-lista eller JSONL-fil (ett bidrag per rad)
+    """
+    with open(path, "r", encoding="utf-8") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return json.loads(text)
+    return [json.loads(line) for line in text.splitlines() if line.strip()]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Uppdaterar det publicerade indexet per bidrag")
+    parser.add_argument("--root", default=DEFAULT_INDEX_ROOT)
+    parser.add_argument("--upsert", metavar="FIL", help="JSON- eller JSONL-fil med nya/ändrade bidrag")
+    parser.add_argument("--delete", nargs="+", metavar="ID", default=[], help="Id:n för bidrag att ta bort")
+    parser.add_argument("--compact", action="store_true", help="Kompaktera indexet efter ändringarna")
+    parser.add_argument("--stats", action="store_true", help="Visa indexets storlek och tombstones")
+    args = parser.parse_args()
+
+    live = LiveIndex(args.root)
+    start = time.perf_counter()
+    if args.upsert:
+        counts = live.upsert(read_grants_file(args.upsert))
+        print(f"✅ Upsert: {counts['added']} nya, {counts['updated']} ändrade, {counts['unchanged']} oförändrade")
+    if args.delete:
+        print(f"✅ Borttagna: {live.delete(args.delete)} av {len(args.delete)} bidrag")
+    manifest = live.publish()
+    if manifest:
+        print(f"✅ Indexversion {manifest['version']} publicerad ({time.perf_counter() - start:.2f} s)")
+    if args.compact or live.needs_compaction():
+        if not args.compact:
+            print("🔄 Många borttagna rader eller stort delta, kompakterar...")
+        live.compact()
+    if args.stats or not (args.upsert or args.delete or args.compact):
+        for key, value in live.stats().items():
+            print(f"  {key}: {value}")
@@ -0,0 +1,282 @@
+"""
+Lättviktig latensinstrumentering för sökvägen
+Tidtagning per steg (tokenize, forward, search, hydrate, OpenAI-anrop),
+räknare och histogram i processen. Exporteras som Prometheus-text
+(GET /metrics i söktjänsten eller via serve()) och/eller som en
+JSON-loggrad per förfrågan.
+
+Avstängt som standard: stage() och request() returnerar då ett delat
+no-op-objekt, så kostnaden är ett funktionsanrop per steg.
+
+Aktivera med miljövariabler eller i kod:
+    GRANTS_METRICS=1         - samla mätvärden
+    GRANTS_METRICS_LOG=1     - skriv en JSON-rad per förfrågan (loggern grants.metrics)
+    GRANTS_METRICS_PORT=9100 - exponera /metrics från demo-skripten
+
+    from scripts import metrics
+    metrics.enable(log_requests=True)
+    with metrics.request("search"):
+        with metrics.stage("forward"):
+            ...
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from contextvars import ContextVar
+
+# Histogramgränser i sekunder (Prometheus-konvention)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+HELP = {
+    "grants_stage_seconds": ("histogram", "Tid per steg i sökvägen"),
+    "grants_request_seconds": ("histogram", "Total tid per förfrågan"),
+    "grants_requests_total": ("counter", "Antal förfrågningar"),
+    "grants_events_total": ("counter", "Händelser, t.ex. cacheträffar"),
+}
+
+logger = logging.getLogger("grants.metrics")
+
+_log_requests = os.environ.get("GRANTS_METRICS_LOG", "0") == "1"
+_enabled = os.environ.get("GRANTS_METRICS", "0") == "1" or _log_requests
+_lock = threading.Lock()
+_counters = {}
+_histograms = {}
+# Pågående förfrågan i den här tråden/asyncio-uppgiften
+_current = ContextVar("grants_metrics_request", default=None)
+
+
+def enable(log_requests=None):
+    """
+    Slår på insamlingen (och valfritt en loggrad per förfrågan)
+    """
+    global _enabled, _log_requests
+    _enabled = True
+    if log_requests is not None:
+        _log_requests = log_requests
+    if _log_requests and not logger.handlers:
+        handler = logging.StreamHandler()
+        handler.setFormatter(logging.Formatter("%(message)s"))
+        logger.addHandler(handler)
+        logger.setLevel(logging.INFO)
+        logger.propagate = False
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """
+    Nollställer alla mätvärden
+    """
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
+
+
+def _labels_key(labels):
+    return tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    """
+    Ökar en räknare
+    """
+    if not _enabled:
+        return
+    key = (name, _labels_key(labels))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    """
+    Lägger en mätning i ett histogram
+    """
+    if not _enabled:
+        return
+    key = (name, _labels_key(labels))
+    with _lock:
+        histogram = _histograms.get(key)
+        if histogram is None:
+            histogram = _histograms[key] = [[0] * len(BUCKETS), 0.0, 0]
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                histogram[0][i] += 1
+                break
+        histogram[1] += seconds
+        histogram[2] += 1
+
+
+class _Noop:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NOOP = _Noop()
+
+
+class _StageTimer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.start
+        observe("grants_stage_seconds", elapsed, stage=self.name)
+        trace = _current.get()
+        if trace is not None:
+            trace.stages[self.name] = trace.stages.get(self.name, 0.0) + elapsed
+        return False
+
+
+def stage(name):
+    """
+    Tidtagning av ett steg: with metrics.stage("forward"): ...
+    """
+    if not _enabled:
+        return _NOOP
+    return _StageTimer(name)
+
+
+class _RequestTimer:
+    def __init__(self, kind, fields):
+        self.kind = kind
+        self.fields = dict(fields)
+        self.stages = {}
+
+    def __enter__(self):
+        self._token = _current.set(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        elapsed = time.perf_counter() - self.start
+        _current.reset(self._token)
+        status = "error" if exc_type else "ok"
+        observe("grants_request_seconds", elapsed, kind=self.kind)
+        inc("grants_requests_total", kind=self.kind, status=status)
+        if _log_requests:
+            record = {"event": self.kind, "status": status, "total_ms": round(elapsed * 1000, 3),
+                      "stages_ms": {name: round(seconds * 1000, 3) for name, seconds in self.stages.items()}}
+            record.update(self.fields)
+            logger.info(json.dumps(record, ensure_ascii=False, default=str))
+        return False
+
+
+def request(kind, **fields):
+    """
+    Tidtagning av en hel förfrågan; stegen inuti summeras i loggraden
+
+    En förfrågan inuti en annan (t.ex. en sökning i ett GPT-anrop) räknas
+    som steget "<kind>_request" i den yttre.
+    """
+    if not _enabled:
+        return _NOOP
+    if _current.get() is not None:
+        return _StageTimer(f"{kind}_request")
+    return _RequestTimer(kind, fields)
+
+
+def annotate(**fields):
+    """
+    Lägger till fält i loggraden för pågående förfrågan (t.ex. antal träffar)
+    """
+    if not _enabled:
+        return
+    trace = _current.get()
+    if isinstance(trace, _RequestTimer):
+        trace.fields.update(fields)
+
+
+def _format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{value}"' for key, value in items) + "}"
+
+
+def render_prometheus():
+    """
+    Alla mätvärden i Prometheus textformat (version 0.0.4)
+    """
+    with _lock:
+        counters = dict(_counters)
+        histograms = {key: (list(value[0]), value[1], value[2]) for key, value in _histograms.items()}
+
+    lines = []
+    for name, (metric_type, help_text) in HELP.items():
+        series = counters if metric_type == "counter" else histograms
+        keys = sorted(key for key in series if key[0] == name)
+        if not keys:
+            continue
+        lines.append(f"# HELP {name} {help_text}")
+        lines.append(f"# TYPE {name} {metric_type}")
+        for key in keys:
+            labels = key[1]
+            if metric_type == "counter":
+                lines.append(f"{name}{_format_labels(labels)} {series[key]}")
+                continue
+            buckets, total, count = series[key]
+            cumulative = 0
+            for bound, bucket_count in zip(BUCKETS, buckets):
+                cumulative += bucket_count
+                lines.append(f"{name}_bucket{_format_labels(labels, [('le', bound)])} {cumulative}")
+            lines.append(f"{name}_bucket{_format_labels(labels, [('le', '+Inf')])} {count}")
+            lines.append(f"{name}_sum{_format_labels(labels)} {total}")
+            lines.append(f"{name}_count{_format_labels(labels)} {count}")
+    return "\n".join(lines) + "\n"
+
+
+def serve(port, host="127.0.0.1"):
+    """
+    Startar en HTTP-server i bakgrunden som exponerar GET /metrics
+
+    Returns:
+        Servern (stoppas med shutdown())
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_response(404)
+                self.end_headers()
+                return
+            body = render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    enable()
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if _enabled:
+    enable()
@@ -0,0 +1,227 @@
+"""
+Lokal ersättare för OpenAI:s chat completions-API
+Svarar på POST /v1/chat/completions (vanligt svar och strömmat via
+server-sent events) med en inställbar fördröjning, så att
+GPT-assistenten kan köras och mätas utan API-nyckel eller nätverk.
+
+    - Omskrivningsanropet (max_tokens <= 100) får en engelsk sökfråga
+      byggd från en liten ordlista
+    - Analysanropet får ett svar som nämner bidragstitlarna i prompten
+
+Användning:
+    python scripts/openai_stub.py --port 8900 --latency 0.8
+    OPENAI_BASE_URL=http://127.0.0.1:8900/v1 OPENAI_API_KEY=test python demo_openai.py
+
+    # Jämför tid till första token: sekventiellt mot spekulativt + strömmat
+    python scripts/openai_stub.py --compare
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8900
+DEFAULT_LATENCY = 0.8       # Sekunder till första token (en rundresa)
+DEFAULT_TOKEN_DELAY = 0.02  # Sekunder mellan tokens
+
+# Svenska ord -> engelska söktermer för omskrivningen
+GLOSSARY = {
+    "psykisk": "mental health", "psykiska": "mental health", "hälsa": "health",
+    "unga": "youth", "ungas": "youth", "barn": "children", "skola": "education",
+    "utbildning": "education", "innovation": "innovation", "digitalisering": "technology innovation",
+    "cykel": "cycling transportation", "cykelvänligt": "cycling transportation",
+    "hållbart": "sustainability environment", "miljö": "environment", "klimat": "climate change",
+    "vatten": "clean water", "integration": "integration social services",
+    "bostäder": "housing community development", "centrum": "community development",
+}
+
+
+def rewrite_query(text):
+    """
+    Enkel 'omskrivning' till engelska söktermer
+    """
+    terms = []
+    for word in re.findall(r"\w+", text.casefold()):
+        term = GLOSSARY.get(word)
+        if term and term not in terms:
+            terms.append(term)
+    return " ".join(terms) or text
+
+
+def answer_text(system_prompt):
+    """
+    Svar som nämner bidragstitlarna i analysprompten
+    """
+    titles = re.findall(r"^Titel: (.+)$", system_prompt, flags=re.MULTILINE)
+    if not titles:
+        return "Jag hittade tyvärr inga bidrag som passar. Vill du beskriva behovet på ett annat sätt?"
+    lines = [f"Jag hittade {len(titles)} bidrag. De mest relevanta är:"]
+    lines += [f"{i}. {title} - passar era behov." for i, title in enumerate(titles[:3], 1)]
+    lines.append("Vill du veta mer om något av dem eller söka annorlunda?")
+    return "\n".join(lines)
+
+
+def make_handler(latency, token_delay, stats):
+    class OpenAIStubHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if not self.path.rstrip("/").endswith("/chat/completions"):
+                self._send_json(404, {"error": {"message": "Okänd sökväg"}})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            request = json.loads(self.rfile.read(length) or b"{}")
+            messages = request.get("messages", [])
+            # Ungefärlig promptstorlek (~4 tecken per token), för att följa historikens tillväxt
+            prompt_tokens = sum(len(m.get("content") or "") // 4 + 4 for m in messages)
+            with stats["lock"]:
+                stats["requests"] += 1
+                stats["prompt_tokens"].append(prompt_tokens)
+
+            if request.get("max_tokens", 0) <= 100:
+                user_messages = [m["content"] for m in messages if m.get("role") == "user"]
+                content = rewrite_query(user_messages[-1] if user_messages else "")
+            else:
+                content = answer_text(messages[-1]["content"] if messages else "")
+            tokens = re.findall(r"\S+\s*|\s+", content)
+
+            created = int(time.time())
+            base = {"id": f"chatcmpl-stub-{stats['requests']}", "created": created,
+                    "model": request.get("model", "stub")}
+
+            if not request.get("stream"):
+                time.sleep(latency + token_delay * len(tokens))
+                self._send_json(200, dict(base, object="chat.completion", choices=[{
+                    "index": 0, "finish_reason": "stop",
+                    "message": {"role": "assistant", "content": content},
+                }], usage={"prompt_tokens": prompt_tokens, "completion_tokens": len(tokens),
+                        "total_tokens": prompt_tokens + len(tokens)}))
+                return
+
+            # Strömmat svar: en SSE-händelse per token, anslutningen stängs efteråt
+            self.send_response(200)
+            self.send_header("Content-Type", "text/event-stream")
+            self.send_header("Connection", "close")
+            self.end_headers()
+            time.sleep(latency)
+            try:
+                for i, token in enumerate(tokens):
+                    delta = {"content": token} if i else {"role": "assistant", "content": token}
+                    chunk = dict(base, object="chat.completion.chunk",
+                                 choices=[{"index": 0, "delta": delta, "finish_reason": None}])
+                    self.wfile.write(f"data: {json.dumps(chunk, ensure_ascii=False)}\n\n".encode("utf-8"))
+                    self.wfile.flush()
+                    time.sleep(token_delay)
+                done = dict(base, object="chat.completion.chunk",
+                            choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+                self.wfile.write(f"data: {json.dumps(done)}\n\ndata: [DONE]\n\n".encode("utf-8"))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # Klienten avbröt strömmen (t.ex. ett kasserat spekulativt svar)
+                pass
+            self.close_connection = True
+
+    return OpenAIStubHandler
+
+
+def start_stub_server(host=DEFAULT_HOST, port=0, latency=DEFAULT_LATENCY, token_delay=DEFAULT_TOKEN_DELAY):
+    """
+    Startar ersättaren i en bakgrundstråd
+
+    Returns:
+        (server, base_url, stats) - base_url passar som OPENAI_BASE_URL
+    """
+    stats = {"requests": 0, "prompt_tokens": [], "lock": threading.Lock()}
+    server = ThreadingHTTPServer((host, port), make_handler(latency, token_delay, stats))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}/v1", stats
+
+
+def compare_time_to_first_token(messages, repeats=1):
+    """
+    Mäter tid till första token och total tid för search_with_gpt,
+    sekventiellt mot spekulativt och strömmat (kräver en körande ersättare
+    via OPENAI_BASE_URL och ett byggt index)
+    """
+    import demo_openai
+
+    # Svarscachen skulle dölja skillnaden
+    demo_openai.RESPONSE_CACHE_SIZE = 0
+    modes = {
+        "sekventiell": dict(speculative=False, stream=False),
+        "strömmad": dict(speculative=False, stream=True),
+        "spekulativ + strömmad": dict(speculative=True, stream=True),
+    }
+    report = {}
+    for name, mode in modes.items():
+        first_token, total = [], []
+        for _ in range(repeats):
+            for message in messages:
+                start = time.perf_counter()
+                first = []
+
+                def on_token(text):
+                    if not first:
+                        first.append(time.perf_counter() - start)
+
+                answer, _, _ = demo_openai.search_with_gpt(
+                    message, on_token=on_token if mode["stream"] else None, speculative=mode["speculative"])
+                elapsed = time.perf_counter() - start
+                # Utan strömning ser användaren inget förrän hela svaret är klart
+                first_token.append(first[0] if first else elapsed)
+                total.append(elapsed)
+        report[name] = {"ttft_s": sum(first_token) / len(first_token), "total_s": sum(total) / len(total)}
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lokal ersättare för OpenAI:s chat completions-API")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--latency", type=float, default=DEFAULT_LATENCY, help="Sekunder till första token")
+    parser.add_argument("--token-delay", type=float, default=DEFAULT_TOKEN_DELAY, help="Sekunder mellan tokens")
+    parser.add_argument("--compare", action="store_true",
+                        help="Mät tid till första token för search_with_gpt i olika lägen")
+    args = parser.parse_args()
+
+    if args.compare:
+        server, base_url, _ = start_stub_server(args.host, 0, args.latency, args.token_delay)
+        os.environ["OPENAI_BASE_URL"] = base_url
+        os.environ.setdefault("OPENAI_API_KEY", "stub")
+        sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        report = compare_time_to_first_token([
+            "Vi ser ökande behov av insatser för ungas psykiska hälsa. Vad finns?",
+            "Vi planerar att göra vårt centrum mer cykelvänligt och hållbart.",
+            "Finns det stöd för rent vatten i små kommuner?",
+        ])
+        print("\n" + "=" * 60)
+        print(f"TID TILL FÖRSTA TOKEN (latens {args.latency} s per anrop)")
+        print("=" * 60)
+        for name, row in report.items():
+            print(f"  {name:24s} första token {row['ttft_s']:.2f} s   totalt {row['total_s']:.2f} s")
+        server.shutdown()
+    else:
+        server, base_url, _ = start_stub_server(args.host, args.port, args.latency, args.token_delay)
+        print(f"🚀 OpenAI-ersättare körs på {base_url}")
+        print(f"   Kör: OPENAI_BASE_URL={base_url} OPENAI_API_KEY=test python demo_openai.py")
+        print("   Avsluta med Ctrl+C")
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            server.shutdown()
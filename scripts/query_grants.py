@@ -1,47 +1,536 @@
-import faiss
 import numpy as np
-from transformers import AutoTokenizer, AutoModel
-import torch
 import os
 import json
+import hashlib
+import atexit
+import threading
 from datetime import datetime
 
 os.environ["KMP_DUPLICATE_LIB_OK"] = "TRUE"
 
-# Ladda FAISS-index och bidragsdata
-print("Laddar index och data...")
-try:
-    index = faiss.read_index("data/grants_index.faiss")
-    print(f"  ✅ FAISS-index laddat ({index.ntotal} bidrag)")
-except:
-    print("  ❌ Kunde inte ladda FAISS-index. Kör först: python scripts/fetch_and_index_grants.py")
-    exit(1)
-
-try:
-    with open("data/grants_data.json", "r", encoding="utf-8") as f:
-        grants_data = json.load(f)
-    print(f"  ✅ Bidragsdata laddad ({len(grants_data)} bidrag)")
-except:
-    print("  ❌ Kunde inte ladda bidragsdata.")
-    exit(1)
-
-# Ladda AI-modell
-print("Laddar AI-modell...")
-model_name = "sentence-transformers/all-MiniLM-L6-v2"
-tokenizer = AutoTokenizer.from_pretrained(model_name)
-model = AutoModel.from_pretrained(model_name)
-print("  ✅ Modell laddad!\n")
+# Gör paketet scripts importerbart när filen körs direkt som skript
+if __package__ in (None, ""):
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts import metrics
+from scripts.encoder import MODEL_NAME, get_encoder
+from scripts.index_factory import load_index, tune_index
+from scripts.grant_store import GrantStore, ListGrantStore, SegmentedStore, DEFAULT_STORE_PATH, RECORDS_FILE
+from scripts.filters import (GrantFilterIndex, make_search_params, exact_filtered_search,
+                             prepare_exact_search, EXACT_FALLBACK_LIMIT)
+from scripts.lexical_index import (LexicalIndex, SegmentedLexicalIndex, reciprocal_rank_fusion,
+                                    looks_like_identifier, DEFAULT_LEXICAL_PATH)
+from scripts.embedding_cache import (QueryEmbeddingCache, normalize_query,
+                                     DEFAULT_QUERY_CACHE_PATH, QUERY_CACHE_SIZE)
+from scripts.index_versions import (DEFAULT_INDEX_ROOT, INDEX_FILE, STORE_DIR, LEXICAL_DIR, DELTA_STORE_DIR,
+                                    DELTA_LEXICAL_DIR, TOMBSTONES_FILE, current_version, read_manifest,
+                                    verify_version, version_path)
+
+# Versionerade index (data/index/CURRENT) har företräde framför de fasta sökvägarna nedan
+INDEX_ROOT = DEFAULT_INDEX_ROOT
+# Sekunder mellan kontroller av om en ny indexversion publicerats (0 = aldrig)
+RELOAD_INTERVAL = float(os.environ.get("GRANTS_RELOAD_INTERVAL", "10"))
+
+# Index byggda före versionskatalogerna
+INDEX_PATH = "data/grants_index.faiss"
+STORE_PATH = DEFAULT_STORE_PATH
+# Äldre index utan store-katalog läses från JSON
+DATA_PATH = "data/grants_data.json"
+LEXICAL_PATH = DEFAULT_LEXICAL_PATH
+
+# Sökläge: vector (embeddings), lexical (BM25) eller hybrid (sammanslagen rankning);
+# hybrid väljs med mode= eller GRANTS_SEARCH_MODE
+SEARCH_MODES = ("vector", "lexical", "hybrid")
+DEFAULT_SEARCH_MODE = os.environ.get("GRANTS_SEARCH_MODE", "vector")
+# Kandidater per rankning som slås ihop i hybridläget
+HYBRID_CANDIDATES = 50
+
+
+class IndexSnapshot:
+    """
+    Ett laddat index med tillhörande bidragsdata, filter och BM25-index
+
+    Byts ut i sin helhet när en ny version laddas, så att en sökning alltid
+    läser index och data från samma bygge.
+    """
+
+    def __init__(self, index, grants_data, lexical_index, version, manifest=None, alive=None):
+        self.index = index
+        self.grants_data = grants_data
+        self.filter_index = GrantFilterIndex(grants_data)
+        self.lexical_index = lexical_index
+        self.version = version
+        self.manifest = manifest
+        # Bool-array över raderna när rader tagits bort med upsert/delete (annars None)
+        self.alive = alive
+
+
+class GrantSearcher:
+    """
+    Sökmotor över FAISS-index och bidragsdata
+
+    Index, bidragsdata och AI-modell laddas först vid första sökningen
+    (eller vid ett explicit anrop till warmup()). Laddningen är trådsäker.
+    Frågeembeddings cachas i en LRU-cache som sparas till disk vid avslut.
+
+    Finns ett versionerat index (data/index/CURRENT) läses det; en
+    bakgrundstråd byter till nya versioner när de publiceras, utan att
+    modellen laddas om. Annars läses de fasta sökvägarna (äldre index).
+
+    Finns ett BM25-index kan sökningen vara lexikal, vektorbaserad eller
+    hybrid; utan det används alltid vektorsökning.
+    """
+
+    def __init__(self, index_path=INDEX_PATH, data_path=DATA_PATH, model_name=MODEL_NAME, encoder=None,
+                 store_path=STORE_PATH, lexical_path=LEXICAL_PATH, search_mode=DEFAULT_SEARCH_MODE,
+                 query_cache_size=QUERY_CACHE_SIZE, query_cache_path=DEFAULT_QUERY_CACHE_PATH,
+                 nprobe=None, ef_search=None, mmap_index=None, index_root=INDEX_ROOT,
+                 reload_interval=RELOAD_INTERVAL):
+        """
+        Args:
+            index_root: Katalog med versionerade index (None = bara de fasta sökvägarna)
+            reload_interval: Sekunder mellan kontroller av ny indexversion (0 = aldrig)
+        """
+        self.index_root = index_root
+        self.reload_interval = reload_interval
+        self.index_path = index_path
+        self.data_path = data_path
+        self.store_path = store_path
+        self.lexical_path = lexical_path
+        if search_mode not in SEARCH_MODES:
+            raise ValueError(f"Okänt sökläge: {search_mode} (giltiga: {', '.join(SEARCH_MODES)})")
+        self.search_mode = search_mode
+        # Sökparametrar för IVF-/HNSW-index (None = värdet som sparades vid bygget)
+        self.nprobe = nprobe
+        self.ef_search = ef_search
+        # Minnesmappat index delar sidcachen mellan flera sökprocesser
+        if mmap_index is None:
+            mmap_index = os.environ.get("GRANTS_INDEX_MMAP", "0") == "1"
+        self.mmap_index = mmap_index
+        self.encoder = encoder or get_encoder(model_name)
+        self.query_cache = None
+        if query_cache_size:
+            self.query_cache = QueryEmbeddingCache(self.encoder.cache_id, query_cache_path, query_cache_size)
+            atexit.register(self.query_cache.save)
+        self._snapshot = None
+        self._lock = threading.Lock()
+        self._reload_lock = threading.Lock()
+        self._watcher = None
+        self._stop_watching = threading.Event()
+        # Version som inte gick att läsa; provas inte igen förrän CURRENT ändras
+        self._failed_version = None
+
+    def _load(self):
+        if self._snapshot is not None:
+            return
+        with self._lock:
+            if self._snapshot is not None:
+                return
+            version_id = current_version(self.index_root) if self.index_root else None
+            print("Laddar index och data...")
+            if version_id is None:
+                self._snapshot = self._open_legacy()
+            else:
+                self._snapshot = self._open_version(version_id)
+                if self.reload_interval > 0:
+                    self._start_watcher()
+
+    def _open_legacy(self):
+        """
+        Läser ett index från de fasta sökvägarna (byggt före versionskatalogerna)
+        """
+        index, grants_data, lexical_index = self._open_files(self.index_path, self.store_path,
+                                                             self.data_path, self.lexical_path)
+        version = file_version(
+            self.index_path,
+            os.path.join(self.store_path, RECORDS_FILE) if isinstance(grants_data, GrantStore)
+            else self.data_path,
+        )
+        return IndexSnapshot(index, grants_data, lexical_index, version)
+
+    def _open_version(self, version_id):
+        """
+        Läser en publicerad indexversion och kontrollerar den mot manifestet
+        """
+        path = version_path(version_id, self.index_root)
+        errors = verify_version(version_id, self.index_root)
+        if errors:
+            print(f"  ❌ Indexversion {version_id} är ofullständig: {'; '.join(errors)}")
+            raise ValueError(f"Ofullständig indexversion {version_id}")
+        manifest = read_manifest(version_id, self.index_root)
+        if manifest.get("model") and manifest["model"] != self.encoder.cache_id:
+            print(f"  ❌ Indexversion {version_id} är byggd med {manifest['model']}, "
+                  f"sökningen använder {self.encoder.cache_id}")
+            raise ValueError(f"Indexversion {version_id} är byggd med en annan modell")
+
+        index, grants_data, lexical_index = self._open_files(
+            os.path.join(path, INDEX_FILE), os.path.join(path, STORE_DIR), None, os.path.join(path, LEXICAL_DIR))
+        if index.ntotal != manifest.get("rows", index.ntotal) or index.d != manifest.get("dimension", index.d):
+            raise ValueError(f"Indexversion {version_id} stämmer inte med manifestet")
+
+        # Bidrag tillagda med upsert ligger i ett delta-segment efter basens rader
+        delta_path = os.path.join(path, DELTA_STORE_DIR)
+        if os.path.isdir(delta_path):
+            base_rows = len(grants_data)
+            grants_data = SegmentedStore([grants_data, GrantStore(delta_path)])
+            delta_lexical_path = os.path.join(path, DELTA_LEXICAL_DIR)
+            if lexical_index is not None and os.path.isdir(delta_lexical_path):
+                lexical_index = SegmentedLexicalIndex([lexical_index, LexicalIndex(delta_lexical_path)],
+                                                      [0, base_rows])
+            print(f"  ✅ Delta-segment laddat ({len(grants_data) - base_rows} bidrag)")
+        alive = None
+        tombstones_path = os.path.join(path, TOMBSTONES_FILE)
+        if os.path.exists(tombstones_path):
+            alive = np.ones(len(grants_data), dtype=bool)
+            alive[np.load(tombstones_path)] = False
+
+        print(f"  ✅ Indexversion {version_id} (byggd {manifest.get('built_at', '?')})")
+        return IndexSnapshot(index, grants_data, lexical_index, version_id, manifest, alive)
+
+    def _open_files(self, index_path, store_path, data_path, lexical_path):
+        # Ladda FAISS-index och bidragsdata
+        if not os.path.exists(index_path):
+            print("  ❌ Kunde inte ladda FAISS-index. Kör först: python scripts/fetch_and_index_grants.py")
+            raise FileNotFoundError(index_path)
+        index = tune_index(load_index(index_path, mmap=self.mmap_index),
+                           nprobe=self.nprobe, ef_search=self.ef_search)
+        # Reservsökningen vid snäva filter rekonstruerar vektorer; indexet
+        # förbereds här så att det aldrig ändras under en sökning
+        prepare_exact_search(index)
+        print(f"  ✅ FAISS-index laddat ({index.ntotal} bidrag)")
+
+        if store_path and os.path.isdir(store_path):
+            # Minnesmappad store: bara träffarna avkodas vid sökning
+            grants_data = GrantStore(store_path)
+        elif data_path and os.path.exists(data_path):
+            with open(data_path, "r", encoding="utf-8") as f:
+                grants_data = ListGrantStore(json.load(f))
+        else:
+            print("  ❌ Kunde inte ladda bidragsdata.")
+            raise FileNotFoundError(store_path or data_path)
+        print(f"  ✅ Bidragsdata laddad ({len(grants_data)} bidrag)")
+
+        lexical_index = None
+        if lexical_path and os.path.isdir(lexical_path):
+            lexical_index = LexicalIndex(lexical_path)
+            print(f"  ✅ BM25-index laddat ({len(lexical_index.vocabulary)} termer)")
+        elif self.search_mode != "vector":
+            print("  ⚠️  BM25-index saknas, använder vektorsökning. Kör om indexeringen för hybridsökning.")
+        return index, grants_data, lexical_index
+
+    def reload(self):
+        """
+        Byter till den publicerade indexversionen om den är ny
+
+        Den nya versionen laddas vid sidan av den gamla; pågående sökningar
+        läser klart i den gamla. Går den nya inte att läsa behålls den gamla.
+
+        Returns:
+            True om sökmotorn bytte version
+        """
+        if not self.index_root:
+            return False
+        self._load()
+        with self._reload_lock:
+            version_id = current_version(self.index_root)
+            if version_id is None or version_id in (self._snapshot.version, self._failed_version):
+                return False
+            print(f"\n🔄 Ny indexversion publicerad: {version_id}")
+            try:
+                snapshot = self._open_version(version_id)
+            except (OSError, ValueError) as e:
+                print(f"  ⚠️  Behåller version {self._snapshot.version}: {e}")
+                self._failed_version = version_id
+                metrics.inc("grants_events_total", event="index_reload_failed")
+                return False
+            # Ett enda referensbyte; sökningar som redan startat använder den gamla
+            self._snapshot = snapshot
+            metrics.inc("grants_events_total", event="index_reloaded")
+            return True
+
+    def _start_watcher(self):
+        def watch():
+            while not self._stop_watching.wait(self.reload_interval):
+                try:
+                    self.reload()
+                except Exception as e:
+                    print(f"  ⚠️  Kunde inte kontrollera indexversion: {e}")
+
+        self._watcher = threading.Thread(target=watch, name="index-watcher", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        self._stop_watching.set()
+
+    @property
+    def index(self):
+        self._load()
+        return self._snapshot.index
+
+    @property
+    def grants_data(self):
+        self._load()
+        return self._snapshot.grants_data
+
+    @property
+    def index_version(self):
+        """
+        Version för det laddade indexet; ändras när indexet byggs om
+        """
+        self._load()
+        return self._snapshot.version
+
+    @property
+    def manifest(self):
+        """
+        Manifestet för den laddade versionen (None för äldre index)
+        """
+        self._load()
+        return self._snapshot.manifest
+
+    def warmup(self):
+        """
+        Laddar index, data och AI-modell direkt i stället för vid första sökningen
+        """
+        self._load()
+        self.encoder.warmup()
+        return self
+
+    def create_query_embedding(self, query):
+        """
+        Skapar embedding för en användarfråga
+        """
+        return self.create_query_embeddings([query])
+
+    def create_query_embeddings(self, queries):
+        """
+        Skapar embeddings för flera frågor; bara frågor som saknas i cachen kodas
+        """
+        if self.query_cache is None:
+            return self.encoder.encode(queries)
+
+        vectors = [self.query_cache.get(query) for query in queries]
+        hits = sum(vector is not None for vector in vectors)
+        metrics.inc("grants_events_total", hits, event="query_cache_hit")
+        metrics.inc("grants_events_total", len(vectors) - hits, event="query_cache_miss")
+
+        # Unika normaliserade frågor som saknas i cachen, kodade i en batch
+        missing = list(dict.fromkeys(normalize_query(query)
+                                     for query, vector in zip(queries, vectors) if vector is None))
+        if missing:
+            fresh = dict(zip(missing, self.encoder.encode(missing)))
+            for text, vector in fresh.items():
+                self.query_cache.put(text, vector)
+            vectors = [fresh[normalize_query(query)] if vector is None else vector
+                       for query, vector in zip(queries, vectors)]
+
+        return np.vstack(vectors).astype(np.float32)
+
+    def needs_embedding(self, query, mode=None):
+        """
+        Om frågan kodas med modellen i sökläget (lexikala frågor och
+        identifierare i hybridläget besvaras från BM25)
+        """
+        mode = mode or self.search_mode
+        return mode == "vector" or (mode == "hybrid" and not looks_like_identifier(query))
+
+    def embed_queries(self, queries):
+        """
+        Kodar frågorna i en forward pass
+
+        Returns:
+            Dict fråga -> vektor, att skicka som query_vectors till search_batch
+        """
+        unique = list(dict.fromkeys(queries))
+        if not unique:
+            return {}
+        return dict(zip(unique, self.create_query_embeddings(unique)))
+
+    def search(self, query, k=5, filters=None, mode=None):
+        """
+        Söker efter bidrag baserat på en användarfråga
+        """
+        return self.search_batch([query], k=k, filters=filters, mode=mode)[0]
+
+    def search_batch(self, queries, k=5, filters=None, mode=None, query_vectors=None):
+        """
+        Söker efter flera frågor med en enda forward pass och ett enda index.search
+
+        Args:
+            queries: Lista med sökfrågor
+            k: Antal resultat per fråga
+            filters: Valfria filter (se scripts/filters.py), gäller alla frågor
+            mode: Sökläge (vector, lexical eller hybrid); None = searcherns standard
+            query_vectors: Valfri dict fråga -> vektor från embed_queries; frågor
+                           som saknas kodas som vanligt
+
+        Returns:
+            En lista med matchande bidrag per fråga, i samma ordning som queries.
+            match_score är L2-avstånd (vector), BM25-poäng (lexical) eller
+            RRF-poäng (hybrid).
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+
+        mode = mode or self.search_mode
+        if mode not in SEARCH_MODES:
+            raise ValueError(f"Okänt sökläge: {mode} (giltiga: {', '.join(SEARCH_MODES)})")
+
+        with metrics.request("search", mode=mode, queries=len(queries), k=k, filtered=bool(filters)):
+            return self._search_batch(queries, k, filters, mode, query_vectors)
+
+    def _search_batch(self, queries, k, filters, mode, query_vectors=None):
+        # Hela sökningen läser samma version även om en ny publiceras under tiden
+        self._load()
+        snapshot = self._snapshot
+        index = snapshot.index
+        if index.ntotal == 0:
+            print("FAISS-indexet är tomt.")
+            return [[] for _ in queries]
+
+        # Filtermask över indexraderna (None = inga filter)
+        with metrics.stage("filter"):
+            mask = snapshot.filter_index.mask(filters)
+            if snapshot.alive is not None:
+                # Borttagna rader finns kvar i BM25 (och i HNSW) tills indexet kompakteras
+                mask = snapshot.alive if mask is None else mask & snapshot.alive
+        n_matches = index.ntotal if mask is None else int(mask.sum())
+        if n_matches == 0:
+            return [[] for _ in queries]
+        k = min(k, n_matches)
+
+        lexical_index = snapshot.lexical_index
+        if lexical_index is None:
+            mode = "vector"
+
+        if mode == "lexical":
+            results = []
+            for query in queries:
+                with metrics.stage("lexical"):
+                    scores, indices = lexical_index.search(query, k, mask)
+                results.append(self._hydrate(snapshot.grants_data, indices, scores))
+            return results
+
+        results = [None] * len(queries)
+        if mode == "hybrid":
+            # Exakta identifierare ('EPA-2024-007') besvaras direkt från BM25 utan modellen
+            for row, query in enumerate(queries):
+                if looks_like_identifier(query):
+                    with metrics.stage("lexical"):
+                        scores, indices = lexical_index.search(query, k, mask)
+                    if len(indices):
+                        results[row] = self._hydrate(snapshot.grants_data, indices, scores)
+
+        pending = [row for row, result in enumerate(results) if result is None]
+        if not pending:
+            return results
+
+        vector_k = min(max(k, HYBRID_CANDIDATES), n_matches) if mode == "hybrid" else k
+        distances, indices = self._vector_search(index, [queries[row] for row in pending], vector_k,
+                                                 mask, n_matches, query_vectors)
+
+        for i, row in enumerate(pending):
+            if mode == "hybrid":
+                with metrics.stage("lexical"):
+                    _, lexical_indices = lexical_index.search(queries[row], vector_k, mask)
+                with metrics.stage("fusion"):
+                    scores, fused = reciprocal_rank_fusion([indices[i], lexical_indices], k=k)
+                results[row] = self._hydrate(snapshot.grants_data, fused, scores)
+            else:
+                results[row] = self._hydrate(snapshot.grants_data, indices[i], distances[i])
+        return results
+
+    def _vector_search(self, index, queries, k, mask, n_matches, query_vectors=None):
+        """
+        Embedding-sökning i FAISS, med förfiltrering om en mask är satt
+        """
+        # Skapa embeddings för frågorna som inte redan kodats
+        query_vectors = dict(query_vectors or {})
+        missing = [query for query in queries if query not in query_vectors]
+        if missing:
+            query_vectors.update(self.embed_queries(missing))
+        query_embeddings = np.array([query_vectors[query] for query in queries], dtype=np.float32)
+
+        with metrics.stage("search"):
+            if mask is None:
+                return index.search(query_embeddings, k=k)
+
+            params, _keepalive = make_search_params(index, mask)
+            distances, indices = index.search(query_embeddings, k=k, params=params)
+
+            # ANN-index kan ge färre än k träffar med snäva filter; komplettera exakt
+            short = np.flatnonzero((indices >= 0).sum(axis=1) < k)
+            if len(short) and n_matches <= EXACT_FALLBACK_LIMIT:
+                exact = exact_filtered_search(index, query_embeddings[short], np.flatnonzero(mask), k)
+                if exact is not None:
+                    distances[short], indices[short] = exact
+            return distances, indices
+
+    def _hydrate(self, grants_data, indices, distances):
+        """
+        Hämtar matchande bidrag för en rad i sökresultatet
+
+        Belopp och deadline formateras från de typade kolumnerna (tolkade
+        vid indexeringen) till amount_text och deadline_text.
+        """
+        matched_grants = []
+        with metrics.stage("hydrate"):
+            amount_min = grants_data.column("amount_min")
+            amount_max = grants_data.column("amount_max")
+            deadline = grants_data.column("deadline")
+            for i, (idx, distance) in enumerate(zip(indices, distances)):
+                if 0 <= idx < len(grants_data):
+                    grant = grants_data.get(idx)
+                    grant['match_score'] = float(distance)
+                    grant['rank'] = i + 1
+                    grant['amount_text'] = format_amount_typed(amount_min[idx], amount_max[idx])
+                    grant['deadline_text'] = format_date_typed(deadline[idx])
+                    matched_grants.append(grant)
+
+        return matched_grants
+
+
+def file_version(*paths):
+    """
+    Kort versionssträng från storlek och ändringstid för filerna
+    """
+    digest = hashlib.sha1()
+    for path in paths:
+        if path and os.path.exists(path):
+            stat = os.stat(path)
+            digest.update(f"{os.path.abspath(path)}:{stat.st_size}:{stat.st_mtime_ns}".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+_default_searcher = None
+_default_searcher_lock = threading.Lock()
+
+
+def get_searcher():
+    """
+    Returnerar den delade sökmotorn (skapas vid första anropet)
+    """
+    global _default_searcher
+    with _default_searcher_lock:
+        if _default_searcher is None:
+            _default_searcher = GrantSearcher()
+        return _default_searcher
+
+
+def warmup():
+    """
+    Laddar index, data och modell i förväg, t.ex. innan en demo startar
+    """
+    return get_searcher().warmup()
+
 
 def create_query_embedding(query):
     """
     Skapar embedding för en användarfråga
     """
-    inputs = tokenizer([query], padding=True, truncation=True, 
-                      max_length=512, return_tensors="pt")
-    with torch.no_grad():
-        model_output = model(**inputs)
-    query_embedding = model_output.last_hidden_state.mean(dim=1).numpy()
-    return query_embedding
+    return get_searcher().create_query_embedding(query)
 
 def format_amount(amount_min, amount_max):
     """
@@ -76,7 +565,26 @@ def format_date(date_str):
             return date_str
     return "Inget deadline angivet"
 
-def query_grants(query, k=5, verbose=True):
+def format_amount_typed(amount_min, amount_max):
+    """
+    Som format_amount, men för belopp som tal från store-kolumnerna (NaN = saknas)
+    """
+    min_val, max_val = float(amount_min), float(amount_max)
+    if np.isnan(max_val):
+        return "Belopp ej angivet"
+    if np.isnan(min_val):
+        return f"Upp till ${max_val:,.0f}"
+    return f"${min_val:,.0f} - ${max_val:,.0f}"
+
+def format_date_typed(deadline):
+    """
+    Som format_date, men för datetime64[D] från store-kolumnen (NaT = saknas)
+    """
+    if np.isnat(deadline):
+        return "Inget deadline angivet"
+    return str(np.datetime64(deadline, "D"))
+
+def query_grants(query, k=5, verbose=True, filters=None, mode=None):
     """
     Söker efter bidrag baserat på en användarfråga
     
@@ -84,30 +592,31 @@ def query_grants(query, k=5, verbose=True):
         query: Användarens sökfråga
         k: Antal resultat att returnera
         verbose: Om True, visa detaljerad information
+        filters: Valfria filter, t.ex. {"open_only": True, "min_amount": 100000,
+                 "agencies": ["Environmental Protection Agency"]} (se scripts/filters.py)
+        mode: Sökläge - "vector" (standard), "lexical" (BM25) eller "hybrid"
     
     Returns:
         Lista med matchande bidrag
     """
-    if index.ntotal == 0:
-        print("FAISS-indexet är tomt.")
-        return []
-    
-    # Skapa embedding för frågan
-    query_embedding = create_query_embedding(query)
+    return get_searcher().search(query, k=k, filters=filters, mode=mode)
+
+def query_grants_batch(queries, k=5, filters=None, mode=None):
+    """
+    Söker efter bidrag för flera frågor på en gång
     
-    # Sök i indexet
-    distances, indices = index.search(np.array(query_embedding), k=min(k, index.ntotal))
+    Alla frågor kodas i en gemensam batch och söks med ett enda FAISS-anrop.
     
-    # Hämta matchande bidrag
-    matched_grants = []
-    for i, (idx, distance) in enumerate(zip(indices[0], distances[0])):
-        if 0 <= idx < len(grants_data):
-            grant = grants_data[idx].copy()
-            grant['match_score'] = float(distance)
-            grant['rank'] = i + 1
-            matched_grants.append(grant)
+    Args:
+        queries: Lista med sökfrågor
+        k: Antal resultat per fråga
+        filters: Valfria filter som gäller alla frågor (se query_grants)
+        mode: Sökläge (se query_grants)
     
-    return matched_grants
+    Returns:
+        En lista med matchande bidrag per fråga (samma format som query_grants)
+    """
+    return get_searcher().search_batch(queries, k=k, filters=filters, mode=mode)
 
 def display_results(query, results):
     """
@@ -129,8 +638,11 @@ def display_results(query, results):
         print(f"{'─'*80}")
         print(f"📋 ID: {grant['number']}")
         print(f"🏛️  Myndighet: {grant['agency']}")
-        print(f"💰 Belopp: {format_amount(grant['amount_min'], grant['amount_max'])}")
-        print(f"📅 Sista ansökningsdag: {format_date(grant['deadline'])}")
+        # Resultat utan förformaterade fält (t.ex. äldre svarscache) tolkas här
+        amount_text = grant.get('amount_text') or format_amount(grant['amount_min'], grant['amount_max'])
+        deadline_text = grant.get('deadline_text') or format_date(grant['deadline'])
+        print(f"💰 Belopp: {amount_text}")
+        print(f"📅 Sista ansökningsdag: {deadline_text}")
         print(f"🏷️  Kategori: {grant['category']}")
         
         # Visa de första 200 tecknen av beskrivningen
@@ -145,6 +657,11 @@ def display_results(query, results):
     print("="*80)
 
 if __name__ == "__main__":
+    try:
+        warmup()
+    except FileNotFoundError:
+        exit(1)
+
     # Interaktivt läge
     print("\n" + "="*80)
     print("GRANTS.GOV DEMO - INTELLIGENT BIDRAGSSÖKNING")
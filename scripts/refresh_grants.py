@@ -0,0 +1,289 @@
+"""
+Löpande uppdatering av bidragsindexet (delta-hämtning)
+Efter en första full indexering (scripts/fetch_and_index_grants.py) håller
+det här jobbet indexet aktuellt utan att hämta och bädda in allt igen:
+
+    - per kategori hämtas bara bidrag med openDate från och med senaste
+      vattenmärket (search2 sorterat på openDate, nyast först, tills en
+      sida når vattenmärket)
+    - med jämna mellanrum (GRANTS_FULL_SWEEP_HOURS) hämtas alla publicerade
+      bidrag för att fånga ändringar i äldre bidrag; oförändrade bidrag
+      hoppas över utan att bäddas in
+    - bidrag vars closeDate har passerats tas bort (tombstone), så att
+      indexet bara innehåller sökbara bidrag
+    - svaren cachas på disk (scripts/http_cache.py); i en delta-hämtning
+      hoppas sidor med samma innehåll som förra gången över, eftersom
+      bidragen på dem redan lagts in. En full genomgång läser alla sidor
+      och rättar upp det en tidigare runda missat
+    - ändringarna läggs in med LiveIndex (scripts/live_index.py) och
+      publiceras som en ny indexversion; sökprocesserna byter automatiskt
+
+Vattenmärken och tidpunkter sparas i data/refresh_state.json och flyttas
+fram först när ändringarna är publicerade. Efter en misslyckad runda är
+nästa runda en full genomgång, eftersom cachen då kan innehålla sidor
+vars bidrag aldrig lades in.
+
+Användning:
+    python scripts/refresh_grants.py                        # en körning
+    python scripts/refresh_grants.py --daemon               # var GRANTS_REFRESH_INTERVAL sekund
+    python scripts/refresh_grants.py --daemon --interval 900
+    python scripts/refresh_grants.py --full                 # hämta alla bidrag den här gången
+"""
+
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+
+import numpy as np
+
+# Gör paketet scripts importerbart när filen körs direkt som skript
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.fetch_and_index_grants import (GRANT_CATEGORIES, MAX_WORKERS, PAGE_SIZE, SEARCH2_URL, create_session,
+                                            fetch_grants_data, fetch_page, normalize_grant)
+from scripts.grant_store import parse_date
+from scripts.http_cache import HTTPCache, DEFAULT_HTTP_CACHE_PATH, SAME_AS_BEFORE
+from scripts.index_versions import DEFAULT_INDEX_ROOT, current_version
+from scripts.live_index import LiveIndex
+
+REFRESH_INTERVAL = float(os.environ.get("GRANTS_REFRESH_INTERVAL", "3600"))
+FULL_SWEEP_HOURS = float(os.environ.get("GRANTS_FULL_SWEEP_HOURS", "24"))
+DEFAULT_STATE_PATH = "data/refresh_state.json"
+# Övre gräns för antal sidor per kategori i en delta-hämtning
+MAX_NEW_PAGES = 50
+# Svar i HTTP-cachen som inte använts på en vecka tas bort
+HTTP_CACHE_RETENTION = 7 * 24 * 3600
+
+
+def load_state(path=DEFAULT_STATE_PATH):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"watermarks": {}}
+
+
+def save_state(state, path=DEFAULT_STATE_PATH):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+
+def fetch_new_grants(session, category, since, cache=None, page_size=PAGE_SIZE, base_url=SEARCH2_URL,
+                     max_pages=MAX_NEW_PAGES):
+    """
+    Hämtar bidrag i en kategori med openDate >= since, nyast först
+
+    Bidrag från samma dag som vattenmärket hämtas igen (de kan ha
+    publicerats efter förra körningen); oförändrade hoppas över av upsert.
+    Sidor som enligt cachen har samma innehåll som förra gången tas inte
+    med alls (de läses bara för vattenmärket).
+
+    Returns:
+        (bidrag, senaste openDate som datetime64[D] eller None)
+    """
+    grants, newest = [], None
+    for page in range(max_pages):
+        hits, hit_count, status = fetch_page(session, category, page * page_size, page_size, base_url,
+                                             sort_by="openDate|desc", cache=cache)
+        unchanged = status in SAME_AS_BEFORE
+        reached_watermark = False
+        for hit in hits:
+            open_date = parse_date(hit.get('openDate'))
+            if not np.isnat(open_date):
+                if open_date < since:
+                    reached_watermark = True
+                    break
+                newest = open_date if newest is None else max(newest, open_date)
+            if not unchanged:
+                grants.append(normalize_grant(hit, category))
+        if reached_watermark or len(hits) < page_size or (page + 1) * page_size >= hit_count:
+            break
+    return grants, newest
+
+
+def _latest_open_dates(grants):
+    latest = {}
+    for grant in grants:
+        open_date = parse_date(grant.get('posted_date'))
+        if not np.isnat(open_date):
+            category = grant['category']
+            latest[category] = max(latest.get(category, open_date), open_date)
+    return latest
+
+
+def refresh_once(live, state, categories=None, session=None, cache=None, full=None, today=None,
+                 base_url=SEARCH2_URL, max_workers=MAX_WORKERS):
+    """
+    En uppdateringsrunda: hämta nya/ändrade bidrag, ta bort stängda, publicera
+
+    Args:
+        live: LiveIndex
+        state: Dict från load_state(); vattenmärkena uppdateras på plats
+        full: True/False tvingar full genomgång eller delta; None = enligt
+              FULL_SWEEP_HOURS och om någon kategori saknar vattenmärke
+        today: Datum för stängda bidrag (standard: idag)
+
+    Returns:
+        Rapport (dict) för rundan
+    """
+    categories = list(categories or GRANT_CATEGORIES)
+    today = np.datetime64(today or date.today(), "D")
+    watermarks = state.setdefault("watermarks", {})
+    start = time.perf_counter()
+
+    # En full indexering kan ha publicerat en ny version sedan förra rundan
+    if current_version(live.root) != live.version:
+        print("🔄 Ny indexversion publicerad utanför uppdateringsjobbet, öppnar den")
+        live.reopen()
+
+    if full is None:
+        last_sweep = state.get("last_full_sweep")
+        hours_since = ((datetime.now() - datetime.fromisoformat(last_sweep)).total_seconds() / 3600
+                       if last_sweep else None)
+        full = (hours_since is None or hours_since >= FULL_SWEEP_HOURS or state.get("needs_full_sweep", False)
+                or any(category not in watermarks for category in categories))
+
+    own_session = session is None
+    if own_session:
+        session = create_session(pool_size=max_workers)
+    try:
+        if full:
+            print("Hämtar alla publicerade bidrag (full genomgång)...")
+            fetched = fetch_grants_data(categories, base_url, max_workers=max_workers, session=session,
+                                        cache=cache, fallback_demo=False)
+            if not fetched:
+                raise RuntimeError("Inga bidrag kunde hämtas, indexet lämnas orört")
+            latest = _latest_open_dates(fetched)
+            new_watermarks = {category: str(latest.get(category, today)) for category in categories}
+        else:
+            print("Hämtar nya bidrag sedan vattenmärkena...")
+            fetched, new_watermarks, seen = [], {}, set()
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {category: executor.submit(fetch_new_grants, session, category,
+                                                     np.datetime64(watermarks[category], "D"), cache,
+                                                     base_url=base_url)
+                           for category in categories}
+                # Samma kategoriordning som fetch_grants_data, så att dubbletter hamnar likadant
+                for category in categories:
+                    try:
+                        grants, newest = futures[category].result()
+                    except Exception as e:
+                        # Vattenmärket flyttas inte, så kategorin hämtas igen nästa runda
+                        print(f"  ⚠️ Fel för kategorin '{category}': {e}")
+                        continue
+                    for grant in grants:
+                        if grant['id'] not in seen:
+                            seen.add(grant['id'])
+                            fetched.append(grant)
+                    new_watermarks[category] = str(max(newest, np.datetime64(watermarks[category], "D"))
+                                                   if newest is not None else watermarks[category])
+                    print(f"  ✅ {category}: {len(grants)} bidrag sedan {watermarks[category]}")
+    finally:
+        if own_session:
+            session.close()
+
+    # Ett bidrag behåller den kategori det indexerades med, så att det inte
+    # bäddas in på nytt bara för att det hittades under ett annat sökord
+    open_grants, closed_ids = [], []
+    for grant in fetched:
+        existing = live.get(grant['id'])
+        if existing is not None:
+            grant = dict(grant, category=existing.get('category', grant['category']))
+        deadline = parse_date(grant.get('deadline'))
+        if not np.isnat(deadline) and deadline < today:
+            closed_ids.append(grant['id'])
+        else:
+            open_grants.append(grant)
+
+    counts = live.upsert(open_grants)
+    removed = live.delete(closed_ids + live.expired_ids(today))
+    manifest = live.publish()
+    if live.needs_compaction():
+        print("🔄 Många borttagna rader eller stort delta, kompakterar i bakgrunden")
+        live.compact_in_background()
+
+    watermarks.update(new_watermarks)
+    now = datetime.now().isoformat(timespec="seconds")
+    state["last_run"] = now
+    if full:
+        state["last_full_sweep"] = now
+        state.pop("needs_full_sweep", None)
+    report = {
+        "full": bool(full),
+        "fetched": len(fetched),
+        "added": counts["added"],
+        "updated": counts["updated"],
+        "unchanged": counts["unchanged"],
+        "removed": removed,
+        "version": manifest["version"] if manifest else live.version,
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+    if cache is not None:
+        report["http_cache"] = dict(cache.counts)
+    state["last_report"] = report
+    return report
+
+
+def run(root=DEFAULT_INDEX_ROOT, state_path=DEFAULT_STATE_PATH, interval=None, full=None, categories=None,
+        base_url=SEARCH2_URL, stop_event=None):
+    """
+    Kör en uppdateringsrunda, eller med interval en runda var interval:e sekund
+    tills stop_event sätts (eller Ctrl+C)
+    """
+    live = LiveIndex(root)
+    cache = HTTPCache(DEFAULT_HTTP_CACHE_PATH)
+    session = create_session()
+    stop_event = stop_event or threading.Event()
+    try:
+        while True:
+            state = load_state(state_path)
+            try:
+                report = refresh_once(live, state, categories, session, cache, full=full, base_url=base_url)
+                save_state(state, state_path)
+                print(f"✅ {report['added']} nya, {report['updated']} ändrade, {report['removed']} borttagna "
+                      f"({report['unchanged']} oförändrade) på {report['seconds']} s, version {report['version']}")
+            except Exception as e:
+                # Sidor som hämtades och cachades under rundan hoppas annars
+                # över nästa gång, fast bidragen på dem aldrig lades in
+                state = load_state(state_path)
+                state["needs_full_sweep"] = True
+                save_state(state, state_path)
+                if interval is None:
+                    raise
+                print(f"⚠️ Uppdateringen misslyckades: {e}")
+            cache.prune(HTTP_CACHE_RETENTION)
+            if interval is None or stop_event.wait(interval):
+                break
+            # Full genomgång styrs av FULL_SWEEP_HOURS efter första rundan
+            full = None
+    except KeyboardInterrupt:
+        print("\nAvslutar...")
+    finally:
+        session.close()
+        # En pågående kompaktering får publicera klart
+        live.wait_for_compaction()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Håller bidragsindexet aktuellt med delta-hämtning")
+    parser.add_argument("--daemon", action="store_true", help="Kör om var --interval sekund")
+    parser.add_argument("--interval", type=float, default=REFRESH_INTERVAL, help="Sekunder mellan rundorna")
+    parser.add_argument("--full", action="store_true", help="Hämta alla publicerade bidrag den här rundan")
+    parser.add_argument("--categories", nargs="+", default=None, help="Kategorier (sökord) att hämta")
+    parser.add_argument("--root", default=DEFAULT_INDEX_ROOT)
+    parser.add_argument("--state", default=DEFAULT_STATE_PATH)
+    args = parser.parse_args()
+
+    if args.daemon:
+        print(f"🚀 Uppdaterar indexet var {args.interval:.0f} s (avsluta med Ctrl+C)")
+    run(args.root, args.state, args.interval if args.daemon else None, True if args.full else None,
+        args.categories)
@@ -0,0 +1,207 @@
+"""
+Semantisk svarscache för GPT-assistenten
+Många kommuner ställer nästan samma fråga ('psykisk hälsa unga',
+'ungas psykiska hälsa'). Cachen nycklas på embeddingen av användarens
+meddelande: ett nytt meddelande som är tillräckligt likt ett tidigare
+(cosinuslikhet >= tröskeln) får den sparade omskrivna sökfrågan, svaret
+och sökträffarna direkt, utan OpenAI-anrop.
+
+Poster har en TTL och cachen har en maxstorlek (LRU). Hela cachen töms
+när indexversionen ändras, eftersom svaren bygger på sökträffarna.
+"""
+
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from scripts.embedding_cache import normalize_query
+
+DEFAULT_RESPONSE_CACHE_PATH = "data/response_cache.npz"
+RESPONSE_CACHE_SIZE = int(os.environ.get("GPT_CACHE_SIZE", "1000"))
+RESPONSE_CACHE_TTL = float(os.environ.get("GPT_CACHE_TTL", str(7 * 24 * 3600)))
+# Lägsta cosinuslikhet för en träff; högre = färre men säkrare träffar
+SIMILARITY_THRESHOLD = float(os.environ.get("GPT_CACHE_THRESHOLD", "0.9"))
+
+
+class SemanticResponseCache:
+    """
+    Begränsad cache från meddelande-embedding till (sökfråga, svar, träffar)
+
+    Trådsäker; sparas till disk med save().
+    """
+
+    def __init__(self, embed_fn, model_name, path=DEFAULT_RESPONSE_CACHE_PATH, max_size=RESPONSE_CACHE_SIZE,
+                 ttl_seconds=RESPONSE_CACHE_TTL, threshold=SIMILARITY_THRESHOLD, clock=time.time):
+        """
+        Args:
+            embed_fn: Funktion som tar en lista texter och returnerar en matris
+            model_name: Modellens cache-id; sparade poster med annan modell ignoreras
+            ttl_seconds: Hur länge ett svar får återanvändas
+            threshold: Lägsta cosinuslikhet för en träff
+        """
+        self.embed_fn = embed_fn
+        self.model_name = model_name
+        self.path = path
+        self.max_size = max(1, int(max_size))
+        self.ttl_seconds = ttl_seconds
+        self.threshold = threshold
+        self.clock = clock
+        self.index_version = None
+        self._entries = OrderedDict()
+        self._next_key = 0
+        self._lock = threading.Lock()
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+        self._load()
+
+    def _load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with np.load(self.path) as data:
+                if str(data["model_name"]) != self.model_name:
+                    return
+                index_version = str(data["index_version"])
+                entries = json.loads(str(data["entries"]))
+                vectors = data["vectors"]
+        except (OSError, KeyError, ValueError):
+            print(f"  ⚠️ Kunde inte läsa svarscache ({self.path}), börjar om")
+            return
+        self.index_version = index_version
+        # Filen är sparad från äldst till nyast
+        for entry, vector in zip(entries[-self.max_size:], vectors[-self.max_size:]):
+            entry["vector"] = vector
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _embed(self, message):
+        vector = np.asarray(self.embed_fn([message]), dtype=np.float32).reshape(-1)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _check_version(self, index_version):
+        # Anropas med låset taget
+        if index_version != self.index_version:
+            if self._entries:
+                self._dirty = True
+            self._entries.clear()
+            self.index_version = index_version
+
+    def _expire(self, now):
+        # Anropas med låset taget. LRU-ordningen följer senaste användning och
+        # inte skapandet, så alla poster gås igenom
+        expired = [key for key, entry in self._entries.items() if now - entry["created"] > self.ttl_seconds]
+        for key in expired:
+            del self._entries[key]
+        if expired:
+            self._dirty = True
+
+    def get(self, message, index_version):
+        """
+        Returnerar den mest lika cachade posten, eller None
+
+        Returns:
+            dict med search_query, answer, results, message och similarity
+        """
+        text = normalize_query(message)
+        vector = self._embed(message)
+        with self._lock:
+            self._check_version(index_version)
+            self._expire(self.clock())
+
+            best_key, best_similarity = None, -1.0
+            if self._entries:
+                keys = list(self._entries)
+                matrix = np.vstack([self._entries[key]["vector"] for key in keys])
+                similarities = matrix @ vector
+                for key, similarity in zip(keys, similarities):
+                    if self._entries[key]["text"] == text:
+                        similarity = 1.0
+                    if similarity > best_similarity:
+                        best_key, best_similarity = key, float(similarity)
+
+            if best_key is None or best_similarity < self.threshold:
+                self.misses += 1
+                return None
+
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            entry = self._entries[best_key]
+            return {
+                "message": entry["message"],
+                "search_query": entry["search_query"],
+                "answer": entry["answer"],
+                "results": [dict(grant) for grant in entry["results"]],
+                "similarity": best_similarity,
+            }
+
+    def put(self, message, index_version, search_query, answer, results):
+        """
+        Sparar ett svar för meddelandet
+        """
+        vector = self._embed(message)
+        entry = {
+            "message": message,
+            "text": normalize_query(message),
+            "search_query": search_query,
+            "answer": answer,
+            "results": json.loads(json.dumps(results, default=str)),
+            "created": self.clock(),
+            "vector": vector,
+        }
+        with self._lock:
+            self._check_version(index_version)
+            # Samma fråga igen ersätter den gamla posten
+            for key in [key for key, old in self._entries.items() if old["text"] == entry["text"]]:
+                del self._entries[key]
+            self._entries[self._next_key] = entry
+            self._next_key += 1
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+            self._dirty = True
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._dirty = True
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    def save(self):
+        """
+        Skriver cachen atomiskt till disk (i LRU-ordning)
+        """
+        if not self.path:
+            return
+        with self._lock:
+            if not self._dirty:
+                return
+            entries = list(self._entries.values())
+            self._dirty = False
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        if entries:
+            vectors = np.vstack([entry["vector"] for entry in entries]).astype(np.float32)
+        else:
+            vectors = np.zeros((0, 0), dtype=np.float32)
+        meta = [{key: value for key, value in entry.items() if key != "vector"} for entry in entries]
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, model_name=np.array(self.model_name), index_version=np.array(str(self.index_version)),
+                     entries=np.array(json.dumps(meta, ensure_ascii=False)), vectors=vectors)
+        os.replace(tmp_path, self.path)
@@ -0,0 +1,256 @@
+"""
+Lokal ersättare för Grants.gov:s search2-API
+Svarar på POST /v1/api/search2 med syntetiska bidrag, så att hämtningen
+(scripts/fetch_and_index_grants.py) kan köras och kontrolleras utan
+nätverk:
+
+    - keyword filtrerar på titeln, rows/startRecordNum bläddrar,
+      sortBy "openDate|desc" sorterar nyast först
+    - ETag på svaren; If-None-Match med samma ETag ger 304
+    - fail_first=n ger 503 på de n första anropen för varje sida, så att
+      omförsöken i create_session prövas
+    - jitter ger slumpmässig fördröjning per anrop, så att sidorna blir
+      klara i fel ordning
+
+Användning:
+    python scripts/search2_stub.py --port 8901 --per-category 250
+    GRANTS_API_URL=http://127.0.0.1:8901/v1/api/search2 python scripts/fetch_and_index_grants.py
+
+    # Kontrollera bläddring, ordning och omförsök mot ersättaren
+    python scripts/search2_stub.py --check
+"""
+
+import argparse
+import hashlib
+import json
+import os
+import random
+import sys
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Gör paketet scripts importerbart när filen körs direkt som skript
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8901
+SEARCH2_PATH = "/v1/api/search2"
+DEFAULT_CATEGORIES = ("education", "health", "environment", "community", "technology")
+
+
+def make_hits(categories=DEFAULT_CATEGORIES, per_category=250, seed=42, today=date(2025, 1, 1)):
+    """
+    Syntetiska träffar i search2-format, per_category per sökord
+
+    Från andra kategorin har var tionde träff även föregående kategoris
+    sökord i titeln, så att samma bidrag hittas under två kategorier.
+    """
+    rng = random.Random(seed)
+    hits = []
+    for c, category in enumerate(categories):
+        for i in range(per_category):
+            keywords = category
+            if c and i % 10 == 0:
+                keywords = f"{categories[c - 1]} and {category}"
+            opened = today - timedelta(days=rng.randrange(365))
+            hits.append({
+                "id": str(1000000 + c * 100000 + i),
+                "number": f"{category[:3].upper()}-{i:05d}",
+                "title": f"{keywords.title()} grant {i}",
+                "agencyName": f"Agency {rng.randrange(12)}",
+                "openDate": opened.strftime("%m/%d/%Y"),
+                "closeDate": (opened + timedelta(days=rng.randrange(30, 240))).strftime("%m/%d/%Y"),
+            })
+    return hits
+
+
+def search(hits, payload):
+    """
+    Träffarna för ett search2-anrop, före bläddring: (träffar, hitCount)
+    """
+    keyword = str(payload.get("keyword", "")).casefold()
+    matched = [hit for hit in hits if keyword in hit["title"].casefold()]
+    if payload.get("sortBy") == "openDate|desc":
+        # Stabil sortering: samma datum behåller ordningen
+        matched.sort(key=lambda hit: date(int(hit["openDate"][6:]), int(hit["openDate"][:2]),
+                                          int(hit["openDate"][3:5])), reverse=True)
+    return matched, len(matched)
+
+
+def make_handler(hits, stats, fail_first=0, jitter=0.0):
+    class Search2StubHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload, headers=()):
+            body = json.dumps(payload).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            for name, value in headers:
+                self.send_header(name, value)
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_POST(self):
+            if self.path.rstrip("/") != SEARCH2_PATH:
+                self._send_json(404, {"errorcode": 404, "msg": "Okänd sökväg"})
+                return
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            page_key = (payload.get("keyword"), payload.get("sortBy"), int(payload.get("startRecordNum", 0)),
+                        int(payload.get("rows", 25)))
+            with stats["lock"]:
+                stats["requests"] += 1
+                attempt = stats["attempts"].get(page_key, 0) + 1
+                stats["attempts"][page_key] = attempt
+            if jitter:
+                time.sleep(random.uniform(0, jitter))
+            if attempt <= fail_first:
+                with stats["lock"]:
+                    stats["failures"] += 1
+                self._send_json(503, {"errorcode": 503, "msg": "Tjänsten är tillfälligt otillgänglig"})
+                return
+
+            matched, hit_count = search(hits, payload)
+            start = page_key[2]
+            result = {"errorcode": 0, "msg": "Webservice Succeeds",
+                      "data": {"hitCount": hit_count, "oppHits": matched[start:start + page_key[3]]}}
+            etag = '"' + hashlib.sha256(json.dumps(result, sort_keys=True).encode("utf-8")).hexdigest()[:32] + '"'
+            if self.headers.get("If-None-Match") == etag:
+                self.send_response(304)
+                self.send_header("ETag", etag)
+                self.end_headers()
+                return
+            self._send_json(200, result, [("ETag", etag)])
+
+    return Search2StubHandler
+
+
+def start_stub_server(hits=None, host=DEFAULT_HOST, port=0, fail_first=0, jitter=0.0):
+    """
+    Startar ersättaren i en bakgrundstråd
+
+    Returns:
+        (server, url, stats) - url passar som GRANTS_API_URL / base_url
+    """
+    hits = make_hits() if hits is None else hits
+    stats = {"requests": 0, "failures": 0, "attempts": {}, "lock": threading.Lock()}
+    server = ThreadingHTTPServer((host, port), make_handler(hits, stats, fail_first, jitter))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}{SEARCH2_PATH}", stats
+
+
+def expected_grants(hits, categories):
+    """
+    Bidragen som fetch_grants_data ska ge för hits: kategori- och
+    sidordning, första förekomsten av varje id
+    """
+    from scripts.fetch_and_index_grants import normalize_grant
+
+    grants, seen = [], set()
+    for category in categories:
+        for hit in search(hits, {"keyword": category})[0]:
+            if hit["id"] not in seen:
+                seen.add(hit["id"])
+                grants.append(normalize_grant(hit, category))
+    return grants
+
+
+def check_fetcher(per_category=60, page_size=7, max_workers=4):
+    """
+    Kör fetch_grants_data mot ersättaren och kontrollerar bläddring,
+    ordning, dubbletter och omförsök vid 5xx
+
+    Returns:
+        Lista med (namn, ok, detalj)
+    """
+    from scripts.fetch_and_index_grants import MAX_RETRIES, create_session, fetch_grants_data
+
+    categories = list(DEFAULT_CATEGORIES)
+    hits = make_hits(categories, per_category)
+    expected = expected_grants(hits, categories)
+    results = []
+
+    def fetch(url, categories=categories):
+        # Kort backoff så att kontrollen går fort; samma omförsök som i produktion
+        session = create_session(pool_size=max_workers, backoff_factor=0.01)
+        try:
+            return fetch_grants_data(categories, url, page_size=page_size, max_workers=max_workers,
+                                     session=session, fallback_demo=False)
+        finally:
+            session.close()
+
+    # Bläddring och ordning, med sidor som blir klara i slumpmässig ordning
+    server, url, stats = start_stub_server(hits, jitter=0.02)
+    try:
+        grants = fetch(url)
+    finally:
+        server.shutdown()
+    starts = {}
+    for keyword, _, start, _ in stats["attempts"]:
+        starts.setdefault(keyword, []).append(start)
+    # Varje sida hämtas exakt en gång, och inga sidor efter hitCount
+    paged = all(sorted(starts.get(category, [])) == list(range(0, search(hits, {"keyword": category})[1], page_size))
+                for category in categories)
+    results.append(("startRecordNum-bläddring", paged and stats["requests"] == len(stats["attempts"]),
+                    f"{stats['requests']} anrop, sidor per kategori: "
+                    f"{', '.join(str(len(starts.get(category, []))) for category in categories)}"))
+    results.append(("ordning och dubbletter", [g["id"] for g in grants] == [g["id"] for g in expected]
+                    and grants == expected, f"{len(grants)} unika bidrag (förväntat {len(expected)})"))
+
+    # Omförsök: varje sida svarar 503 en gång innan den lyckas
+    server, url, stats = start_stub_server(hits, fail_first=1)
+    try:
+        grants = fetch(url)
+    finally:
+        server.shutdown()
+    pages = len(stats["attempts"])
+    results.append(("omförsök vid 503", grants == expected and stats["failures"] == pages
+                    and stats["requests"] == 2 * pages,
+                    f"{stats['failures']} fel av {stats['requests']} anrop, {len(grants)} bidrag"))
+
+    # Fler fel än omförsöken räcker till: kategorin hoppas över, inget krasch
+    server, url, stats = start_stub_server(hits, fail_first=MAX_RETRIES + 1)
+    try:
+        grants = fetch(url, categories[:1])
+    finally:
+        server.shutdown()
+    results.append(("uttömda omförsök", grants == [] and stats["requests"] == MAX_RETRIES + 1,
+                    f"{stats['requests']} anrop, {len(grants)} bidrag"))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lokal ersättare för Grants.gov:s search2-API")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--per-category", type=int, default=250, help="Antal träffar per sökord")
+    parser.add_argument("--fail-first", type=int, default=0, help="Antal 503-svar per sida innan den lyckas")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Max slumpmässig fördröjning per anrop (s)")
+    parser.add_argument("--check", action="store_true",
+                        help="Kontrollera bläddring, ordning och omförsök i hämtningen mot ersättaren")
+    args = parser.parse_args()
+
+    if args.check:
+        results = check_fetcher()
+        print("\n" + "=" * 60)
+        print("KONTROLL AV HÄMTNINGEN MOT SEARCH2-ERSÄTTAREN")
+        print("=" * 60)
+        for name, ok, detail in results:
+            print(f"  {'✅' if ok else '❌'} {name}: {detail}")
+        sys.exit(0 if all(ok for _, ok, _ in results) else 1)
+
+    server, url, _ = start_stub_server(make_hits(per_category=args.per_category), args.host, args.port,
+                                       args.fail_first, args.jitter)
+    print(f"🚀 search2-ersättare körs på {url}")
+    print(f"   Kör: GRANTS_API_URL={url} python scripts/fetch_and_index_grants.py")
+    print("   Avsluta med Ctrl+C")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,315 @@
+"""
+Lokal söktjänst för bidrag
+==========================
+
+Håller AI-modell och FAISS-index laddade i en långlivad process och
+samlar samtidiga frågor i mikrobatchar: en tokenizer/modell-forward pass
+per batch och ett index.search per kombination av filter och sökläge.
+
+Användning:
+    python scripts/search_service.py --port 8765 --max-batch-size 32 --max-wait-ms 5
+
+    curl -X POST localhost:8765/search -d '{"query": "clean water", "k": 3}'
+    curl -X POST localhost:8765/search -d '{"query": "clean water", "filters": {"open_only": true}}'
+    curl -X POST localhost:8765/search -d '{"query": "EPA-2024-007", "mode": "lexical"}'
+    curl localhost:8765/metrics   # med --metrics
+"""
+
+import argparse
+import json
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Gör paketet scripts importerbart när filen körs direkt som skript
+if __package__ in (None, ""):
+    import sys
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from scripts.query_grants import GrantSearcher, SEARCH_MODES, DEFAULT_SEARCH_MODE
+from scripts import metrics
+from scripts.filters import canonical_filters, validate_filters
+
+DEFAULT_HOST = "127.0.0.1"
+DEFAULT_PORT = 8765
+MAX_BATCH_SIZE = 32
+MAX_WAIT_MS = 5.0
+MAX_K = 50
+
+
+class MicroBatcher:
+    """
+    Samlar inkommande frågor och kör dem som en batch mot sökmotorn
+
+    En batch skickas när max_batch_size frågor har samlats eller när den
+    äldsta frågan har väntat max_wait_ms, beroende på vad som kommer först.
+    """
+
+    def __init__(self, searcher, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.searcher = searcher
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        # Håller submit och stop isär, så att ingen fråga hamnar i kön efter stop
+        self._submit_lock = threading.Lock()
+        self._worker = threading.Thread(target=self._run, name="search-batcher", daemon=True)
+        self.batches = 0
+        self.queries = 0
+
+    def start(self):
+        self._worker.start()
+        return self
+
+    def stop(self):
+        """
+        Stoppar batchningen; den pågående batchen körs klart, frågor som
+        fortfarande ligger i kön avslutas med RuntimeError
+        """
+        with self._submit_lock:
+            self._stopped.set()
+            self._queue.put(None)
+        if self._worker.is_alive():
+            self._worker.join()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[3].set_running_or_notify_cancel():
+                item[3].set_exception(RuntimeError("Söktjänsten har stoppats"))
+
+    def submit(self, query, k=5, filters=None, mode=None):
+        """
+        Lägger en fråga i kön och returnerar en Future med resultatlistan
+
+        Filtren kontrolleras och skrivs på fast form redan här, så att frågor
+        med samma filter hamnar i samma grupp i batchen.
+
+        Raises:
+            ValueError: vid ogiltiga filter
+            RuntimeError: om batchningen har stoppats
+        """
+        filters = canonical_filters(filters) or None
+        future = Future()
+        with self._submit_lock:
+            if self._stopped.is_set():
+                raise RuntimeError("Söktjänsten har stoppats")
+            self._queue.put((query, k, (filters, mode), future))
+        return future
+
+    def search(self, query, k=5, filters=None, mode=None, timeout=None):
+        return self.submit(query, k, filters, mode).result(timeout=timeout)
+
+    def _collect(self):
+        item = self._queue.get()
+        if item is None:
+            return []
+        batch = [item]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._stopped.set()
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while not self._stopped.is_set():
+            batch = self._collect()
+            if not batch:
+                continue
+
+            # Markera frågorna som startade; avbrutna frågor hoppas över
+            batch = [item for item in batch if item[3].set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            # Alla frågor som behöver modellen kodas i en forward pass, även
+            # när batchen blandar filter och söklägen
+            try:
+                query_vectors = self.searcher.embed_queries(
+                    [query for query, _, (_, mode), _ in batch if self.searcher.needs_embedding(query, mode)])
+            except Exception as e:
+                for _, _, _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            # Frågor med samma filter och sökläge delar ett index.search; en
+            # fråga som inte går att gruppera avslutas ensam
+            groups = {}
+            for item in batch:
+                try:
+                    key = json.dumps(item[2], sort_keys=True, default=str)
+                except Exception as e:
+                    item[3].set_exception(e)
+                    continue
+                groups.setdefault(key, []).append(item)
+
+            for group in groups.values():
+                queries = [query for query, _, _, _ in group]
+                max_k = max(k for _, k, _, _ in group)
+                try:
+                    filters, mode = group[0][2]
+                    results = self.searcher.search_batch(queries, k=max_k, filters=filters, mode=mode,
+                                                         query_vectors=query_vectors)
+                except Exception as e:
+                    for _, _, _, future in group:
+                        future.set_exception(e)
+                    continue
+
+                for (_, k, _, future), grants in zip(group, results):
+                    future.set_result(grants[:k])
+
+            self.batches += 1
+            self.queries += len(batch)
+
+
+def make_handler(batcher):
+    """
+    Skapar en HTTP-handler bunden till en MicroBatcher
+    """
+
+    class SearchHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, format, *args):
+            pass
+
+        def _send_json(self, status, payload):
+            body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def do_GET(self):
+            if self.path == "/health":
+                query_cache = batcher.searcher.query_cache
+                self._send_json(200, {
+                    "status": "ok",
+                    "batches": batcher.batches,
+                    "queries": batcher.queries,
+                    "index_version": batcher.searcher.index_version,
+                    "query_cache": query_cache.stats() if query_cache else None,
+                })
+            elif self.path == "/metrics":
+                body = metrics.render_prometheus().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+            else:
+                self._send_json(404, {"error": "Okänd sökväg"})
+
+        def do_POST(self):
+            if self.path != "/search":
+                self._send_json(404, {"error": "Okänd sökväg"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                request = json.loads(self.rfile.read(length) or b"{}")
+                query = str(request["query"]).strip()
+                k = min(max(int(request.get("k", 5)), 1), MAX_K)
+                filters = validate_filters(request.get("filters"))
+                mode = request.get("mode")
+                if mode is not None and mode not in SEARCH_MODES:
+                    raise ValueError(mode)
+            except (KeyError, TypeError, ValueError):
+                self._send_json(400, {"error": "Förväntade JSON med 'query', valfritt 'k', valfria 'filters' "
+                                               f"och valfritt 'mode' ({', '.join(SEARCH_MODES)})"})
+                return
+            if not query:
+                self._send_json(400, {"error": "Tom fråga"})
+                return
+
+            try:
+                results = batcher.search(query, k=k, filters=filters, mode=mode)
+            except ValueError as e:
+                # T.ex. ogiltigt datum i ett filter
+                self._send_json(400, {"error": str(e)})
+                return
+            except Exception as e:
+                self._send_json(500, {"error": str(e)})
+                return
+            self._send_json(200, {"query": query, "results": results})
+
+    return SearchHandler
+
+
+def create_server(searcher=None, host=DEFAULT_HOST, port=DEFAULT_PORT,
+                  max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+    """
+    Skapar en HTTP-server med mikrobatchning (startas med serve_forever())
+
+    Returns:
+        (server, batcher)
+    """
+    searcher = searcher or GrantSearcher()
+    batcher = MicroBatcher(searcher, max_batch_size=max_batch_size, max_wait_ms=max_wait_ms).start()
+    server = ThreadingHTTPServer((host, port), make_handler(batcher))
+    server.daemon_threads = True
+    return server, batcher
+
+
+def query_service(query, k=5, url=f"http://{DEFAULT_HOST}:{DEFAULT_PORT}", timeout=30, filters=None, mode=None):
+    """
+    Skickar en fråga till en körande söktjänst och returnerar resultatlistan
+    """
+    import requests
+
+    response = requests.post(f"{url}/search", json={"query": query, "k": k, "filters": filters, "mode": mode},
+                             timeout=timeout)
+    response.raise_for_status()
+    return response.json()["results"]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Lokal söktjänst med mikrobatchning")
+    parser.add_argument("--host", default=DEFAULT_HOST)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--max-batch-size", type=int, default=MAX_BATCH_SIZE,
+                        help="Max antal frågor per batch")
+    parser.add_argument("--max-wait-ms", type=float, default=MAX_WAIT_MS,
+                        help="Max väntetid för att fylla en batch (ms)")
+    parser.add_argument("--mmap-index", action="store_true",
+                        help="Läs FAISS-indexet minnesmappat (delas mellan processer)")
+    parser.add_argument("--mode", choices=SEARCH_MODES, default=DEFAULT_SEARCH_MODE,
+                        help="Standardsökläge: vector, lexical (BM25) eller hybrid")
+    parser.add_argument("--metrics", action="store_true",
+                        help="Samla latens per steg (exponeras på GET /metrics)")
+    parser.add_argument("--metrics-log", action="store_true",
+                        help="Skriv en JSON-loggrad per sökbatch (aktiverar även --metrics)")
+    args = parser.parse_args()
+    if args.metrics or args.metrics_log:
+        metrics.enable(log_requests=args.metrics_log)
+
+    searcher = GrantSearcher(mmap_index=args.mmap_index or None, search_mode=args.mode)
+    try:
+        searcher.warmup()
+    except FileNotFoundError:
+        exit(1)
+
+    server, batcher = create_server(searcher, args.host, args.port,
+                                    args.max_batch_size, args.max_wait_ms)
+    print(f"\n🚀 Söktjänst körs på http://{args.host}:{args.port}")
+    print(f"   Batch: max {args.max_batch_size} frågor / {args.max_wait_ms} ms")
+    print("   POST /search {\"query\": \"...\", \"k\": 5}   GET /health   GET /metrics")
+    print("   Avsluta med Ctrl+C\n")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 Söktjänsten avslutas")
+    finally:
+        server.server_close()
+        batcher.stop()
@@ -0,0 +1,142 @@
+"""
+Syntetiska bidragskorpusar för benchmarks
+Genererar realistiska bidrag (samma schema som Grants.gov-hämtningen)
+utifrån demo-posterna: titlar och beskrivningar blandas ihop från
+demo-texterna och ett ämnesförråd per kategori, belopp och datum slumpas
+med rimliga fördelningar. Samma seed ger alltid samma korpus.
+
+Användning:
+    from scripts.synthetic_corpus import generate_grants
+    grants = list(generate_grants(10000, seed=42))
+"""
+
+import random
+import re
+from datetime import date, timedelta
+
+# Myndigheter utöver demo-posternas: (namn, förkortning, kategori)
+EXTRA_AGENCIES = (
+    ("Department of Agriculture", "USDA", "Agriculture"),
+    ("Department of Energy", "DOE", "Energy"),
+    ("Department of Transportation", "DOT", "Transportation"),
+    ("Department of Justice", "DOJ", "Law, Justice and Legal Services"),
+    ("National Endowment for the Arts", "NEA", "Arts"),
+    ("Department of Commerce", "DOC", "Business and Commerce"),
+)
+
+# Ämnesord per kategori som blandas in i titlar och beskrivningar
+TOPICS = {
+    "Education": ("literacy", "after-school programs", "teacher training", "early childhood education",
+                  "college readiness", "adult education", "digital learning"),
+    "Environment": ("clean water", "air quality", "climate resilience", "wetland restoration",
+                    "recycling", "brownfield cleanup", "renewable energy"),
+    "Health": ("mental health", "substance abuse prevention", "maternal health", "rural hospitals",
+               "chronic disease", "health equity", "telehealth"),
+    "Community": ("affordable housing", "neighborhood revitalization", "food security",
+                  "homelessness prevention", "civic engagement", "refugee integration"),
+    "Technology": ("cybersecurity", "artificial intelligence", "broadband access", "advanced manufacturing",
+                   "quantum research", "workforce development"),
+    "Agriculture": ("soil health", "farmers markets", "crop research", "rural cooperatives", "irrigation"),
+    "Energy": ("grid modernization", "energy efficiency", "solar deployment", "battery storage"),
+    "Transportation": ("public transit", "road safety", "bridge repair", "bicycle infrastructure"),
+    "Law, Justice and Legal Services": ("victim services", "juvenile justice", "legal aid", "reentry programs"),
+    "Arts": ("community arts", "arts education", "museum programs", "folk traditions"),
+    "Business and Commerce": ("small business", "export promotion", "economic development", "innovation hubs"),
+}
+
+TITLE_PREFIXES = ("Community", "Regional", "National", "Rural", "Urban", "Tribal", "Youth", "Statewide")
+TITLE_SUFFIXES = ("Grant", "Program", "Initiative", "Fund", "Partnership", "Challenge", "Cooperative Agreement")
+
+
+def _seed_records():
+    # Importeras här så att modulen kan användas utan indexeringsberoendena
+    from scripts.fetch_and_index_grants import create_demo_data
+
+    return create_demo_data()
+
+
+def generate_grants(n, seed=42, start_date=date(2023, 1, 1), span_days=1095):
+    """
+    Genererar n syntetiska bidrag (en generator, så att stora korpusar inte
+    behöver ligga i minnet)
+
+    Args:
+        n: Antal bidrag
+        seed: Slumpfrö; samma seed ger samma korpus
+        start_date: Tidigaste publiceringsdatum
+        span_days: Antal dagar som publiceringsdatumen sprids över
+
+    Yields:
+        Bidrag som dicts med samma fält som fetch_grants_data()
+    """
+    rng = random.Random(seed)
+    seeds = _seed_records()
+
+    agencies = {}
+    for grant in seeds:
+        agencies[grant['agency']] = (grant['agency'], grant['number'].split('-')[0], grant['category'])
+    for agency in EXTRA_AGENCIES:
+        agencies.setdefault(agency[0], agency)
+    agencies = list(agencies.values())
+
+    sentences = [sentence.strip().rstrip('.') for grant in seeds
+                 for sentence in re.split(r"(?<=\.)\s+", grant['description']) if sentence.strip()]
+    seed_titles = [grant['title'] for grant in seeds]
+
+    for i in range(n):
+        agency, abbreviation, category = rng.choice(agencies)
+        topics = TOPICS.get(category) or TOPICS["Community"]
+        topic = rng.choice(topics)
+
+        if rng.random() < 0.3:
+            title = f"{rng.choice(seed_titles)}: {topic.title()}"
+        else:
+            title = f"{rng.choice(TITLE_PREFIXES)} {topic.title()} {rng.choice(TITLE_SUFFIXES)}"
+
+        description = ". ".join(
+            [f"This {category.lower()} opportunity funds {topic} projects"]
+            + rng.sample(sentences, k=min(len(sentences), rng.randint(1, 3)))
+            + [f"Applicants may also address {rng.choice(topics)}"]
+        ) + "."
+
+        # Belopp: log-normalfördelat maxbelopp, ibland utan minbelopp eller helt utan belopp
+        if rng.random() < 0.05:
+            amount_min, amount_max = 'N/A', 'N/A'
+        else:
+            maximum = int(round(rng.lognormvariate(12.5, 1.2), -3)) or 1000
+            amount_max = str(maximum)
+            amount_min = str(int(round(maximum * rng.uniform(0.05, 0.3), -3))) if rng.random() < 0.8 else 'N/A'
+
+        posted = start_date + timedelta(days=rng.randrange(span_days))
+        deadline = posted + timedelta(days=rng.randint(30, 180))
+        deadline = deadline.isoformat() if rng.random() > 0.05 else 'N/A'
+
+        yield {
+            'id': f"SYN-{i:07d}",
+            'number': f"{abbreviation}-{posted.year}-{i:06d}",
+            'title': title,
+            'description': description,
+            'agency': agency,
+            'amount_min': amount_min,
+            'amount_max': amount_max,
+            'deadline': deadline,
+            'posted_date': posted.isoformat(),
+            'category': category,
+            'url': f"https://www.grants.gov/search-results-detail/SYN-{i:07d}",
+        }
+
+
+def generate_queries(n, seed=42):
+    """
+    Genererar n sökfrågor i samma stil som demo-scenarierna
+    """
+    rng = random.Random(seed)
+    templates = ("funding for {}", "grants for {} programs", "{} projects in rural communities",
+                 "support for {} and {}", "{}")
+    queries = []
+    for _ in range(n):
+        category = rng.choice(list(TOPICS))
+        topics = rng.sample(TOPICS[category], k=2)
+        template = rng.choice(templates)
+        queries.append(template.format(*topics[:template.count("{}")]))
+    return queries
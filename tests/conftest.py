@@ -0,0 +1,9 @@
+"""
+Gemensam uppsättning för testerna: gör paketet scripts (och demo-modulerna
+i roten) importerbara när pytest körs från repots rot
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
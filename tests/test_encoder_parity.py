@@ -0,0 +1,64 @@
+"""
+Paritet mellan TorchEncoder och OnnxEncoder på PARITY_TEXTS
+
+Hoppas över om onnxruntime, torch eller modellen saknas. Modellen kan
+pekas om med GRANTS_TEST_MODEL (modellnamn eller lokal katalog), t.ex. för
+att köra mot en mindre modell utan nätverk.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip("torch")
+pytest.importorskip("transformers")
+pytest.importorskip("onnxruntime")
+
+from scripts.encoder import MODEL_NAME, PARITY_TEXTS, PARITY_THRESHOLD, OnnxEncoder, TorchEncoder
+
+TEST_MODEL = os.environ.get("GRANTS_TEST_MODEL", MODEL_NAME)
+# Grannar per text som jämförs mellan backendarna
+TOP_K = 3
+# Minsta andel gemensamma grannar bland de TOP_K närmaste, i snitt över texterna
+MIN_TOP_K_OVERLAP = 0.9
+
+
+@pytest.fixture(scope="module")
+def reference():
+    encoder = TorchEncoder(TEST_MODEL)
+    try:
+        encoder.warmup()
+    except OSError as e:
+        pytest.skip(f"Modellen {TEST_MODEL} är inte tillgänglig: {e}")
+    return _normalize(encoder.encode(PARITY_TEXTS))
+
+
+@pytest.fixture(scope="module")
+def onnx_dir(tmp_path_factory):
+    return str(tmp_path_factory.mktemp("onnx"))
+
+
+def _normalize(vectors):
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def _neighbours(vectors):
+    # Närmaste grannar per text bland de övriga, efter cosinuslikhet
+    similarity = vectors @ vectors.T
+    np.fill_diagonal(similarity, -np.inf)
+    return np.argsort(-similarity, axis=1, kind="stable")[:, :TOP_K]
+
+
+@pytest.mark.parametrize("quantize", [False, True], ids=["onnx", "onnx-int8"])
+def test_onnx_matches_torch(reference, onnx_dir, quantize):
+    candidate = _normalize(OnnxEncoder(TEST_MODEL, quantize=quantize, onnx_dir=onnx_dir).encode(PARITY_TEXTS))
+
+    similarity = (reference * candidate).sum(axis=1)
+    assert similarity.min() >= PARITY_THRESHOLD, f"min cos {similarity.min():.4f}"
+
+    expected, actual = _neighbours(reference), _neighbours(candidate)
+    overlap = np.mean([len(set(e) & set(a)) / TOP_K for e, a in zip(expected, actual)])
+    assert overlap >= MIN_TOP_K_OVERLAP, f"top-{TOP_K}-överlapp {overlap:.2f}"
+    # Närmaste granne ska vara densamma för varje text
+    assert (expected[:, 0] == actual[:, 0]).all()
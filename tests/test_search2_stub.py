@@ -0,0 +1,94 @@
+"""
+Hämtningen från Grants.gov (fetch_grants_data) mot search2-ersättaren
+
+Ersättaren startas på en ledig port per test; samma kontroller som
+python scripts/search2_stub.py --check.
+"""
+
+import pytest
+
+pytest.importorskip("requests")
+
+from scripts.fetch_and_index_grants import MAX_RETRIES, create_session, fetch_grants_data
+from scripts.search2_stub import DEFAULT_CATEGORIES, expected_grants, make_hits, search, start_stub_server
+
+CATEGORIES = list(DEFAULT_CATEGORIES)
+PER_CATEGORY = 60
+PAGE_SIZE = 7
+MAX_WORKERS = 4
+
+
+@pytest.fixture(scope="module")
+def hits():
+    return make_hits(CATEGORIES, PER_CATEGORY)
+
+
+@pytest.fixture
+def stub(hits):
+    servers = []
+
+    def start(**kwargs):
+        server, url, stats = start_stub_server(hits, **kwargs)
+        servers.append(server)
+        return url, stats
+
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+
+def fetch(url, categories=CATEGORIES):
+    # Kort backoff så att testet går fort; samma omförsök som i produktion
+    session = create_session(pool_size=MAX_WORKERS, backoff_factor=0.01)
+    try:
+        return fetch_grants_data(categories, url, page_size=PAGE_SIZE, max_workers=MAX_WORKERS,
+                                 session=session, fallback_demo=False)
+    finally:
+        session.close()
+
+
+def test_pages_with_start_record_num(hits, stub):
+    # Sidorna blir klara i slumpmässig ordning
+    url, stats = stub(jitter=0.02)
+    fetch(url)
+
+    starts = {}
+    for keyword, _, start, _ in stats["attempts"]:
+        starts.setdefault(keyword, []).append(start)
+    for category in CATEGORIES:
+        # Varje sida hämtas exakt en gång, och inga sidor efter hitCount
+        hit_count = search(hits, {"keyword": category})[1]
+        assert sorted(starts[category]) == list(range(0, hit_count, PAGE_SIZE))
+    assert stats["requests"] == len(stats["attempts"])
+
+
+def test_keeps_order_and_drops_duplicates(hits, stub):
+    url, _ = stub(jitter=0.02)
+    grants = fetch(url)
+
+    expected = expected_grants(hits, CATEGORIES)
+    assert [grant["id"] for grant in grants] == [grant["id"] for grant in expected]
+    assert grants == expected
+    # make_hits ger var tionde träff även under föregående kategoris sökord
+    total_hits = sum(search(hits, {"keyword": category})[1] for category in CATEGORIES)
+    assert len({grant["id"] for grant in grants}) == len(grants) < total_hits
+
+
+def test_retries_on_5xx(hits, stub):
+    # Varje sida svarar 503 en gång innan den lyckas
+    url, stats = stub(fail_first=1)
+    grants = fetch(url)
+
+    pages = len(stats["attempts"])
+    assert grants == expected_grants(hits, CATEGORIES)
+    assert stats["failures"] == pages
+    assert stats["requests"] == 2 * pages
+
+
+def test_skips_category_when_retries_are_exhausted(stub):
+    url, stats = stub(fail_first=MAX_RETRIES + 1)
+    grants = fetch(url, CATEGORIES[:1])
+
+    assert grants == []
+    assert stats["requests"] == MAX_RETRIES + 1
@@ -0,0 +1,102 @@
+"""
+Strömmat och spekulativt svar från search_with_gpt mot OpenAI-ersättaren
+
+Sökningen byts mot fasta träfflistor, så att testet inte kräver ett byggt
+index; ersättarens omskrivning avgör vilken lista den omskrivna frågan får.
+"""
+
+import os
+import re
+
+import pytest
+
+pytest.importorskip("openai")
+
+from scripts.openai_stub import answer_text, rewrite_query, start_stub_server
+
+MESSAGE = "Vi ser ökande behov av insatser för ungas psykiska hälsa"
+
+
+def make_grants(ids):
+    return [{"id": str(grant_id), "title": f"Bidrag {grant_id}", "agency": "Myndighet", "deadline": "2025-06-30",
+             "category": "health", "description": "Stöd till insatser för psykisk hälsa."} for grant_id in ids]
+
+
+@pytest.fixture(scope="module")
+def stub():
+    server, base_url, stats = start_stub_server(latency=0.05, token_delay=0.0)
+    yield base_url, stats
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def assistant(stub, monkeypatch):
+    base_url, stats = stub
+    # demo_openai skapar klienten vid import och avslutar om nyckeln saknas
+    monkeypatch.setenv("OPENAI_API_KEY", os.environ.get("OPENAI_API_KEY", "stub"))
+    monkeypatch.setenv("OPENAI_BASE_URL", base_url)
+    import demo_openai
+    from openai import OpenAI
+
+    monkeypatch.setattr(demo_openai, "client", OpenAI(api_key="stub", base_url=base_url))
+    # Svarscachen skulle kunna svara utan anrop till ersättaren
+    monkeypatch.setattr(demo_openai, "RESPONSE_CACHE_SIZE", 0)
+    with stats["lock"]:
+        stats["requests"] = 0
+    return demo_openai, stats
+
+
+def run(demo_openai, monkeypatch, speculative_ids, rewritten_ids):
+    results = {MESSAGE: make_grants(speculative_ids), rewrite_query(MESSAGE): make_grants(rewritten_ids)}
+    searched = []
+
+    def fake_query_grants(query, k=5, verbose=True):
+        searched.append(query)
+        return results[query]
+
+    monkeypatch.setattr(demo_openai, "query_grants", fake_query_grants)
+    tokens = []
+    answer, used, history = demo_openai.search_with_gpt(MESSAGE, on_token=tokens.append, speculative=True)
+    # Först det råa meddelandet (spekulativt), sedan den omskrivna frågan
+    assert searched == [MESSAGE, rewrite_query(MESSAGE)]
+    return answer, used, history, tokens
+
+
+def assert_streamed_in_order(answer, used, tokens):
+    # Ersättaren skickar en SSE-händelse per ord; on_token får dem i samma ordning
+    assert answer == answer_text("\n".join(f"Titel: {grant['title']}" for grant in used))
+    assert tokens == re.findall(r"\S+\s*|\s+", answer)
+    assert "".join(tokens) == answer
+
+
+def test_reuses_speculative_answer_when_results_overlap(assistant, monkeypatch):
+    demo_openai, stats = assistant
+    # 3 av 5 gemensamma: överlapp 0.6, precis på gränsen
+    speculative_ids, rewritten_ids = [1, 2, 3, 4, 5], [1, 2, 3, 8, 9]
+    assert demo_openai.results_overlap(make_grants(speculative_ids),
+                                       make_grants(rewritten_ids)) >= demo_openai.SPECULATIVE_MIN_OVERLAP
+
+    answer, used, history, tokens = run(demo_openai, monkeypatch, speculative_ids, rewritten_ids)
+
+    assert [grant["id"] for grant in used] == [str(grant_id) for grant_id in speculative_ids]
+    assert_streamed_in_order(answer, used, tokens)
+    assert history[-1] == {"role": "assistant", "content": answer}
+    # Omskrivning + det spekulativa svaret; inget nytt svar startades
+    assert stats["requests"] == 2
+
+
+def test_restarts_answer_when_results_differ(assistant, monkeypatch):
+    demo_openai, stats = assistant
+    # 2 av 5 gemensamma: överlapp 0.4
+    speculative_ids, rewritten_ids = [1, 2, 3, 4, 5], [1, 2, 7, 8, 9]
+    assert demo_openai.results_overlap(make_grants(speculative_ids),
+                                       make_grants(rewritten_ids)) < demo_openai.SPECULATIVE_MIN_OVERLAP
+
+    answer, used, history, tokens = run(demo_openai, monkeypatch, speculative_ids, rewritten_ids)
+
+    assert [grant["id"] for grant in used] == [str(grant_id) for grant_id in rewritten_ids]
+    # Bara det nya svaret strömmas; det spekulativa avbryts utan att nå on_token
+    assert_streamed_in_order(answer, used, tokens)
+    assert "Bidrag 4" not in answer
+    assert stats["requests"] == 3